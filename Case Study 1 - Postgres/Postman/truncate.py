@@ -37,7 +37,7 @@ def truncate_all_tables():
     cursor = None
     # Order for TRUNCATE ... CASCADE doesn't strictly matter for listed tables,
     # but good to be mindful if there were more complex, non-cascading dependencies.
-    tables_to_truncate = ['reservations', 'customers', 'tables']
+    tables_to_truncate = ['reservations', 'reservations_archive', 'customers', 'tables', 'occupancy_daily', 'idempotency_keys']
 
     try:
         print(f"Connecting to database: {DATABASE_CONFIG['dbname']} on {DATABASE_CONFIG['host']}...")
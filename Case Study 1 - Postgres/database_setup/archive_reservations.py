@@ -0,0 +1,92 @@
+import argparse
+import os
+import time
+from datetime import date, timedelta
+
+import psycopg2
+from dotenv import load_dotenv
+
+# --- Explicitly load .env from one directory up ---
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+dotenv_path = os.path.join(current_script_dir, '..', '.env')
+load_dotenv(dotenv_path=dotenv_path)
+# --- End of explicit loading ---
+
+# Database connection information
+DATABASE_CONFIG = {
+    'dbname': os.getenv('DB_NAME'),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'host': os.getenv('DB_HOST'),
+    'port': os.getenv('DB_PORT')
+}
+
+def check_db_config():
+    missing = [k for k, v in DATABASE_CONFIG.items() if not v]
+    if missing:
+        print(f"Error: Missing database configuration values in .env or environment: {', '.join(missing)}")
+        print("Please ensure DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT are set in your .env file.")
+        return False
+    return True
+
+def archive_once(conn, older_than_days, batch_size, pause):
+    # Moves every archivable reservation in batches, committing after each one so that
+    # locks stay short and autovacuum can reclaim the deleted rows while we go
+    cutoff = date.today() - timedelta(days=older_than_days)
+    cursor = conn.cursor()
+    total = 0
+    try:
+        while True:
+            cursor.execute("SELECT archive_reservations(%s, %s);", (cutoff, batch_size))
+            moved = cursor.fetchone()[0]
+            conn.commit()
+            total += moved
+            if moved < batch_size:
+                break
+            print(f"  archived {total} reservations so far...")
+            if pause:
+                time.sleep(pause)
+    finally:
+        cursor.close()
+    print(f"Archived {total} cancelled or completed reservations dated before {cutoff}.")
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move old cancelled and completed reservations into reservations_archive.")
+    parser.add_argument('--older-than-days', type=int, default=90,
+                        help="Archive reservations dated more than this many days ago (default: 90)")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Rows moved per transaction (default: 5000)")
+    parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches (default: 0)")
+    parser.add_argument('--interval', type=float,
+                        help="Keep running in the background and archive again every this many seconds")
+    args = parser.parse_args()
+
+    if not check_db_config():
+        return
+
+    conn = None
+    try:
+        print(f"Connecting to database: {DATABASE_CONFIG['dbname']} on {DATABASE_CONFIG['host']}...")
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        while True:
+            archive_once(conn, args.older_than_days, args.batch_size, args.pause)
+            if args.interval is None:
+                break
+            time.sleep(args.interval)
+    except psycopg2.OperationalError as e:
+        print(f"Database connection error: {e}")
+        print("Please check your database server and connection settings in .env.")
+    except psycopg2.Error as e:
+        print(f"Database error during archiving: {e}")
+        if conn:
+            conn.rollback()
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        if conn:
+            conn.close()
+        print("Database connection closed.")
+
+if __name__ == "__main__":
+    main()
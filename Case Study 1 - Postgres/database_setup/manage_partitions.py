@@ -0,0 +1,286 @@
+import argparse
+import os
+import re
+from datetime import date
+
+import psycopg2
+from psycopg2 import sql
+from dotenv import load_dotenv
+
+# --- Explicitly load .env from one directory up ---
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+dotenv_path = os.path.join(current_script_dir, '..', '.env')
+load_dotenv(dotenv_path=dotenv_path)
+# --- End of explicit loading ---
+
+# Database connection information
+DATABASE_CONFIG = {
+    'dbname': os.getenv('DB_NAME'),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'host': os.getenv('DB_HOST'),
+    'port': os.getenv('DB_PORT')
+}
+
+MONTHLY_PARTITION = re.compile(r'^reservations_(\d{4})_(\d{2})$')
+ARCHIVE_SCHEMA = 'archive'
+MIGRATION_FILE = os.path.join(current_script_dir, 'migrate_partitioned_reservations.sql')
+# Maintenance DDL waits at most this long for a lock instead of queueing application queries behind it
+LOCK_TIMEOUT = '5s'
+
+# Final step of the online migration: runs with reservations locked, touches only the catalog
+SWAP_SQL = """
+LOCK TABLE reservations IN ACCESS EXCLUSIVE MODE;
+DROP TRIGGER trigger_reservations_mirror ON reservations;
+DROP TRIGGER IF EXISTS trigger_occupancy_daily_insert ON reservations;
+DROP TRIGGER IF EXISTS trigger_occupancy_daily_update ON reservations;
+DROP TRIGGER IF EXISTS trigger_occupancy_daily_delete ON reservations;
+DROP TRIGGER IF EXISTS trigger_reservations_updated_at ON reservations;
+DROP TRIGGER IF EXISTS trigger_reservations_month_overlap ON reservations;
+DROP TRIGGER IF EXISTS trigger_bookings_notify_insert ON reservations;
+DROP TRIGGER IF EXISTS trigger_bookings_notify_update ON reservations;
+DROP TRIGGER IF EXISTS trigger_bookings_notify_delete ON reservations;
+
+ALTER TABLE reservations RENAME TO reservations_unpartitioned;
+ALTER TABLE reservations_unpartitioned ALTER COLUMN rid DROP DEFAULT;
+ALTER TABLE reservations_unpartitioned RENAME CONSTRAINT reservations_pkey TO reservations_unpartitioned_pkey;
+ALTER INDEX IF EXISTS idx_reservations_date RENAME TO idx_reservations_unpartitioned_date;
+ALTER INDEX IF EXISTS idx_reservations_date_rid RENAME TO idx_reservations_unpartitioned_date_rid;
+ALTER INDEX IF EXISTS idx_reservations_table_id_date RENAME TO idx_reservations_unpartitioned_table_id_date;
+ALTER INDEX IF EXISTS idx_reservations_active_date RENAME TO idx_reservations_unpartitioned_active_date;
+ALTER INDEX IF EXISTS idx_reservations_archivable_date RENAME TO idx_reservations_unpartitioned_archivable_date;
+
+ALTER TABLE reservations_partitioned RENAME TO reservations;
+ALTER TABLE reservations RENAME CONSTRAINT reservations_partitioned_pkey TO reservations_pkey;
+ALTER INDEX idx_reservations_partitioned_date_rid RENAME TO idx_reservations_date_rid;
+ALTER INDEX idx_reservations_partitioned_table_id_date RENAME TO idx_reservations_table_id_date;
+ALTER INDEX IF EXISTS idx_reservations_partitioned_active_date RENAME TO idx_reservations_active_date;
+ALTER INDEX IF EXISTS idx_reservations_partitioned_archivable_date RENAME TO idx_reservations_archivable_date;
+ALTER SEQUENCE reservations_rid_seq OWNED BY reservations.rid;
+
+CREATE TRIGGER trigger_reservations_month_overlap
+BEFORE INSERT OR UPDATE ON reservations
+FOR EACH ROW
+EXECUTE FUNCTION reservations_check_month_overlap();
+
+CREATE TRIGGER trigger_reservations_updated_at
+BEFORE UPDATE ON reservations
+FOR EACH ROW
+EXECUTE FUNCTION update_reservations_updated_at_column();
+
+CREATE TRIGGER trigger_occupancy_daily_insert
+AFTER INSERT ON reservations
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION occupancy_daily_apply_changes();
+
+CREATE TRIGGER trigger_occupancy_daily_update
+AFTER UPDATE ON reservations
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION occupancy_daily_apply_changes();
+
+CREATE TRIGGER trigger_occupancy_daily_delete
+AFTER DELETE ON reservations
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION occupancy_daily_apply_changes();
+"""
+
+# Only if migrate_booking_notifications.sql (or a newer script.sql) has been applied
+SWAP_BOOKING_NOTIFICATIONS_SQL = """
+CREATE TRIGGER trigger_bookings_notify_insert
+AFTER INSERT ON reservations
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION reservations_notify_bookings();
+
+CREATE TRIGGER trigger_bookings_notify_update
+AFTER UPDATE ON reservations
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION reservations_notify_bookings();
+
+CREATE TRIGGER trigger_bookings_notify_delete
+AFTER DELETE ON reservations
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION reservations_notify_bookings();
+"""
+
+COPY_BATCH_SQL = """
+INSERT INTO reservations_partitioned (rid, tid, cid, status, comment, number_of_people, reservation_date,
+                                      reservation_time, duration_minutes, created_at, updated_at)
+SELECT rid, tid, cid, status, comment, number_of_people, reservation_date,
+       reservation_time, duration_minutes, created_at, updated_at
+FROM reservations
+WHERE rid >= %s AND rid < %s
+FOR SHARE
+ON CONFLICT (rid, reservation_date) DO NOTHING
+"""
+
+def check_db_config():
+    missing = [k for k, v in DATABASE_CONFIG.items() if not v]
+    if missing:
+        print(f"Error: Missing database configuration values in .env or environment: {', '.join(missing)}")
+        print("Please ensure DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT are set in your .env file.")
+        return False
+    return True
+
+def add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def monthly_partitions(cursor, parent='reservations'):
+    # (month start, partition name) of the monthly partitions, oldest first
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (parent,))
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = MONTHLY_PARTITION.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'reservations'::regclass")
+    return cursor.fetchone()[0] == 'p'
+
+def maintain(conn, months_ahead, retain_months=None, drop=False):
+    cursor = conn.cursor()
+    if not is_partitioned(cursor):
+        print("reservations is not partitioned yet; run 'manage_partitions.py migrate' first.")
+        return
+    cursor.execute(sql.SQL("SET lock_timeout = {}").format(sql.Literal(LOCK_TIMEOUT)))
+
+    # Future months first, so bookings never have to fall back to the default partition
+    this_month = date.today().replace(day=1)
+    for offset in range(-1, months_ahead + 1):
+        cursor.execute("SELECT create_reservation_partition(%s)", (add_months(this_month, offset),))
+        created = cursor.fetchone()[0]
+        conn.commit()
+        if created:
+            print(f"Created partition {created}")
+
+    # Months that only have rows in the default partition get their own partition too
+    cursor.execute("SELECT DISTINCT date_trunc('month', reservation_date)::date FROM reservations_default ORDER BY 1")
+    for (month,) in cursor.fetchall():
+        cursor.execute("SELECT create_reservation_partition(%s)", (month,))
+        print(f"Created partition {cursor.fetchone()[0]} for rows in reservations_default")
+        conn.commit()
+
+    if retain_months is None:
+        return
+    cutoff = add_months(this_month, -retain_months)
+    old_partitions = [name for month, name in monthly_partitions(cursor) if add_months(month, 1) <= cutoff]
+    if old_partitions and not drop:
+        cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(ARCHIVE_SCHEMA)))
+    for name in old_partitions:
+        # Detaching keeps occupancy_daily as it is, so historical occupancy stays available
+        cursor.execute(sql.SQL("ALTER TABLE reservations DETACH PARTITION {}").format(sql.Identifier(name)))
+        if drop:
+            cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+            print(f"Detached and dropped {name}")
+        else:
+            cursor.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(sql.Identifier(name), sql.Identifier(ARCHIVE_SCHEMA)))
+            print(f"Detached {name} and moved it to schema {ARCHIVE_SCHEMA}")
+        conn.commit()
+
+def migrate(conn, batch_size):
+    cursor = conn.cursor()
+    if is_partitioned(cursor):
+        print("reservations is already partitioned.")
+        return
+
+    cursor.execute("SELECT to_regclass('reservations_partitioned') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        print("Creating reservations_partitioned and the mirror trigger...")
+        with open(MIGRATION_FILE) as f:
+            cursor.execute(f.read())
+        conn.commit()
+    else:
+        print("Resuming: reservations_partitioned already exists.")
+
+    # Rows written from now on are mirrored by the trigger; copy the ones that existed before.
+    # FOR SHARE makes a concurrent update of a row wait for (or be seen by) the batch copying it.
+    cursor.execute("SELECT COALESCE(MIN(rid), 0), COALESCE(MAX(rid), 0) FROM reservations")
+    first_rid, last_rid = cursor.fetchone()
+    conn.commit()
+    copied = 0
+    for start in range(first_rid, last_rid + 1, batch_size):
+        cursor.execute(COPY_BATCH_SQL, (start, start + batch_size))
+        copied += cursor.rowcount
+        conn.commit()
+        print(f"  copied rid {start}..{min(start + batch_size, last_rid + 1) - 1} ({copied} rows)")
+
+    print("Swapping tables...")
+    cursor.execute(sql.SQL("SET lock_timeout = {}").format(sql.Literal(LOCK_TIMEOUT)))
+    cursor.execute(SWAP_SQL)
+    cursor.execute("SELECT to_regproc('reservations_notify_bookings') IS NOT NULL")
+    if cursor.fetchone()[0]:
+        cursor.execute(SWAP_BOOKING_NOTIFICATIONS_SQL)
+    conn.commit()
+    cursor.execute("ANALYZE reservations")
+    conn.commit()
+    print("reservations is now partitioned by month. The old table is kept as reservations_unpartitioned;")
+    print("drop it once you have checked the new one: DROP TABLE reservations_unpartitioned;")
+
+def show_status(conn):
+    cursor = conn.cursor()
+    if not is_partitioned(cursor):
+        print("reservations is not partitioned.")
+        return
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), GREATEST(c.reltuples, 0)::bigint
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'reservations'::regclass
+        ORDER BY c.relname
+    """)
+    for name, bounds, rows in cursor.fetchall():
+        print(f"{name:<24} {bounds:<60} ~{rows} rows")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the monthly partitions of the reservations table.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    maintain_parser = commands.add_parser('maintain', help="Create upcoming partitions and detach old ones")
+    maintain_parser.add_argument('--months-ahead', type=int, default=12,
+                                 help="Months after the current one to create partitions for (default: 12)")
+    maintain_parser.add_argument('--retain-months', type=int,
+                                 help="Detach partitions that ended more than this many months ago (default: keep all)")
+    maintain_parser.add_argument('--drop', action='store_true',
+                                 help=f"Drop detached partitions instead of moving them to the '{ARCHIVE_SCHEMA}' schema")
+    migrate_parser = commands.add_parser('migrate', help="Convert an unpartitioned reservations table while it stays in use")
+    migrate_parser.add_argument('--batch-size', type=int, default=10000, help="Rows copied per transaction (default: 10000)")
+    commands.add_parser('status', help="List the partitions of reservations")
+    args = parser.parse_args()
+
+    if not check_db_config():
+        return
+
+    conn = None
+    try:
+        print(f"Connecting to database: {DATABASE_CONFIG['dbname']} on {DATABASE_CONFIG['host']}...")
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        if args.command == 'maintain':
+            maintain(conn, args.months_ahead, args.retain_months, args.drop)
+        elif args.command == 'migrate':
+            migrate(conn, args.batch_size)
+        else:
+            show_status(conn)
+    except psycopg2.OperationalError as e:
+        print(f"Database error: {e}")
+        if conn:
+            conn.rollback()
+    except psycopg2.Error as e:
+        print(f"Database error during partition maintenance: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            conn.close()
+        print("Database connection closed.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+-- Adds the 'bookings_changed' notifications used by the table allocator (POST
+-- /api/v1/reservations/allocate) to a database created with an older script.sql:
+--     psql -U postgres -d reservations_db -f migrate_booking_notifications.sql
+-- Without them the allocator still works, but reloads a day's bookings at least every
+-- ALLOCATION_INDEX_TTL seconds and retries when it picks a table booked in the meantime.
+
+BEGIN;
+
+-- Tells the table allocator of every API worker (src/table_allocator.py) which days have
+-- different active bookings now. Unlike 'occupancy_changed' this also fires when a booking
+-- only moves to another time or table.
+CREATE OR REPLACE FUNCTION reservations_notify_bookings()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed_dates TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT string_agg(DISTINCT reservation_date::text, ',') INTO changed_dates
+        FROM new_rows WHERE status = 'active';
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT string_agg(DISTINCT reservation_date::text, ',') INTO changed_dates
+        FROM old_rows WHERE status = 'active';
+    ELSE
+        SELECT string_agg(DISTINCT reservation_date::text, ',') INTO changed_dates
+        FROM (
+            SELECT reservation_date FROM new_rows WHERE status = 'active'
+            UNION ALL
+            SELECT reservation_date FROM old_rows WHERE status = 'active'
+        ) AS changes;
+    END IF;
+
+    IF changed_dates IS NOT NULL THEN
+        PERFORM pg_notify('bookings_changed', CASE WHEN length(changed_dates) > 7900 THEN '*' ELSE changed_dates END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_bookings_notify_insert ON reservations;
+CREATE TRIGGER trigger_bookings_notify_insert
+AFTER INSERT ON reservations
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION reservations_notify_bookings();
+
+DROP TRIGGER IF EXISTS trigger_bookings_notify_update ON reservations;
+CREATE TRIGGER trigger_bookings_notify_update
+AFTER UPDATE ON reservations
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION reservations_notify_bookings();
+
+DROP TRIGGER IF EXISTS trigger_bookings_notify_delete ON reservations;
+CREATE TRIGGER trigger_bookings_notify_delete
+AFTER DELETE ON reservations
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION reservations_notify_bookings();
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- Adds the idempotency_keys table used by POST /api/v1/reservations to a database created
+-- with an older script.sql:
+--     psql -U postgres -d reservations_db -f migrate_idempotency_keys.sql
+
+-- Responses of POST /api/v1/reservations requests sent with an Idempotency-Key header, replayed
+-- when a client retries with the same key. request_hash is the SHA-256 of the JSON body.
+-- app.py removes expired keys as it claims new ones.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idempotency_key VARCHAR(255) PRIMARY KEY,
+    request_hash BYTEA NOT NULL,
+    status_code SMALLINT,
+    response JSONB,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
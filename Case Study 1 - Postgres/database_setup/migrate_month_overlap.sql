@@ -0,0 +1,59 @@
+-- Adds the check of bookings that run past midnight into the next month to a database whose
+-- reservations table was partitioned by an older script.sql or manage_partitions.py migrate:
+--     psql -U postgres -d reservations_db -f migrate_month_overlap.sql
+-- Without it, the per-month overlap constraints let such a booking clash with one early on the
+-- first day of the next month. Existing clashes are not looked for; new and changed bookings are checked.
+
+BEGIN;
+
+-- The overlap constraints only see their own month. A booking that runs into the next month,
+-- or one on the first day of a month that such a booking may reach, is checked here against
+-- the neighbouring month. Locking the table's row makes concurrent checks for that table take
+-- turns. Bookings last at most a day (MAX_DURATION_MINUTES in src/table_allocator.py), so only
+-- the day before and the days the booking covers can clash.
+CREATE OR REPLACE FUNCTION reservations_check_month_overlap()
+RETURNS TRIGGER AS $$
+DECLARE
+    -- reservation_period is generated after BEFORE triggers run
+    period TSRANGE := tsrange(NEW.reservation_date + NEW.reservation_time,
+                              NEW.reservation_date + NEW.reservation_time + NEW.duration_minutes * interval '1 minute');
+    month_start DATE := date_trunc('month', NEW.reservation_date)::date;
+    clash RECORD;
+BEGIN
+    IF NEW.status <> 'active' THEN
+        RETURN NEW;
+    END IF;
+    IF upper(period) <= month_start + interval '1 month' AND NEW.reservation_date <> month_start THEN
+        RETURN NEW;
+    END IF;
+    IF TG_OP = 'UPDATE' AND OLD.status = 'active' AND OLD.tid = NEW.tid AND OLD.reservation_date = NEW.reservation_date
+       AND OLD.reservation_time = NEW.reservation_time AND OLD.duration_minutes = NEW.duration_minutes THEN
+        RETURN NEW;
+    END IF;
+
+    PERFORM 1 FROM tables WHERE tid = NEW.tid FOR UPDATE;
+    SELECT rid, reservation_period INTO clash
+    FROM reservations
+    WHERE tid = NEW.tid
+      AND status = 'active'
+      AND rid <> NEW.rid
+      AND reservation_date BETWEEN NEW.reservation_date - 1 AND upper(period)::date
+      AND date_trunc('month', reservation_date) <> month_start
+      AND reservation_period && period
+    LIMIT 1;
+    IF FOUND THEN
+        RAISE EXCEPTION 'conflicting key value violates exclusion constraint "reservations_no_overlap"'
+            USING ERRCODE = 'exclusion_violation', CONSTRAINT = 'reservations_no_overlap',
+                  DETAIL = format('Table %s is booked for %s by reservation %s.', NEW.tid, clash.reservation_period, clash.rid);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_reservations_month_overlap ON reservations;
+CREATE TRIGGER trigger_reservations_month_overlap
+BEFORE INSERT OR UPDATE ON reservations
+FOR EACH ROW
+EXECUTE FUNCTION reservations_check_month_overlap();
+
+COMMIT;
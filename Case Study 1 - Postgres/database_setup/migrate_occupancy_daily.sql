@@ -0,0 +1,124 @@
+-- Adds the occupancy_daily rollup (table, triggers, rebuild function) to a database
+-- created with an older script.sql and fills it from the existing reservations.
+-- Safe to re-run to pick up a newer version of the trigger functions.
+-- Run: psql -U postgres -d reservations_db -f migrate_occupancy_daily.sql
+
+BEGIN;
+
+-- Daily occupancy rollup, kept current by statement-level triggers on reservations.
+-- Only active reservations count. Rebuild it with SELECT rebuild_occupancy_daily();
+-- (or database_setup/rebuild_occupancy.py) if it ever drifts, e.g. after TRUNCATE reservations.
+CREATE TABLE IF NOT EXISTS occupancy_daily (
+    reservation_date DATE PRIMARY KEY,
+    people INTEGER NOT NULL DEFAULT 0,
+    reservations INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION occupancy_daily_apply_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed_dates TEXT;
+BEGIN
+    -- Transition tables hold all rows touched by the statement, so a bulk COPY
+    -- costs one upsert per affected day instead of one per row.
+    -- ORDER BY keeps the row lock order stable across concurrent statements.
+    IF TG_OP = 'INSERT' THEN
+        WITH changed AS (
+            INSERT INTO occupancy_daily (reservation_date, people, reservations)
+            SELECT reservation_date, SUM(number_of_people), COUNT(*)
+            FROM new_rows
+            WHERE status = 'active'
+            GROUP BY reservation_date
+            ORDER BY reservation_date
+            ON CONFLICT (reservation_date) DO UPDATE
+                SET people = occupancy_daily.people + EXCLUDED.people,
+                    reservations = occupancy_daily.reservations + EXCLUDED.reservations
+            RETURNING reservation_date
+        )
+        SELECT string_agg(reservation_date::text, ',') INTO changed_dates FROM changed;
+    ELSIF TG_OP = 'DELETE' THEN
+        WITH changed AS (
+            INSERT INTO occupancy_daily (reservation_date, people, reservations)
+            SELECT reservation_date, -SUM(number_of_people), -COUNT(*)
+            FROM old_rows
+            WHERE status = 'active'
+            GROUP BY reservation_date
+            ORDER BY reservation_date
+            ON CONFLICT (reservation_date) DO UPDATE
+                SET people = occupancy_daily.people + EXCLUDED.people,
+                    reservations = occupancy_daily.reservations + EXCLUDED.reservations
+            RETURNING reservation_date
+        )
+        SELECT string_agg(reservation_date::text, ',') INTO changed_dates FROM changed;
+    ELSE
+        WITH changed AS (
+            INSERT INTO occupancy_daily (reservation_date, people, reservations)
+            SELECT reservation_date, SUM(people), SUM(delta)
+            FROM (
+                SELECT reservation_date, number_of_people AS people, 1 AS delta FROM new_rows WHERE status = 'active'
+                UNION ALL
+                SELECT reservation_date, -number_of_people, -1 FROM old_rows WHERE status = 'active'
+            ) AS changes
+            GROUP BY reservation_date
+            HAVING SUM(people) <> 0 OR SUM(delta) <> 0
+            ORDER BY reservation_date
+            ON CONFLICT (reservation_date) DO UPDATE
+                SET people = occupancy_daily.people + EXCLUDED.people,
+                    reservations = occupancy_daily.reservations + EXCLUDED.reservations
+            RETURNING reservation_date
+        )
+        SELECT string_agg(reservation_date::text, ',') INTO changed_dates FROM changed;
+    END IF;
+
+    -- Tell every API worker which cached occupancy days are stale (delivered on commit).
+    -- NOTIFY payloads are limited to 8000 bytes; '*' invalidates everything.
+    IF changed_dates IS NOT NULL THEN
+        PERFORM pg_notify('occupancy_changed', CASE WHEN length(changed_dates) > 7900 THEN '*' ELSE changed_dates END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_occupancy_daily_insert ON reservations;
+CREATE TRIGGER trigger_occupancy_daily_insert
+AFTER INSERT ON reservations
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION occupancy_daily_apply_changes();
+
+DROP TRIGGER IF EXISTS trigger_occupancy_daily_update ON reservations;
+CREATE TRIGGER trigger_occupancy_daily_update
+AFTER UPDATE ON reservations
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION occupancy_daily_apply_changes();
+
+DROP TRIGGER IF EXISTS trigger_occupancy_daily_delete ON reservations;
+CREATE TRIGGER trigger_occupancy_daily_delete
+AFTER DELETE ON reservations
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION occupancy_daily_apply_changes();
+
+-- Recomputes the rollup from scratch. Blocks reservation writes while it runs.
+CREATE OR REPLACE FUNCTION rebuild_occupancy_daily()
+RETURNS INTEGER AS $$
+DECLARE
+    days INTEGER;
+BEGIN
+    LOCK TABLE reservations IN SHARE MODE;
+    DELETE FROM occupancy_daily;
+    INSERT INTO occupancy_daily (reservation_date, people, reservations)
+    SELECT reservation_date, SUM(number_of_people), COUNT(*)
+    FROM reservations
+    WHERE status = 'active'
+    GROUP BY reservation_date;
+    GET DIAGNOSTICS days = ROW_COUNT;
+    PERFORM pg_notify('occupancy_changed', '*');
+    RETURN days;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_occupancy_daily();
+
+COMMIT;
@@ -0,0 +1,172 @@
+-- First step of moving an unpartitioned reservations table (older script.sql) to monthly
+-- partitions without downtime. Run it through the maintenance script, which also copies
+-- the existing rows over in batches and then swaps the tables in one short transaction:
+--     python database_setup/manage_partitions.py migrate
+--
+-- This file creates reservations_partitioned with a partition for every month that has
+-- reservations (plus the next twelve), and a trigger that mirrors every write on
+-- reservations into it while the copy runs. Nothing changes for the application yet.
+-- Requires the btree_gist extension (see migrate_reservation_periods.sql).
+
+BEGIN;
+
+-- Blocks reservation writes for the few moments this transaction takes. Locking reservations
+-- first keeps the lock order of the foreign keys below (customers, tables) the same as the
+-- application's, which writes reservations and customers in one statement.
+LOCK TABLE reservations IN SHARE ROW EXCLUSIVE MODE;
+
+-- Creates the monthly partition of `p_parent` containing p_month, with its overlap constraint,
+-- and moves that month's rows out of the default partition. Returns NULL if it already exists.
+-- database_setup/manage_partitions.py calls this to keep future months created ahead of time.
+CREATE OR REPLACE FUNCTION create_reservation_partition(p_month DATE, p_parent TEXT DEFAULT 'reservations')
+RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_month)::date;
+    month_end DATE := (date_trunc('month', p_month) + interval '1 month')::date;
+    suffix TEXT := to_char(p_month, 'YYYY_MM');
+    partition_name TEXT := 'reservations_' || suffix;
+    columns TEXT := 'rid, tid, cid, status, comment, number_of_people, reservation_date, reservation_time, '
+                    'duration_minutes, created_at, updated_at';
+    default_partition TEXT;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT c.relname INTO default_partition
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = p_parent::regclass AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT';
+    IF default_partition IS NOT NULL THEN
+        -- Writing to the partitions directly bypasses the occupancy triggers on the parent,
+        -- which is right: the rows only change place
+        EXECUTE format('CREATE TEMP TABLE moved_reservations AS SELECT %s FROM %I WHERE reservation_date >= %L AND reservation_date < %L',
+                       columns, default_partition, month_start, month_end);
+        EXECUTE format('DELETE FROM %I WHERE reservation_date >= %L AND reservation_date < %L',
+                       default_partition, month_start, month_end);
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, p_parent, month_start, month_end);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I EXCLUDE USING gist (tid WITH =, reservation_period WITH &&) WHERE (status = %L)',
+                   partition_name, 'reservations_no_overlap_' || suffix, 'active');
+
+    IF default_partition IS NOT NULL THEN
+        EXECUTE format('INSERT INTO %I (%s) SELECT %s FROM moved_reservations', partition_name, columns, columns);
+        DROP TABLE moved_reservations;
+    END IF;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- The overlap constraints only see their own month. A booking that runs into the next month,
+-- or one on the first day of a month that such a booking may reach, is checked here against
+-- the neighbouring month. Locking the table's row makes concurrent checks for that table take
+-- turns. Bookings last at most a day (MAX_DURATION_MINUTES in src/table_allocator.py), so only
+-- the day before and the days the booking covers can clash.
+CREATE OR REPLACE FUNCTION reservations_check_month_overlap()
+RETURNS TRIGGER AS $$
+DECLARE
+    -- reservation_period is generated after BEFORE triggers run
+    period TSRANGE := tsrange(NEW.reservation_date + NEW.reservation_time,
+                              NEW.reservation_date + NEW.reservation_time + NEW.duration_minutes * interval '1 minute');
+    month_start DATE := date_trunc('month', NEW.reservation_date)::date;
+    clash RECORD;
+BEGIN
+    IF NEW.status <> 'active' THEN
+        RETURN NEW;
+    END IF;
+    IF upper(period) <= month_start + interval '1 month' AND NEW.reservation_date <> month_start THEN
+        RETURN NEW;
+    END IF;
+    IF TG_OP = 'UPDATE' AND OLD.status = 'active' AND OLD.tid = NEW.tid AND OLD.reservation_date = NEW.reservation_date
+       AND OLD.reservation_time = NEW.reservation_time AND OLD.duration_minutes = NEW.duration_minutes THEN
+        RETURN NEW;
+    END IF;
+
+    PERFORM 1 FROM tables WHERE tid = NEW.tid FOR UPDATE;
+    SELECT rid, reservation_period INTO clash
+    FROM reservations
+    WHERE tid = NEW.tid
+      AND status = 'active'
+      AND rid <> NEW.rid
+      AND reservation_date BETWEEN NEW.reservation_date - 1 AND upper(period)::date
+      AND date_trunc('month', reservation_date) <> month_start
+      AND reservation_period && period
+    LIMIT 1;
+    IF FOUND THEN
+        RAISE EXCEPTION 'conflicting key value violates exclusion constraint "reservations_no_overlap"'
+            USING ERRCODE = 'exclusion_violation', CONSTRAINT = 'reservations_no_overlap',
+                  DETAIL = format('Table %s is booked for %s by reservation %s.', NEW.tid, clash.reservation_period, clash.rid);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+-- manage_partitions.py attaches it to the partitioned table when it swaps the tables.
+
+-- Same definition as reservations in script.sql. Constraint and index names that must be
+-- unique per schema get their final names when manage_partitions.py swaps the tables.
+CREATE TABLE reservations_partitioned (
+    rid INTEGER NOT NULL DEFAULT nextval('reservations_rid_seq'),
+    tid INTEGER NOT NULL,
+    cid INTEGER NOT NULL,
+    status VARCHAR(50) DEFAULT 'active' NOT NULL,
+    comment TEXT,
+    number_of_people INTEGER NOT NULL,
+    reservation_date DATE NOT NULL,
+    reservation_time TIME NOT NULL,
+    duration_minutes INTEGER DEFAULT 120 NOT NULL,
+    reservation_period TSRANGE GENERATED ALWAYS AS (
+        tsrange(reservation_date + reservation_time,
+                reservation_date + reservation_time + duration_minutes * interval '1 minute')
+    ) STORED,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT reservations_partitioned_pkey PRIMARY KEY (rid, reservation_date),
+    CONSTRAINT reservations_tid_fkey FOREIGN KEY (tid) REFERENCES tables(tid) ON DELETE CASCADE,
+    CONSTRAINT reservations_cid_fkey FOREIGN KEY (cid) REFERENCES customers(cid) ON DELETE CASCADE,
+    CONSTRAINT reservations_status_check CHECK (status IN ('active', 'cancelled', 'completed')),
+    CONSTRAINT reservations_duration_minutes_check CHECK (duration_minutes > 0)
+) PARTITION BY RANGE (reservation_date);
+
+CREATE TABLE reservations_default PARTITION OF reservations_partitioned DEFAULT;
+ALTER TABLE reservations_default ADD CONSTRAINT reservations_no_overlap_default
+    EXCLUDE USING gist (tid WITH =, reservation_period WITH &&) WHERE (status = 'active');
+
+CREATE INDEX idx_reservations_partitioned_date_rid ON reservations_partitioned(reservation_date, rid);
+CREATE INDEX idx_reservations_partitioned_table_id_date ON reservations_partitioned(tid, reservation_date);
+CREATE INDEX idx_reservations_partitioned_active_date ON reservations_partitioned(reservation_date)
+    INCLUDE (number_of_people) WHERE status = 'active';
+CREATE INDEX idx_reservations_partitioned_archivable_date ON reservations_partitioned(reservation_date)
+    WHERE status IN ('cancelled', 'completed');
+
+SELECT create_reservation_partition(month::date, 'reservations_partitioned')
+FROM generate_series(
+    date_trunc('month', LEAST((SELECT MIN(reservation_date) FROM reservations), current_date)),
+    date_trunc('month', GREATEST((SELECT MAX(reservation_date) FROM reservations), current_date)) + interval '12 months',
+    interval '1 month'
+) AS month;
+
+-- Keeps reservations_partitioned in step with reservations until the swap.
+-- An update is mirrored as delete + insert, since it may move the row to another month.
+CREATE OR REPLACE FUNCTION reservations_mirror_to_partitioned()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM reservations_partitioned WHERE rid = OLD.rid AND reservation_date = OLD.reservation_date;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO reservations_partitioned (rid, tid, cid, status, comment, number_of_people, reservation_date,
+                                              reservation_time, duration_minutes, created_at, updated_at)
+        VALUES (NEW.rid, NEW.tid, NEW.cid, NEW.status, NEW.comment, NEW.number_of_people, NEW.reservation_date,
+                NEW.reservation_time, NEW.duration_minutes, NEW.created_at, NEW.updated_at);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_reservations_mirror
+AFTER INSERT OR UPDATE OR DELETE ON reservations
+FOR EACH ROW
+EXECUTE FUNCTION reservations_mirror_to_partitioned();
+
+COMMIT;
@@ -0,0 +1,67 @@
+-- Adds reservations_archive, archive_reservations() and the partial indexes on active and
+-- archivable reservations to a database created with an older script.sql.
+-- Building the indexes blocks reservation writes until they are done (CONCURRENTLY is not
+-- available on a partitioned table), so run it at a quiet time:
+--     psql -U postgres -d reservations_db -f migrate_reservation_archive.sql
+
+BEGIN;
+
+-- Partial indexes keep cancelled and completed rows out of the hot paths. This one serves occupancy computed from
+-- reservations (rebuild_occupancy_daily, the ORM edition) as an index-only scan ...
+CREATE INDEX IF NOT EXISTS idx_reservations_active_date ON reservations(reservation_date) INCLUDE (number_of_people)
+    WHERE status = 'active';
+-- ... and this one lets archive_reservations() find its batches without touching active rows
+CREATE INDEX IF NOT EXISTS idx_reservations_archivable_date ON reservations(reservation_date)
+    WHERE status IN ('cancelled', 'completed');
+
+-- Cancelled and completed reservations older than the retention period, moved here in
+-- batches by archive_reservations() (run database_setup/archive_reservations.py).
+-- Kept compact for analytics: no generated period column, no foreign keys, only the primary key.
+CREATE TABLE IF NOT EXISTS reservations_archive (
+    rid INTEGER PRIMARY KEY,
+    tid INTEGER NOT NULL,
+    cid INTEGER NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    comment TEXT,
+    number_of_people INTEGER NOT NULL,
+    reservation_date DATE NOT NULL,
+    reservation_time TIME NOT NULL,
+    duration_minutes INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+-- Moves up to p_batch_size cancelled or completed reservations dated before p_before into
+-- reservations_archive and returns how many it moved. Rows locked by other transactions are
+-- skipped and picked up by a later batch. Call it repeatedly, one transaction per batch.
+CREATE OR REPLACE FUNCTION archive_reservations(p_before DATE, p_batch_size INTEGER DEFAULT 5000)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH batch AS (
+        SELECT rid, reservation_date
+        FROM reservations
+        WHERE status IN ('cancelled', 'completed') AND reservation_date < p_before
+        ORDER BY reservation_date
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    ), moved_rows AS (
+        DELETE FROM reservations r
+        USING batch b
+        WHERE r.rid = b.rid AND r.reservation_date = b.reservation_date
+        RETURNING r.rid, r.tid, r.cid, r.status, r.comment, r.number_of_people, r.reservation_date,
+                  r.reservation_time, r.duration_minutes, r.created_at, r.updated_at
+    )
+    INSERT INTO reservations_archive (rid, tid, cid, status, comment, number_of_people, reservation_date,
+                                      reservation_time, duration_minutes, created_at, updated_at)
+    SELECT rid, tid, cid, status, comment, number_of_people, reservation_date,
+           reservation_time, duration_minutes, created_at, updated_at
+    FROM moved_rows;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
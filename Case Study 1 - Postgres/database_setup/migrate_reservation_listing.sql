@@ -0,0 +1,7 @@
+-- Replaces idx_reservations_date with (reservation_date, rid), which also serves
+-- keyset pagination of GET /api/v1/reservations, on a database created with an older script.sql.
+-- Builds the new index without blocking writes, so it can run on a live database.
+-- Run outside a transaction: psql -U postgres -d reservations_db -f migrate_reservation_listing.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_date_rid ON reservations(reservation_date, rid);
+DROP INDEX CONCURRENTLY IF EXISTS idx_reservations_date;
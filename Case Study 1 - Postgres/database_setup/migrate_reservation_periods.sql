@@ -0,0 +1,33 @@
+-- Migrates a database created with an older script.sql (free-form VARCHAR reservation_time,
+-- no overlap protection) to time ranges with a GiST exclusion constraint.
+-- Run once: psql -U postgres -d reservations_db -f migrate_reservation_periods.sql
+-- Fails (and changes nothing) if existing active reservations already overlap;
+-- list them with the query at the end of this file and resolve them first.
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE reservations
+    ALTER COLUMN reservation_time TYPE TIME USING reservation_time::time,
+    ALTER COLUMN reservation_time SET NOT NULL,
+    ADD COLUMN duration_minutes INTEGER DEFAULT 120 NOT NULL CHECK (duration_minutes > 0),
+    ADD COLUMN reservation_period TSRANGE GENERATED ALWAYS AS (
+        tsrange(reservation_date + reservation_time,
+                reservation_date + reservation_time + duration_minutes * interval '1 minute')
+    ) STORED;
+
+ALTER TABLE reservations
+    ADD CONSTRAINT reservations_no_overlap EXCLUDE USING gist (tid WITH =, reservation_period WITH &&)
+        WHERE (status = 'active');
+
+CREATE INDEX IF NOT EXISTS idx_tables_capacity ON tables(capacity);
+
+COMMIT;
+
+-- Overlapping active reservations that block the constraint:
+-- SELECT a.rid, b.rid, a.tid, a.reservation_date, a.reservation_time, b.reservation_time
+-- FROM reservations a JOIN reservations b
+--   ON a.tid = b.tid AND a.rid < b.rid AND a.status = 'active' AND b.status = 'active'
+--  AND tsrange(a.reservation_date + a.reservation_time::time, a.reservation_date + a.reservation_time::time + interval '120 minutes')
+--   && tsrange(b.reservation_date + b.reservation_time::time, b.reservation_date + b.reservation_time::time + interval '120 minutes');
@@ -0,0 +1,61 @@
+import psycopg2
+import os
+from dotenv import load_dotenv
+
+# --- Explicitly load .env from one directory up ---
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+dotenv_path = os.path.join(current_script_dir, '..', '.env')
+load_dotenv(dotenv_path=dotenv_path)
+# --- End of explicit loading ---
+
+# Database connection information
+DATABASE_CONFIG = {
+    'dbname': os.getenv('DB_NAME'),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'host': os.getenv('DB_HOST'),
+    'port': os.getenv('DB_PORT')
+}
+
+def check_db_config():
+    missing = [k for k, v in DATABASE_CONFIG.items() if not v]
+    if missing:
+        print(f"Error: Missing database configuration values in .env or environment: {', '.join(missing)}")
+        print("Please ensure DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT are set in your .env file.")
+        return False
+    return True
+
+def rebuild_occupancy_daily():
+    if not check_db_config():
+        return
+
+    conn = None
+    cursor = None
+    try:
+        print(f"Connecting to database: {DATABASE_CONFIG['dbname']} on {DATABASE_CONFIG['host']}...")
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        cursor = conn.cursor()
+
+        # Recomputes occupancy_daily from reservations; reservation writes wait until it commits
+        cursor.execute("SELECT rebuild_occupancy_daily();")
+        days = cursor.fetchone()[0]
+        conn.commit()
+        print(f"Rebuilt occupancy_daily: {days} days with active reservations.")
+
+    except psycopg2.OperationalError as e:
+        print(f"Database connection error: {e}")
+        print("Please check your database server and connection settings in .env.")
+    except psycopg2.Error as e:
+        print(f"Database error during rebuild: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+        print("Database connection closed.")
+
+if __name__ == "__main__":
+    print("Rebuilding occupancy_daily rollup...")
+    rebuild_occupancy_daily()
@@ -9,6 +9,9 @@
 
 
 
+-- btree_gist lets a GiST index combine plain equality (tid) with range overlap (reservation_period)
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 CREATE TABLE tables (
     tid SERIAL PRIMARY KEY,                      -- Table ID
     table_number VARCHAR(255) UNIQUE NOT NULL,
@@ -23,20 +26,134 @@ CREATE TABLE customers (
     -- email VARCHAR(255) UNIQUE -- Consider adding email
 );
 
+-- Partitioned by month on reservation_date (see create_reservation_partition below),
+-- so date-bounded queries only touch the months they need and old months can be detached.
+-- The primary key has to include the partition key; rid itself stays unique through its sequence.
 CREATE TABLE reservations (
-    rid SERIAL PRIMARY KEY,                                              -- Reservation ID
+    rid SERIAL,                                                          -- Reservation ID
     tid INTEGER NOT NULL REFERENCES tables(tid) ON DELETE CASCADE,       -- Foreign Key to tables.tid
     cid INTEGER NOT NULL REFERENCES customers(cid) ON DELETE CASCADE,    -- Foreign Key to customers.cid
     status VARCHAR(50) DEFAULT 'active' NOT NULL CHECK (status IN ('active', 'cancelled', 'completed')),
     comment TEXT,
     number_of_people INTEGER NOT NULL,
     reservation_date DATE NOT NULL,
-    reservation_time VARCHAR(50),
+    reservation_time TIME NOT NULL,
+    duration_minutes INTEGER DEFAULT 120 NOT NULL CHECK (duration_minutes > 0),
+    -- The time span the table is occupied, derived from date, time and duration
+    reservation_period TSRANGE GENERATED ALWAYS AS (
+        tsrange(reservation_date + reservation_time,
+                reservation_date + reservation_time + duration_minutes * interval '1 minute')
+    ) STORED,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-    -- Consider adding a unique constraint to prevent double booking for the same table, date, and time
-    -- UNIQUE (tid, reservation_date, reservation_time)
-);
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (rid, reservation_date)
+) PARTITION BY RANGE (reservation_date);
+
+-- Catches reservations for months that have no partition yet
+CREATE TABLE reservations_default PARTITION OF reservations DEFAULT;
+-- Prevent double booking: active reservations of the same table must not overlap in time.
+-- Exclusion constraints cannot span partitions, so every partition gets its own
+-- (named reservations_no_overlap_<month>); the GiST index behind it also serves the availability search.
+-- A booking running past midnight on the last day of a month is checked against the next
+-- month's bookings by trigger_reservations_month_overlap below.
+ALTER TABLE reservations_default ADD CONSTRAINT reservations_no_overlap_default
+    EXCLUDE USING gist (tid WITH =, reservation_period WITH &&) WHERE (status = 'active');
+
+-- Creates the monthly partition of `p_parent` containing p_month, with its overlap constraint,
+-- and moves that month's rows out of the default partition. Returns NULL if it already exists.
+-- database_setup/manage_partitions.py calls this to keep future months created ahead of time.
+CREATE OR REPLACE FUNCTION create_reservation_partition(p_month DATE, p_parent TEXT DEFAULT 'reservations')
+RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_month)::date;
+    month_end DATE := (date_trunc('month', p_month) + interval '1 month')::date;
+    suffix TEXT := to_char(p_month, 'YYYY_MM');
+    partition_name TEXT := 'reservations_' || suffix;
+    columns TEXT := 'rid, tid, cid, status, comment, number_of_people, reservation_date, reservation_time, '
+                    'duration_minutes, created_at, updated_at';
+    default_partition TEXT;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT c.relname INTO default_partition
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = p_parent::regclass AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT';
+    IF default_partition IS NOT NULL THEN
+        -- Writing to the partitions directly bypasses the occupancy triggers on the parent,
+        -- which is right: the rows only change place
+        EXECUTE format('CREATE TEMP TABLE moved_reservations AS SELECT %s FROM %I WHERE reservation_date >= %L AND reservation_date < %L',
+                       columns, default_partition, month_start, month_end);
+        EXECUTE format('DELETE FROM %I WHERE reservation_date >= %L AND reservation_date < %L',
+                       default_partition, month_start, month_end);
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, p_parent, month_start, month_end);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I EXCLUDE USING gist (tid WITH =, reservation_period WITH &&) WHERE (status = %L)',
+                   partition_name, 'reservations_no_overlap_' || suffix, 'active');
+
+    IF default_partition IS NOT NULL THEN
+        EXECUTE format('INSERT INTO %I (%s) SELECT %s FROM moved_reservations', partition_name, columns, columns);
+        DROP TABLE moved_reservations;
+    END IF;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Last month through twelve months ahead
+SELECT create_reservation_partition((date_trunc('month', current_date) + n * interval '1 month')::date)
+FROM generate_series(-1, 12) AS n;
+
+-- The overlap constraints only see their own month. A booking that runs into the next month,
+-- or one on the first day of a month that such a booking may reach, is checked here against
+-- the neighbouring month. Locking the table's row makes concurrent checks for that table take
+-- turns. Bookings last at most a day (MAX_DURATION_MINUTES in src/table_allocator.py), so only
+-- the day before and the days the booking covers can clash.
+CREATE OR REPLACE FUNCTION reservations_check_month_overlap()
+RETURNS TRIGGER AS $$
+DECLARE
+    -- reservation_period is generated after BEFORE triggers run
+    period TSRANGE := tsrange(NEW.reservation_date + NEW.reservation_time,
+                              NEW.reservation_date + NEW.reservation_time + NEW.duration_minutes * interval '1 minute');
+    month_start DATE := date_trunc('month', NEW.reservation_date)::date;
+    clash RECORD;
+BEGIN
+    IF NEW.status <> 'active' THEN
+        RETURN NEW;
+    END IF;
+    IF upper(period) <= month_start + interval '1 month' AND NEW.reservation_date <> month_start THEN
+        RETURN NEW;
+    END IF;
+    IF TG_OP = 'UPDATE' AND OLD.status = 'active' AND OLD.tid = NEW.tid AND OLD.reservation_date = NEW.reservation_date
+       AND OLD.reservation_time = NEW.reservation_time AND OLD.duration_minutes = NEW.duration_minutes THEN
+        RETURN NEW;
+    END IF;
+
+    PERFORM 1 FROM tables WHERE tid = NEW.tid FOR UPDATE;
+    SELECT rid, reservation_period INTO clash
+    FROM reservations
+    WHERE tid = NEW.tid
+      AND status = 'active'
+      AND rid <> NEW.rid
+      AND reservation_date BETWEEN NEW.reservation_date - 1 AND upper(period)::date
+      AND date_trunc('month', reservation_date) <> month_start
+      AND reservation_period && period
+    LIMIT 1;
+    IF FOUND THEN
+        RAISE EXCEPTION 'conflicting key value violates exclusion constraint "reservations_no_overlap"'
+            USING ERRCODE = 'exclusion_violation', CONSTRAINT = 'reservations_no_overlap',
+                  DETAIL = format('Table %s is booked for %s by reservation %s.', NEW.tid, clash.reservation_period, clash.rid);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_reservations_month_overlap
+BEFORE INSERT OR UPDATE ON reservations
+FOR EACH ROW
+EXECUTE FUNCTION reservations_check_month_overlap();
 
 -- Optional: Trigger to update 'updated_at' timestamp on reservations table
 CREATE OR REPLACE FUNCTION update_reservations_updated_at_column()
@@ -53,5 +170,236 @@ FOR EACH ROW
 EXECUTE FUNCTION update_reservations_updated_at_column();
 
 -- You might want indexes for performance
-CREATE INDEX idx_reservations_date ON reservations(reservation_date);
+-- (reservation_date, rid) serves date range filters and keyset pagination of the listing endpoint
+CREATE INDEX idx_reservations_date_rid ON reservations(reservation_date, rid);
 CREATE INDEX idx_reservations_table_id_date ON reservations(tid, reservation_date);
+CREATE INDEX idx_tables_capacity ON tables(capacity);
+-- Partial indexes keep cancelled and completed rows out of the hot paths: the overlap
+-- constraints above only index active rows, this one serves occupancy computed from
+-- reservations (rebuild_occupancy_daily, the ORM edition) as an index-only scan ...
+CREATE INDEX idx_reservations_active_date ON reservations(reservation_date) INCLUDE (number_of_people)
+    WHERE status = 'active';
+-- ... and this one lets archive_reservations() find its batches without touching active rows
+CREATE INDEX idx_reservations_archivable_date ON reservations(reservation_date)
+    WHERE status IN ('cancelled', 'completed');
+
+-- Cancelled and completed reservations older than the retention period, moved here in
+-- batches by archive_reservations() (run database_setup/archive_reservations.py).
+-- Kept compact for analytics: no generated period column, no foreign keys, only the primary key.
+CREATE TABLE reservations_archive (
+    rid INTEGER PRIMARY KEY,
+    tid INTEGER NOT NULL,
+    cid INTEGER NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    comment TEXT,
+    number_of_people INTEGER NOT NULL,
+    reservation_date DATE NOT NULL,
+    reservation_time TIME NOT NULL,
+    duration_minutes INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+-- Moves up to p_batch_size cancelled or completed reservations dated before p_before into
+-- reservations_archive and returns how many it moved. Rows locked by other transactions are
+-- skipped and picked up by a later batch. Call it repeatedly, one transaction per batch.
+CREATE OR REPLACE FUNCTION archive_reservations(p_before DATE, p_batch_size INTEGER DEFAULT 5000)
+RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH batch AS (
+        SELECT rid, reservation_date
+        FROM reservations
+        WHERE status IN ('cancelled', 'completed') AND reservation_date < p_before
+        ORDER BY reservation_date
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    ), moved_rows AS (
+        DELETE FROM reservations r
+        USING batch b
+        WHERE r.rid = b.rid AND r.reservation_date = b.reservation_date
+        RETURNING r.rid, r.tid, r.cid, r.status, r.comment, r.number_of_people, r.reservation_date,
+                  r.reservation_time, r.duration_minutes, r.created_at, r.updated_at
+    )
+    INSERT INTO reservations_archive (rid, tid, cid, status, comment, number_of_people, reservation_date,
+                                      reservation_time, duration_minutes, created_at, updated_at)
+    SELECT rid, tid, cid, status, comment, number_of_people, reservation_date,
+           reservation_time, duration_minutes, created_at, updated_at
+    FROM moved_rows;
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Responses of POST /api/v1/reservations requests sent with an Idempotency-Key header, replayed
+-- when a client retries with the same key. request_hash is the SHA-256 of the JSON body.
+-- app.py removes expired keys as it claims new ones.
+CREATE TABLE idempotency_keys (
+    idempotency_key VARCHAR(255) PRIMARY KEY,
+    request_hash BYTEA NOT NULL,
+    status_code SMALLINT,
+    response JSONB,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+CREATE INDEX idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+
+-- Daily occupancy rollup, kept current by statement-level triggers on reservations.
+-- Only active reservations count. Rebuild it with SELECT rebuild_occupancy_daily();
+-- (or database_setup/rebuild_occupancy.py) if it ever drifts, e.g. after TRUNCATE reservations.
+CREATE TABLE occupancy_daily (
+    reservation_date DATE PRIMARY KEY,
+    people INTEGER NOT NULL DEFAULT 0,
+    reservations INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION occupancy_daily_apply_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed_dates TEXT;
+BEGIN
+    -- Transition tables hold all rows touched by the statement, so a bulk COPY
+    -- costs one upsert per affected day instead of one per row.
+    -- ORDER BY keeps the row lock order stable across concurrent statements.
+    IF TG_OP = 'INSERT' THEN
+        WITH changed AS (
+            INSERT INTO occupancy_daily (reservation_date, people, reservations)
+            SELECT reservation_date, SUM(number_of_people), COUNT(*)
+            FROM new_rows
+            WHERE status = 'active'
+            GROUP BY reservation_date
+            ORDER BY reservation_date
+            ON CONFLICT (reservation_date) DO UPDATE
+                SET people = occupancy_daily.people + EXCLUDED.people,
+                    reservations = occupancy_daily.reservations + EXCLUDED.reservations
+            RETURNING reservation_date
+        )
+        SELECT string_agg(reservation_date::text, ',') INTO changed_dates FROM changed;
+    ELSIF TG_OP = 'DELETE' THEN
+        WITH changed AS (
+            INSERT INTO occupancy_daily (reservation_date, people, reservations)
+            SELECT reservation_date, -SUM(number_of_people), -COUNT(*)
+            FROM old_rows
+            WHERE status = 'active'
+            GROUP BY reservation_date
+            ORDER BY reservation_date
+            ON CONFLICT (reservation_date) DO UPDATE
+                SET people = occupancy_daily.people + EXCLUDED.people,
+                    reservations = occupancy_daily.reservations + EXCLUDED.reservations
+            RETURNING reservation_date
+        )
+        SELECT string_agg(reservation_date::text, ',') INTO changed_dates FROM changed;
+    ELSE
+        WITH changed AS (
+            INSERT INTO occupancy_daily (reservation_date, people, reservations)
+            SELECT reservation_date, SUM(people), SUM(delta)
+            FROM (
+                SELECT reservation_date, number_of_people AS people, 1 AS delta FROM new_rows WHERE status = 'active'
+                UNION ALL
+                SELECT reservation_date, -number_of_people, -1 FROM old_rows WHERE status = 'active'
+            ) AS changes
+            GROUP BY reservation_date
+            HAVING SUM(people) <> 0 OR SUM(delta) <> 0
+            ORDER BY reservation_date
+            ON CONFLICT (reservation_date) DO UPDATE
+                SET people = occupancy_daily.people + EXCLUDED.people,
+                    reservations = occupancy_daily.reservations + EXCLUDED.reservations
+            RETURNING reservation_date
+        )
+        SELECT string_agg(reservation_date::text, ',') INTO changed_dates FROM changed;
+    END IF;
+
+    -- Tell every API worker which cached occupancy days are stale (delivered on commit).
+    -- NOTIFY payloads are limited to 8000 bytes; '*' invalidates everything.
+    IF changed_dates IS NOT NULL THEN
+        PERFORM pg_notify('occupancy_changed', CASE WHEN length(changed_dates) > 7900 THEN '*' ELSE changed_dates END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_occupancy_daily_insert
+AFTER INSERT ON reservations
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION occupancy_daily_apply_changes();
+
+CREATE TRIGGER trigger_occupancy_daily_update
+AFTER UPDATE ON reservations
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION occupancy_daily_apply_changes();
+
+CREATE TRIGGER trigger_occupancy_daily_delete
+AFTER DELETE ON reservations
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION occupancy_daily_apply_changes();
+
+-- Recomputes the rollup from scratch. Blocks reservation writes while it runs.
+CREATE OR REPLACE FUNCTION rebuild_occupancy_daily()
+RETURNS INTEGER AS $$
+DECLARE
+    days INTEGER;
+BEGIN
+    LOCK TABLE reservations IN SHARE MODE;
+    DELETE FROM occupancy_daily;
+    INSERT INTO occupancy_daily (reservation_date, people, reservations)
+    SELECT reservation_date, SUM(number_of_people), COUNT(*)
+    FROM reservations
+    WHERE status = 'active'
+    GROUP BY reservation_date;
+    GET DIAGNOSTICS days = ROW_COUNT;
+    PERFORM pg_notify('occupancy_changed', '*');
+    RETURN days;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Tells the table allocator of every API worker (src/table_allocator.py) which days have
+-- different active bookings now. Unlike 'occupancy_changed' this also fires when a booking
+-- only moves to another time or table.
+CREATE OR REPLACE FUNCTION reservations_notify_bookings()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed_dates TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT string_agg(DISTINCT reservation_date::text, ',') INTO changed_dates
+        FROM new_rows WHERE status = 'active';
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT string_agg(DISTINCT reservation_date::text, ',') INTO changed_dates
+        FROM old_rows WHERE status = 'active';
+    ELSE
+        SELECT string_agg(DISTINCT reservation_date::text, ',') INTO changed_dates
+        FROM (
+            SELECT reservation_date FROM new_rows WHERE status = 'active'
+            UNION ALL
+            SELECT reservation_date FROM old_rows WHERE status = 'active'
+        ) AS changes;
+    END IF;
+
+    IF changed_dates IS NOT NULL THEN
+        PERFORM pg_notify('bookings_changed', CASE WHEN length(changed_dates) > 7900 THEN '*' ELSE changed_dates END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_bookings_notify_insert
+AFTER INSERT ON reservations
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION reservations_notify_bookings();
+
+CREATE TRIGGER trigger_bookings_notify_update
+AFTER UPDATE ON reservations
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION reservations_notify_bookings();
+
+CREATE TRIGGER trigger_bookings_notify_delete
+AFTER DELETE ON reservations
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION reservations_notify_bookings();
@@ -1,16 +1,47 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, request, jsonify, make_response, Response, stream_with_context, g
 import psycopg2
-from psycopg2 import sql, IntegrityError, extras
+from psycopg2 import sql, IntegrityError, extras, extensions
+import base64
+import hashlib
+import io
+import json
 import os
+import threading
 from dotenv import load_dotenv  # Import load_dotenv
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
+from time import perf_counter
+from db_pool import ConnectionPool, PoolTimeout
+from bulk_import import import_reservations, read_rows
+from occupancy_cache import OccupancyCache, InvalidationListener
+from read_replicas import ReplicaRouter, current_wal_insert_lsn, format_lsn, parse_lsn
+from table_allocator import BookingIndex, split_party, NOTIFY_CHANNEL as BOOKINGS_CHANNEL, MAX_DURATION_MINUTES
+from prepared_statements import PreparedStatements
+import json_encoding
+from metrics import RequestMetrics, InstrumentedConnection, render_samples
 
 load_dotenv()  # Load environment variables from .env file
 
 app = Flask(__name__)
+# Request and response bodies: JSON_ENCODER=auto (orjson when installed), orjson or stdlib
+json_encoding.install(app, os.getenv('JSON_ENCODER', 'auto'))
 
-# Database connection
-def get_db_connection():
+# How long a table stays occupied when a booking does not say otherwise
+DEFAULT_DURATION_MINUTES = 120
+# Upper bound on the number of days one occupancy request may cover
+MAX_OCCUPANCY_WINDOW_DAYS = 366
+# Listing endpoints: default and maximum page size, rows fetched per server-side cursor round trip
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+LISTING_FETCH_SIZE = 1000
+
+# Request latency, DB time and connection acquire time, served on /metrics (per worker process)
+metrics = RequestMetrics(enabled=os.getenv('METRICS_ENABLED', 'true').lower() == 'true')
+
+# Database connection pool (one per worker process, created on first use)
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_config():
     db_name = os.getenv('DB_NAME')
     db_user = os.getenv('DB_USER')
     db_password = os.getenv('DB_PASSWORD')
@@ -24,14 +55,133 @@ def get_db_connection():
         }.items() if not val]
         raise ValueError(f"Missing database configuration in .env or environment: {', '.join(missing_vars)}")
 
-    conn = psycopg2.connect(
-        dbname=db_name,
-        user=db_user,
-        password=db_password,
-        host=db_host,
-        port=db_port
-    )
-    return conn
+    return {'dbname': db_name, 'user': db_user, 'password': db_password, 'host': db_host, 'port': db_port}
+
+def get_db_pool():
+    global _db_pool
+    if _db_pool is not None:
+        return _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ConnectionPool(
+                minconn=int(os.getenv('DB_POOL_MIN', '1')),
+                maxconn=int(os.getenv('DB_POOL_MAX', '10')),
+                timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+                health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30')),
+                **get_db_config(),
+                **({'connection_factory': InstrumentedConnection} if metrics.enabled else {})
+            )
+    return _db_pool
+
+# Occupancy response cache (one per worker process). A background listener
+# drops stale entries when any worker commits a reservation change.
+occupancy_cache = OccupancyCache(
+    ttl=float(os.getenv('OCCUPANCY_CACHE_TTL', '30')),
+    max_entries=int(os.getenv('OCCUPANCY_CACHE_MAX_ENTRIES', '256'))
+)
+_occupancy_listener = None
+
+def ensure_occupancy_listener():
+    global _occupancy_listener
+    if _occupancy_listener is not None or os.getenv('OCCUPANCY_CACHE_ENABLED', 'true').lower() != 'true':
+        return
+    with _db_pool_lock:
+        if _occupancy_listener is None:
+            # With read replicas, cache fills read from a replica wait until it has replayed the invalidation
+            _occupancy_listener = InvalidationListener(occupancy_cache, get_db_config(),
+                                                       record_lsn=get_replica_router() is not None)
+            _occupancy_listener.start()
+
+# Per-day schedules of active bookings used by the table allocator (one index per worker
+# process), kept in sync through the 'bookings_changed' notifications of the reservations triggers
+booking_index = BookingIndex(
+    ttl=float(os.getenv('ALLOCATION_INDEX_TTL', '60')),
+    max_days=int(os.getenv('ALLOCATION_INDEX_MAX_DAYS', '62'))
+)
+_booking_listener = None
+# Most tables the allocator combines for one party when no single table is large enough
+ALLOCATION_MAX_TABLES = int(os.getenv('ALLOCATION_MAX_TABLES', '3'))
+# A stale schedule only costs a retry: the overlap constraint rejects the booking and the day is reloaded
+MAX_ALLOCATION_ATTEMPTS = 3
+
+def ensure_booking_listener():
+    global _booking_listener
+    if _booking_listener is not None or os.getenv('ALLOCATION_INDEX_ENABLED', 'true').lower() != 'true':
+        return
+    with _db_pool_lock:
+        if _booking_listener is None:
+            _booking_listener = InvalidationListener(booking_index, get_db_config(), channel=BOOKINGS_CHANNEL)
+            _booking_listener.start()
+
+# Hot statements are PREPAREd once per pooled connection and reused
+prepared = PreparedStatements(enabled=os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() == 'true')
+# 'single_statement' creates customer and reservation in one CTE round trip,
+# 'multi_statement' keeps the original lookup / insert sequence
+RESERVATION_CREATE_MODE = os.getenv('RESERVATION_CREATE_MODE', 'single_statement')
+# 'soft' marks a cancelled reservation as status 'cancelled' and keeps the row (moved to
+# reservations_archive later by database_setup/archive_reservations.py), 'delete' removes it
+RESERVATION_CANCEL_MODE = os.getenv('RESERVATION_CANCEL_MODE', 'soft')
+# How long the response to a POST /reservations with an Idempotency-Key header is replayed
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_KEY_TTL_SECONDS', '86400'))
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+# true rejects PUT /reservations/<rid> without an If-Match header (428), so no client can overwrite
+# a change it has not seen; false keeps If-Match optional
+RESERVATION_REQUIRE_IF_MATCH = os.getenv('RESERVATION_REQUIRE_IF_MATCH', 'false').lower() == 'true'
+
+# Optional streaming replicas for the read-only routes: comma-separated libpq DSNs or URIs, any
+# setting they leave out is taken from the primary's DB_* values. Empty sends everything to the primary.
+DB_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv('DB_REPLICA_DSNS', '').split(',') if dsn.strip()]
+# After a write the client gets this cookie with the primary's WAL position; its reads only go to
+# replicas that have replayed it (read-your-writes), until the cookie expires
+READ_AFTER_LSN_COOKIE = 'read_after_lsn'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+DB_REPLICA_READ_YOUR_WRITES_SECONDS = int(os.getenv('DB_REPLICA_READ_YOUR_WRITES_SECONDS', '60'))
+_replica_router = None
+
+def get_replica_router():
+    global _replica_router
+    if _replica_router is not None or not DB_REPLICA_DSNS:
+        return _replica_router
+    with _db_pool_lock:
+        if _replica_router is None:
+            _replica_router = ReplicaRouter(
+                get_db_config(),
+                [{**get_db_config(), **extensions.parse_dsn(dsn)} for dsn in DB_REPLICA_DSNS],
+                max_lag_seconds=float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', '5')),
+                check_interval=float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '1')),
+                maxconn=int(os.getenv('DB_POOL_MAX', '10')),
+                timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+                health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30')),
+                **({'connection_factory': InstrumentedConnection} if metrics.enabled else {})
+            )
+    return _replica_router
+
+def get_db_connection():
+    started = perf_counter()
+    try:
+        return get_db_pool().getconn()
+    finally:
+        metrics.observe_acquire(perf_counter() - started)
+
+def get_read_connection(min_lsn=0):
+    # For read-only routes: a replica that is not too far behind and has replayed both `min_lsn`
+    # and the client's last write, otherwise the primary
+    router = get_replica_router()
+    if router is not None:
+        try:
+            session_lsn = parse_lsn(request.cookies.get(READ_AFTER_LSN_COOKIE, '0/0'))
+        except ValueError:
+            session_lsn = 0
+        started = perf_counter()
+        conn = router.getconn(max(min_lsn, session_lsn))
+        if conn is not None:
+            metrics.observe_acquire(perf_counter() - started)
+            return conn
+    return get_db_connection()
+
+def release_db_connection(conn):
+    if _replica_router is None or not _replica_router.putconn(conn):
+        get_db_pool().putconn(conn)
 
 @app.errorhandler(400)
 def bad_request_error(error):
@@ -45,7 +195,119 @@ def not_found_error(error):
 def conflict_error(error):
     return make_response(jsonify({"message": "Conflict", "details": str(error.description if hasattr(error, 'description') else error)}), 409)
 
+@app.errorhandler(422)
+def unprocessable_entity_error(error):
+    return make_response(jsonify({"message": "Unprocessable Entity", "details": str(error.description if hasattr(error, 'description') else error)}), 422)
+
+@app.errorhandler(412)
+def precondition_failed_error(error):
+    return make_response(jsonify({"message": "Precondition Failed", "details": str(error.description if hasattr(error, 'description') else error)}), 412)
+
+@app.errorhandler(428)
+def precondition_required_error(error):
+    return make_response(jsonify({"message": "Precondition Required", "details": str(error.description if hasattr(error, 'description') else error)}), 428)
+
+@app.errorhandler(503)
+def service_unavailable_error(error):
+    return make_response(jsonify({"message": "Service Unavailable", "details": str(error.description if hasattr(error, 'description') else error)}), 503)
+
+class ReservationOperationError(Exception):
+    """A create / modify / cancel step failed; `status` is the HTTP status to answer with.
+
+    `retryable` marks a conflict with a booking made concurrently, which a new attempt may avoid.
+    """
+
+    def __init__(self, status, details, retryable=False):
+        super().__init__(details)
+        self.status = status
+        self.details = details
+        self.retryable = retryable
+
+def operation_error_response(error):
+    return {400: bad_request_error, 404: not_found_error, 409: conflict_error, 412: precondition_failed_error,
+            422: unprocessable_entity_error, 428: precondition_required_error}[error.status](error.details)
+
+@app.before_request
+def begin_request_metrics():
+    g.metrics_started = metrics.begin_request()
+
+@app.after_request
+def end_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        method = request.method
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = response.status_code
+        # Observed when the body has been sent, so streamed listings include their DB time
+        response.call_on_close(lambda: metrics.end_request(started, method, route, status))
+    return response
+
+def commit_write(conn):
+    conn.commit()
+    record_write_lsn(conn)
+
+def record_write_lsn(conn):
+    # With read replicas, note the primary's WAL position just after this commit, on the same
+    # connection, for the read-your-writes cookie set by remember_write_lsn
+    if get_replica_router() is None:
+        return
+    try:
+        g.write_lsn = current_wal_insert_lsn(conn)
+        conn.rollback()
+    except psycopg2.Error as e:
+        # The write is committed; without the cookie the client's next reads may miss it for up to the replica lag
+        app.logger.warning(f"Could not record the write position for read-your-writes: {e}")
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+
+@app.after_request
+def remember_write_lsn(response):
+    # Successful writes hand the client the primary's WAL position, for read-your-writes on replicas
+    lsn = g.pop('write_lsn', None)
+    if lsn is None or request.method not in WRITE_METHODS or response.status_code >= 400:
+        return response
+    response.set_cookie(READ_AFTER_LSN_COOKIE, format_lsn(lsn), max_age=DB_REPLICA_READ_YOUR_WRITES_SECONDS,
+                        httponly=True, samesite='Lax')
+    return response
+
+# Prometheus metrics for this worker process
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    pool_stats = get_db_pool().stats()
+    cache_stats = occupancy_cache.stats()
+    extra_lines = (
+        render_samples('gauge', 'reservations_db_pool_connections', 'Pooled connections by state.',
+                       {'in_use': pool_stats['in_use'], 'idle': pool_stats['idle']}, labelname='state')
+        + render_samples('counter', 'reservations_db_pool_timeouts_total', 'Checkouts that timed out.', pool_stats['timeouts'])
+        + render_samples('counter', 'reservations_occupancy_cache_lookups_total', 'Occupancy cache lookups by result.',
+                         {'hit': cache_stats['hits'], 'miss': cache_stats['misses']}, labelname='result')
+    )
+    return Response(metrics.render(extra_lines), status=200, mimetype='text/plain; version=0.0.4')
+
+# Connection pool statistics, for sizing the pool per worker
+@app.route('/api/v1/pool_stats', methods=['GET'])
+def get_pool_stats():
+    stats = get_db_pool().stats()
+    stats['prepared_statements'] = prepared.stats()
+    if get_replica_router() is not None:
+        stats['read_replicas'] = get_replica_router().stats()
+    return jsonify(stats), 200
+
+# Occupancy cache hit/miss counters, for tuning TTL and size
+@app.route('/api/v1/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(occupancy_cache.stats()), 200
+
+# Table allocator index loads and decision times
+@app.route('/api/v1/allocator_stats', methods=['GET'])
+def get_allocator_stats():
+    return jsonify(booking_index.stats()), 200
+
 # User Story 1: Create tables (Restaurant Tables)
+prepared.register('insert_table', "INSERT INTO tables (capacity, table_number) VALUES ($1, $2) RETURNING tid")
+
 @app.route('/api/v1/tables', methods=['POST'])
 def create_restaurant_table():
     data = request.json
@@ -60,34 +322,61 @@ def create_restaurant_table():
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO tables (capacity, table_number) VALUES (%s, %s) RETURNING tid",
-            (capacity_val, table_number_str))
+        prepared.execute(cursor, 'insert_table', (capacity_val, table_number_str))
         table_id = cursor.fetchone()[0]  # This is tid
-        conn.commit()
+        commit_write(conn)
     except IntegrityError as e:
         if conn: conn.rollback()
         if "tables_table_number_key" in str(e).lower():
              return conflict_error(f"Table with number '{table_number_str}' already exists.")
         return conflict_error(f"Database integrity error: {e}")
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
     except Exception as e:
         if conn: conn.rollback()
         app.logger.error(f"Error creating table: {e}", exc_info=True)  # Log the full error
         return bad_request_error(f"Error creating table: {e}")
     finally:
         if cursor: cursor.close()
-        if conn: conn.close()
+        if conn: release_db_connection(conn)
 
     return jsonify({'tid': table_id, 'message': 'Table created successfully'}), 201
 
 # User Story 2: Add new reservation
-@app.route('/api/v1/reservations', methods=['POST'])
-def add_reservation():
-    data = request.json
+prepared.register('select_table', "SELECT tid FROM tables WHERE tid = $1")
+prepared.register('select_customer_by_phone', "SELECT cid FROM customers WHERE phone = $1")
+prepared.register('insert_customer', "INSERT INTO customers (last_name, first_name, phone) VALUES ($1, $2, $3) RETURNING cid")
+prepared.register('insert_reservation', """
+    INSERT INTO reservations (tid, cid, status, comment, number_of_people, reservation_date, reservation_time, duration_minutes)
+    VALUES ($1, $2, 'active', $3, $4, $5, $6, $7) RETURNING rid, reservation_date
+""")
+# Single round trip: upsert the customer by phone and insert the reservation,
+# leaving the table check to the tid foreign key
+prepared.register('create_reservation', """
+    WITH new_customer AS (
+        INSERT INTO customers (last_name, first_name, phone)
+        VALUES ($1::varchar, $2::varchar, $3::varchar)
+        ON CONFLICT (phone) DO NOTHING
+        RETURNING cid
+    ), customer AS (
+        SELECT cid FROM new_customer
+        UNION ALL
+        SELECT cid FROM customers WHERE phone = $3::varchar
+    )
+    INSERT INTO reservations (tid, cid, status, comment, number_of_people, reservation_date, reservation_time, duration_minutes)
+    SELECT $4::integer, cid, 'active', $5::text, $6::integer, $7::date, $8::time, $9::integer
+    FROM customer
+    LIMIT 1
+    RETURNING rid, cid, reservation_date
+""")
+
+def create_reservation_in_transaction(cursor, data):
+    # Returns (response body, stored reservation_date); the caller commits or rolls back
     required_fields = ['tid', 'number_of_people', 'reservation_date', 'reservation_time', 'last_name', 'first_name', 'phone']
     if not all(field in data for field in required_fields):
         missing_fields = [field for field in required_fields if field not in data]
-        return bad_request_error(f"Missing required fields: {', '.join(missing_fields)}")
+        raise ReservationOperationError(400, f"Missing required fields: {', '.join(missing_fields)}")
 
     table_id_val = data['tid']
     num_people = data['number_of_people']
@@ -97,52 +386,46 @@ def add_reservation():
     first_name_str = data['first_name']
     phone_str = data['phone']
     comment_str = data.get('comment', '')
+    duration_val = data.get('duration_minutes', DEFAULT_DURATION_MINUTES)
 
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        conn.autocommit = False
-        cursor = conn.cursor()
+        if RESERVATION_CREATE_MODE == 'single_statement':
+            create_params = (last_name_str, first_name_str, phone_str, table_id_val, comment_str,
+                             num_people, res_date, res_time, duration_val)
+            prepared.execute(cursor, 'create_reservation', create_params)
+            created_row = cursor.fetchone()
+            if created_row is None:
+                # A concurrent request inserted this phone number after our snapshot; the retry sees it
+                prepared.execute(cursor, 'create_reservation', create_params)
+                created_row = cursor.fetchone()
+            reservation_id_val, customer_id_val, stored_date = created_row
+        else:
+            prepared.execute(cursor, 'select_table', (table_id_val,))
+            if cursor.fetchone() is None:
+                raise ReservationOperationError(400, f"Table with TID {table_id_val} does not exist.")
 
-        cursor.execute("SELECT tid FROM tables WHERE tid = %s", (table_id_val,))
-        if cursor.fetchone() is None:
-            return bad_request_error(f"Table with TID {table_id_val} does not exist.")
+            prepared.execute(cursor, 'select_customer_by_phone', (phone_str,))  # Use phone as unique customer identifier for lookup
+            customer_row = cursor.fetchone()
 
-        cursor.execute("SELECT cid FROM customers WHERE phone = %s", (phone_str,))  # Use phone as unique customer identifier for lookup
-        customer_row = cursor.fetchone()
+            if customer_row:
+                customer_id_val = customer_row[0]  # This is cid
+            else:
+                prepared.execute(cursor, 'insert_customer', (last_name_str, first_name_str, phone_str))
+                customer_id_val = cursor.fetchone()[0]  # This is cid
 
-        if customer_row:
-            customer_id_val = customer_row[0]  # This is cid
-        else:
-            cursor.execute(
-                "INSERT INTO customers (last_name, first_name, phone) VALUES (%s, %s, %s) RETURNING cid",
-                (last_name_str, first_name_str, phone_str)
-            )
-            customer_id_val = cursor.fetchone()[0]  # This is cid
-
-        cursor.execute(
-            """
-            INSERT INTO reservations (tid, cid, status, comment, number_of_people, reservation_date, reservation_time)
-            VALUES (%s, %s, 'active', %s, %s, %s, %s) RETURNING rid
-            """,
-            (table_id_val, customer_id_val, comment_str, num_people, res_date, res_time)
-        )
-        reservation_id_val = cursor.fetchone()[0]  # This is rid
-        conn.commit()
+            prepared.execute(cursor, 'insert_reservation',
+                             (table_id_val, customer_id_val, comment_str, num_people, res_date, res_time, duration_val))
+            reservation_id_val, stored_date = cursor.fetchone()  # This is rid
     except IntegrityError as e:
-        if conn: conn.rollback()
+        if "reservations_no_overlap" in str(e).lower():
+            raise ReservationOperationError(409, f"Table with TID {table_id_val} is already booked on {res_date} around {res_time}.",
+                                            retryable=True)
+        if "reservations_tid_fkey" in str(e).lower():
+            raise ReservationOperationError(400, f"Table with TID {table_id_val} does not exist.")
         if "customers_phone_key" in str(e).lower():
-            return conflict_error(f"Customer with phone number '{phone_str}' already exists with different details or a general conflict occurred.")
+            raise ReservationOperationError(409, f"Customer with phone number '{phone_str}' already exists with different details or a general conflict occurred.")
         app.logger.error(f"Database integrity error: {e}", exc_info=True)
-        return conflict_error(f"Database integrity error: {e}")
-    except Exception as e:
-        if conn: conn.rollback()
-        app.logger.error(f"Error adding reservation: {e}", exc_info=True)
-        return bad_request_error(f"Error adding reservation: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
+        raise ReservationOperationError(409, f"Database integrity error: {e}")
 
     response_data = {
         'rid': reservation_id_val,
@@ -150,12 +433,251 @@ def add_reservation():
         'tid': table_id_val,
         'reservation_date': res_date,
         'reservation_time': res_time,
+        'duration_minutes': duration_val,
         'number_of_people': num_people,
         'message': 'Reservation created successfully'
     }
+    return response_data, stored_date
+
+# Idempotency-Key: the first request with a key claims it in the same transaction that creates
+# the reservation and stores its response there. A concurrent duplicate waits on the claimed row
+# until that transaction ends, then replays the stored response (or claims the key itself if the
+# first attempt failed and rolled back). Expired keys are reclaimed in place, and every claim
+# removes a few other expired keys so the table stays small.
+prepared.register('claim_idempotency_key', """
+    WITH purged AS (
+        DELETE FROM idempotency_keys
+        WHERE idempotency_key IN (
+            SELECT idempotency_key FROM idempotency_keys
+            WHERE expires_at < now() AND idempotency_key <> $1
+            LIMIT 10
+            FOR UPDATE SKIP LOCKED
+        )
+    )
+    INSERT INTO idempotency_keys (idempotency_key, request_hash, expires_at)
+    VALUES ($1, $2, now() + $3 * interval '1 second')
+    ON CONFLICT (idempotency_key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response = NULL, expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at < now()
+    RETURNING idempotency_key
+""")
+prepared.register('select_idempotent_response',
+                  "SELECT request_hash, status_code, response FROM idempotency_keys WHERE idempotency_key = $1")
+prepared.register('store_idempotent_response',
+                  "UPDATE idempotency_keys SET status_code = $2, response = $3 WHERE idempotency_key = $1")
+
+def claim_idempotency_key(cursor, key, request_hash):
+    # Returns None if this request owns the key, else the (status, body) of the original request.
+    # Raises ReservationOperationError if the key was used for a different request.
+    prepared.execute(cursor, 'claim_idempotency_key', (key, request_hash, IDEMPOTENCY_KEY_TTL_SECONDS))
+    if cursor.fetchone() is not None:
+        return None
+    prepared.execute(cursor, 'select_idempotent_response', (key,))
+    stored_hash, status_code, response = cursor.fetchone()
+    if bytes(stored_hash) != request_hash:
+        raise ReservationOperationError(422, f"Idempotency-Key '{key}' was already used with a different request body.")
+    return status_code, response
+
+@app.route('/api/v1/reservations', methods=['POST'])
+def add_reservation():
+    data = request.json
+    if not data:
+        return bad_request_error("Request body must be a JSON object")
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        return bad_request_error(f"'Idempotency-Key' must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        conn.autocommit = False
+        cursor = conn.cursor()
+        if idempotency_key is not None:
+            request_hash = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).digest()
+            original = claim_idempotency_key(cursor, idempotency_key, request_hash)
+            if original is not None:
+                conn.rollback()
+                response = make_response(jsonify(original[1]), original[0])
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+        response_data, stored_date = create_reservation_in_transaction(cursor, data)
+        if idempotency_key is not None:
+            prepared.execute(cursor, 'store_idempotent_response', (idempotency_key, 201, extras.Json(response_data)))
+        commit_write(conn)
+        occupancy_cache.invalidate([stored_date])
+    except ReservationOperationError as e:
+        if conn: conn.rollback()
+        return operation_error_response(e)
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
+    except Exception as e:
+        if conn: conn.rollback()
+        app.logger.error(f"Error adding reservation: {e}", exc_info=True)
+        return bad_request_error(f"Error adding reservation: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: release_db_connection(conn)
+
     return jsonify(response_data), 201
 
+# Table allocation: the client sends the party size, date and time instead of a tid, and the
+# server picks the best-fitting free table, or a combination of tables (see table_allocator.py).
+# A combination is stored as one reservation per table, the party split across them.
+prepared.register('select_allocation_tables', "SELECT tid, table_number, capacity FROM tables")
+# Active bookings overlapping the two days from $1 (bookings last at most a day, see MAX_DURATION_MINUTES)
+prepared.register('select_day_bookings', """
+    SELECT tid, lower(reservation_period), upper(reservation_period)
+    FROM reservations
+    WHERE status = 'active'
+      AND reservation_date BETWEEN $1::date - 1 AND $1::date + 1
+      AND reservation_period && tsrange($1::date, $1::date + 2)
+""")
+
+def load_day_schedule(cursor, day):
+    prepared.execute(cursor, 'select_allocation_tables')
+    tables = cursor.fetchall()
+    prepared.execute(cursor, 'select_day_bookings', (day,))
+    return tables, cursor.fetchall()
+
+@app.route('/api/v1/reservations/allocate', methods=['POST'])
+def allocate_reservation():
+    data = request.json
+    required_fields = ['number_of_people', 'reservation_date', 'reservation_time', 'last_name', 'first_name', 'phone']
+    if not data or not all(field in data for field in required_fields):
+        missing_fields = [field for field in required_fields if not data or field not in data]
+        return bad_request_error(f"Missing required fields: {', '.join(missing_fields)}")
+    if 'tid' in data:
+        return bad_request_error("'tid' is chosen by the server; use POST /api/v1/reservations to book a given table")
+
+    num_people = data['number_of_people']
+    duration_val = data.get('duration_minutes', DEFAULT_DURATION_MINUTES)
+    if not isinstance(num_people, int) or num_people <= 0:
+        return bad_request_error("'number_of_people' must be a positive integer")
+    if not isinstance(duration_val, int) or not 0 < duration_val <= MAX_DURATION_MINUTES:
+        return bad_request_error(f"'duration_minutes' must be an integer from 1 to {MAX_DURATION_MINUTES}")
+    try:
+        res_date = date.fromisoformat(data['reservation_date'])
+        res_time = datetime.strptime(data['reservation_time'], '%H:%M:%S').time()
+    except (TypeError, ValueError):
+        return bad_request_error("'reservation_date' must be YYYY-MM-DD and 'reservation_time' HH:MM:SS")
+    start_minute = res_time.hour * 60 + res_time.minute
+
+    conn = None
+    cursor = None
+    try:
+        ensure_booking_listener()
+        conn = get_db_connection()
+        conn.autocommit = False
+        cursor = conn.cursor()
+        for attempt in range(1, MAX_ALLOCATION_ATTEMPTS + 1):
+            schedule = booking_index.schedule(res_date, lambda day: load_day_schedule(cursor, day))
+            tables = booking_index.allocate(schedule, start_minute, duration_val, num_people, ALLOCATION_MAX_TABLES)
+            if tables is None:
+                raise ReservationOperationError(
+                    409, f"No free table or combination of up to {ALLOCATION_MAX_TABLES} tables seats "
+                         f"{num_people} people on {res_date} at {res_time}.")
+            try:
+                allocated = []
+                for (tid, table_number, capacity), seats in zip(tables, split_party(num_people, tables)):
+                    body, stored_date = create_reservation_in_transaction(
+                        cursor, dict(data, tid=tid, number_of_people=seats, duration_minutes=duration_val))
+                    allocated.append({'rid': body['rid'], 'tid': tid, 'table_number': table_number,
+                                      'capacity': capacity, 'number_of_people': seats})
+                commit_write(conn)
+                break
+            except ReservationOperationError as e:
+                conn.rollback()
+                if not e.retryable or attempt == MAX_ALLOCATION_ATTEMPTS:
+                    raise
+                # Booked by someone else since the schedule was loaded
+                booking_index.invalidate([res_date])
+        occupancy_cache.invalidate([stored_date])
+        booking_index.invalidate([stored_date])
+    except ReservationOperationError as e:
+        if conn: conn.rollback()
+        return operation_error_response(e)
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
+    except Exception as e:
+        if conn: conn.rollback()
+        app.logger.error(f"Error allocating reservation: {e}", exc_info=True)
+        return bad_request_error(f"Error allocating reservation: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: release_db_connection(conn)
+
+    return jsonify({
+        'cid': body['cid'],
+        'reservation_date': data['reservation_date'],
+        'reservation_time': data['reservation_time'],
+        'duration_minutes': duration_val,
+        'number_of_people': num_people,
+        'tables': allocated,
+        'wasted_seats': sum(table['capacity'] for table in allocated) - num_people,
+        'message': 'Reservation allocated successfully'
+    }), 201
+
+# Bulk import of reservations from a CSV (with header) or NDJSON request body
+@app.route('/api/v1/reservations/import', methods=['POST'])
+def import_reservations_bulk():
+    fmt = request.args.get('format')
+    if not fmt:
+        content_type = request.mimetype or ''
+        if content_type == 'text/csv':
+            fmt = 'csv'
+        elif content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+            fmt = 'ndjson'
+        else:
+            return bad_request_error("Send the import as text/csv or application/x-ndjson, or pass ?format=csv|ndjson")
+    if fmt not in ('csv', 'ndjson'):
+        return bad_request_error(f"Unsupported import format '{fmt}', expected 'csv' or 'ndjson'")
+
+    try:
+        batch_size = int(request.args.get('batch_size', 5000))
+        if batch_size <= 0:
+            raise ValueError
+    except ValueError:
+        return bad_request_error("'batch_size' must be a positive integer")
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        report = import_reservations(conn, read_rows(stream, fmt), batch_size=batch_size)
+        # import_reservations commits each batch itself
+        record_write_lsn(conn)
+        occupancy_cache.invalidate()
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
+    except Exception as e:
+        app.logger.error(f"Error importing reservations: {e}", exc_info=True)
+        return bad_request_error(f"Error importing reservations: {e}")
+    finally:
+        if conn: release_db_connection(conn)
+
+    report['message'] = f"Imported {report['imported']} reservations, {report['failed']} rows failed"
+    return jsonify(report), 200
+
 # User Story 3: Cancel reservation
+prepared.register('delete_reservation', "DELETE FROM reservations WHERE rid = $1 RETURNING reservation_date")
+prepared.register('soft_cancel_reservation', """
+    UPDATE reservations SET status = 'cancelled' WHERE rid = $1 AND status = 'active' RETURNING reservation_date
+""")
+
+def cancel_reservation_in_transaction(cursor, rid):
+    # Returns the cancelled reservation's date; the caller commits or rolls back
+    if RESERVATION_CANCEL_MODE == 'soft':
+        prepared.execute(cursor, 'soft_cancel_reservation', (rid,))
+    else:
+        prepared.execute(cursor, 'delete_reservation', (rid,))
+    if cursor.rowcount == 0:
+        raise ReservationOperationError(404, f"Reservation with RID {rid} not found or already cancelled.")
+    return cursor.fetchone()[0]
+
 @app.route('/api/v1/reservations/<int:rid>', methods=['DELETE'])
 def cancel_reservation(rid):
     conn = None
@@ -163,133 +685,496 @@ def cancel_reservation(rid):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM reservations WHERE rid = %s", (rid,))
-        if cursor.rowcount == 0:
-            conn.rollback()
-            return not_found_error(f"Reservation with RID {rid} not found or already cancelled.")
-        conn.commit()
+        cancelled_date = cancel_reservation_in_transaction(cursor, rid)
+        commit_write(conn)
+        occupancy_cache.invalidate([cancelled_date])
+    except ReservationOperationError as e:
+        if conn: conn.rollback()
+        return operation_error_response(e)
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
     except Exception as e:
         if conn: conn.rollback()
         app.logger.error(f"Error cancelling reservation: {e}", exc_info=True)
         return bad_request_error(f"Error cancelling reservation: {e}")
     finally:
         if cursor: cursor.close()
-        if conn: conn.close()
+        if conn: release_db_connection(conn)
     return jsonify({'message': f'Reservation {rid} cancelled successfully'}), 200
 
-# User Story 4: Modify reservation (Fixed with manual serialization)
-@app.route('/api/v1/reservations/<int:rid>', methods=['PUT'])
-def modify_reservation(rid):
-    data = request.json
-    allowed_fields_to_update = {'tid', 'status', 'comment', 'number_of_people', 'reservation_date', 'reservation_time'}
-    
+# User Story 4: Modify reservation
+RESERVATION_COLUMNS = ('rid, tid, cid, status, comment, number_of_people, reservation_date, reservation_time, '
+                       'duration_minutes, created_at, updated_at')
+# Fixed order, so every combination of fields maps to one prepared UPDATE
+RESERVATION_UPDATE_FIELDS = ('tid', 'status', 'comment', 'number_of_people', 'reservation_date', 'reservation_time', 'duration_minutes')
+prepared.register('select_reservation', f"SELECT {RESERVATION_COLUMNS} FROM reservations WHERE rid = $1")
+
+RESERVATION_FIELDS = tuple(column.strip() for column in RESERVATION_COLUMNS.split(','))
+
+def reservation_to_dict(row):
+    # Just the reservation's own columns; the JSON provider serializes dates, times and timestamps
+    return {field: row[field] for field in RESERVATION_FIELDS}
+
+# ETags are the reservation's updated_at in microseconds since the epoch, which the
+# updated_at trigger changes with every update
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def reservation_etag(row):
+    return f'"{(row["updated_at"] - EPOCH) // timedelta(microseconds=1)}"'
+
+def parse_if_match(header):
+    # None for '*' (any current version), else the updated_at values the client accepts.
+    # If-Match compares strongly, so weak tags (W/"...") never match: they are left out, and a
+    # header of only weak tags accepts no version (412).
+    if header.strip() == '*':
+        return None
+    try:
+        return [EPOCH + timedelta(microseconds=int(tag.strip().strip('"'))) for tag in header.split(',')
+                if not tag.strip().startswith('W/')]
+    except ValueError:
+        raise ReservationOperationError(400, "'If-Match' must be '*' or ETags returned for this reservation")
+
+def update_reservation_statement(fields, conditional):
+    # One statement per combination of fields (and with / without If-Match), composed and registered
+    # on first use. The self-join locks the row and returns the date it had before the update;
+    # LIMIT 1 tells the planner that rid, unique but not the whole partition key, matches one row.
+    mask = sum(1 << i for i, field in enumerate(RESERVATION_UPDATE_FIELDS) if field in fields)
+    name = f'update_reservation_{mask}' + ('_if_match' if conditional else '')
+    if name not in prepared:
+        assignments = ', '.join(f"{field} = ${i}" for i, field in enumerate(fields, start=2))
+        condition = f" AND r.updated_at = ANY(${len(fields) + 2}::timestamptz[])" if conditional else ''
+        returning = ', '.join(f"r.{column.strip()}" for column in RESERVATION_COLUMNS.split(','))
+        prepared.register(name, f"""
+            UPDATE reservations r SET {assignments}
+            FROM (SELECT rid, reservation_date FROM reservations WHERE rid = $1 LIMIT 1 FOR UPDATE) previous
+            WHERE r.rid = previous.rid AND r.reservation_date = previous.reservation_date{condition}
+            RETURNING {returning}, previous.reservation_date AS previous_date
+        """)
+    return name
+
+def modify_reservation_in_transaction(cursor, rid, data, if_match=None):
+    # Needs a DictCursor. Returns (updated row, [old date, new date]); the caller commits or rolls back.
+    # With `if_match` (an If-Match header value) the update only applies to that version of the row.
+    allowed_fields_to_update = RESERVATION_UPDATE_FIELDS
     if not data or not any(field in data for field in allowed_fields_to_update):
-        return bad_request_error(f"At least one of the following fields is required for update: {', '.join(allowed_fields_to_update)}")
+        raise ReservationOperationError(400, f"At least one of the following fields is required for update: {', '.join(allowed_fields_to_update)}")
+    accepted_versions = parse_if_match(if_match) if if_match is not None else None
+
+    update_fields = [field_key for field_key in allowed_fields_to_update if field_key in data]
+    update_values = [rid] + [data[field_key] for field_key in update_fields]
+    if accepted_versions is not None:
+        update_values.append(accepted_versions)
+    try:
+        prepared.execute(cursor, update_reservation_statement(update_fields, accepted_versions is not None),
+                         tuple(update_values))
+    except IntegrityError as e:
+        if "reservations_no_overlap" in str(e).lower():
+            raise ReservationOperationError(409, f"Reservation {rid} would overlap another active reservation on the same table.")
+        app.logger.error(f"Integrity error: {e}", exc_info=True)
+        raise ReservationOperationError(409, f"Database error: {e}. Check if table exists.")
+    updated_res = cursor.fetchone()
+
+    if not updated_res:
+        if accepted_versions is not None:
+            # Only on failure: tell a missing reservation from a changed one
+            prepared.execute(cursor, 'select_reservation', (rid,))
+            if cursor.fetchone() is not None:
+                raise ReservationOperationError(412, f"Reservation {rid} was modified since it was read; fetch it again and retry.")
+        raise ReservationOperationError(404, f"Reservation with RID {rid} not found.")
+    return updated_res, [updated_res['previous_date'], updated_res['reservation_date']]
 
+@app.route('/api/v1/reservations/<int:rid>', methods=['GET'])
+def get_reservation(rid):
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor(cursor_factory=extras.DictCursor)
-        
-        cursor.execute("SELECT * FROM reservations WHERE rid = %s", (rid,))
-        current_reservation = cursor.fetchone()
-        if not current_reservation:
-            return not_found_error(f"Reservation with RID {rid} not found.")
-
-        update_fields_sql_parts = []
-        update_values = []
-
-        for field_key in allowed_fields_to_update:
-            if field_key in data:
-                update_fields_sql_parts.append(sql.SQL("{} = %s").format(sql.Identifier(field_key)))
-                update_values.append(data[field_key])
-        
-        if not update_fields_sql_parts:
-            return bad_request_error("No valid fields provided for update.")
+        prepared.execute(cursor, 'select_reservation', (rid,))
+        reservation = cursor.fetchone()
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
+    except Exception as e:
+        app.logger.error(f"Error fetching reservation: {e}", exc_info=True)
+        return bad_request_error(f"Error fetching reservation: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: release_db_connection(conn)
 
-        query = sql.SQL("UPDATE reservations SET {} WHERE rid = %s RETURNING *").format(
-            sql.SQL(', ').join(update_fields_sql_parts)
-        )
-        update_values.append(rid)
+    if reservation is None:
+        return not_found_error(f"Reservation with RID {rid} not found.")
+    response = make_response(jsonify(reservation), 200)
+    response.headers['ETag'] = reservation_etag(reservation)
+    return response
 
-        cursor.execute(query, tuple(update_values))
-        updated_res = cursor.fetchone()
+@app.route('/api/v1/reservations/<int:rid>', methods=['PUT'])
+def modify_reservation(rid):
+    data = request.json
+    if_match = request.headers.get('If-Match')
+    if if_match is None and RESERVATION_REQUIRE_IF_MATCH:
+        return precondition_required_error("Send the reservation's ETag in an 'If-Match' header")
 
-        if not updated_res:
-            conn.rollback()
-            return jsonify({'message': f'Reservation {rid} not modified'}), 400
-        
-        conn.commit()
-    except IntegrityError as e:
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=extras.DictCursor)
+        updated_res, changed_dates = modify_reservation_in_transaction(cursor, rid, data, if_match)
+        commit_write(conn)
+        occupancy_cache.invalidate(changed_dates)
+    except ReservationOperationError as e:
         if conn: conn.rollback()
-        app.logger.error(f"Integrity error: {e}", exc_info=True)
-        return conflict_error(f"Database error: {e}. Check if table exists.")
+        return operation_error_response(e)
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
     except Exception as e:
         if conn: conn.rollback()
         app.logger.error(f"Error modifying reservation: {e}", exc_info=True)
         return bad_request_error(f"Error: {e}")
     finally:
         if cursor: cursor.close()
-        if conn: conn.close()
-    
-    # Manually convert non-serializable objects to strings
-    response_data = {
-        'rid': updated_res['rid'],
-        'tid': updated_res['tid'],
-        'cid': updated_res['cid'],
-        'status': updated_res['status'],
-        'comment': updated_res['comment'],
-        'number_of_people': updated_res['number_of_people'],
-        'reservation_date': str(updated_res['reservation_date']) if updated_res['reservation_date'] else None,
-        'reservation_time': str(updated_res['reservation_time']) if updated_res['reservation_time'] else None,
-        'created_at': str(updated_res['created_at']) if updated_res['created_at'] else None,
-        'updated_at': str(updated_res['updated_at']) if updated_res['updated_at'] else None
-    }
+        if conn: release_db_connection(conn)
     
-    return jsonify({
+    response = make_response(jsonify({
         'message': f'Reservation {rid} modified successfully',
-        'reservation': response_data
+        'reservation': reservation_to_dict(updated_res)
+    }), 200)
+    response.headers['ETag'] = reservation_etag(updated_res)
+    return response
+
+# Several create / modify / cancel operations in one transaction on one connection.
+# Operations run in order; the first failing one rolls the whole batch back.
+MAX_BATCH_OPERATIONS = 100
+BATCH_OPERATIONS = ('create', 'modify', 'cancel')
+
+@app.route('/api/v1/batch', methods=['POST'])
+def run_batch():
+    data = request.json
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return bad_request_error("'operations' must be a non-empty list")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return bad_request_error(f"A batch may contain at most {MAX_BATCH_OPERATIONS} operations")
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+            return bad_request_error(f"Operation {index}: 'op' must be one of {', '.join(BATCH_OPERATIONS)}")
+        if operation['op'] != 'create' and not isinstance(operation.get('rid'), int):
+            return bad_request_error(f"Operation {index}: '{operation['op']}' requires an integer 'rid'")
+        if 'if_match' in operation and not isinstance(operation['if_match'], str):
+            return bad_request_error(f"Operation {index}: 'if_match' must be an ETag string")
+
+    results = []
+    changed_dates = []
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=extras.DictCursor)
+        for index, operation in enumerate(operations):
+            op = operation['op']
+            try:
+                if op == 'create':
+                    body, stored_date = create_reservation_in_transaction(cursor, operation.get('data') or {})
+                    changed_dates.append(stored_date)
+                    results.append({'op': op, 'status': 201, 'result': body})
+                elif op == 'modify':
+                    updated_res, dates = modify_reservation_in_transaction(cursor, operation['rid'], operation.get('data'),
+                                                                           operation.get('if_match'))
+                    changed_dates.extend(dates)
+                    results.append({'op': op, 'status': 200, 'result': {
+                        'message': f"Reservation {operation['rid']} modified successfully",
+                        'reservation': reservation_to_dict(updated_res)
+                    }})
+                else:
+                    changed_dates.append(cancel_reservation_in_transaction(cursor, operation['rid']))
+                    results.append({'op': op, 'status': 200, 'result': {
+                        'message': f"Reservation {operation['rid']} cancelled successfully"
+                    }})
+            except ReservationOperationError as e:
+                conn.rollback()
+                results.append({'op': op, 'status': e.status, 'error': e.details})
+                return make_response(jsonify({
+                    'message': f"Operation {index} failed, no operations were applied",
+                    'committed': False,
+                    'failed_index': index,
+                    'results': results
+                }), e.status)
+        commit_write(conn)
+        occupancy_cache.invalidate(changed_dates)
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
+    except Exception as e:
+        if conn: conn.rollback()
+        app.logger.error(f"Error running batch: {e}", exc_info=True)
+        return bad_request_error(f"Error running batch: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: release_db_connection(conn)
+
+    return jsonify({
+        'message': f"{len(results)} operations applied successfully",
+        'committed': True,
+        'results': results
+    }), 200
+
+# Opaque page cursor: the (reservation_date, rid) of the last row on the previous page
+def encode_page_cursor(reservation_date, rid):
+    return base64.urlsafe_b64encode(f"{reservation_date.isoformat()}:{rid}".encode()).decode()
+
+def decode_page_cursor(token):
+    try:
+        reservation_date, rid = base64.urlsafe_b64decode(token.encode()).decode().split(':')
+        return date.fromisoformat(reservation_date), int(rid)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid page cursor '{token}'")
+
+# List reservations with keyset pagination on (reservation_date, rid).
+# Filters: status, from, to (YYYY-MM-DD, inclusive). Pass the returned 'next_cursor'
+# as 'cursor' to get the following page. Rows are read from a server-side cursor and
+# streamed as chunked JSON, so a large page is never held in memory as a whole.
+@app.route('/api/v1/reservations', methods=['GET'])
+def list_reservations():
+    status = request.args.get('status')
+    if status is not None and status not in ('active', 'cancelled', 'completed'):
+        return bad_request_error("'status' must be one of active, cancelled, completed")
+    try:
+        from_date = date.fromisoformat(request.args['from']) if 'from' in request.args else None
+        to_date = date.fromisoformat(request.args['to']) if 'to' in request.args else None
+    except ValueError:
+        return bad_request_error("'from' and 'to' must be dates in YYYY-MM-DD format")
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        return bad_request_error(f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+    try:
+        after = decode_page_cursor(request.args['cursor']) if 'cursor' in request.args else None
+    except ValueError:
+        return bad_request_error("Invalid 'cursor'")
+
+    conditions = []
+    params = []
+    if after is not None:
+        # The plain date bound lets the planner skip partitions before the cursor
+        conditions.append(sql.SQL("reservation_date >= %s AND (reservation_date, rid) > (%s, %s)"))
+        params.extend((after[0], after[0], after[1]))
+    if status is not None:
+        conditions.append(sql.SQL("status = %s"))
+        params.append(status)
+    if from_date is not None:
+        conditions.append(sql.SQL("reservation_date >= %s"))
+        params.append(from_date)
+    if to_date is not None:
+        conditions.append(sql.SQL("reservation_date <= %s"))
+        params.append(to_date)
+    where_clause = sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    # One extra row tells us whether there is a next page
+    query = sql.SQL("SELECT {} FROM reservations {} ORDER BY reservation_date, rid LIMIT %s").format(
+        sql.SQL(RESERVATION_COLUMNS), where_clause)
+    params.append(limit + 1)
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_read_connection()
+        cursor = conn.cursor(name='list_reservations', cursor_factory=extras.RealDictCursor)
+        cursor.itersize = LISTING_FETCH_SIZE
+        cursor.execute(query, params)
+        first_rows = cursor.fetchmany(LISTING_FETCH_SIZE)
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
+    except Exception as e:
+        if cursor: cursor.close()
+        if conn: release_db_connection(conn)
+        app.logger.error(f"Error listing reservations: {e}", exc_info=True)
+        return bad_request_error(f"Error listing reservations: {e}")
+
+    def generate():
+        # The connection stays checked out until the last chunk is sent (or the client goes away)
+        try:
+            yield b'{"reservations": ['
+            sent = 0
+            last_row = None
+            has_more = False
+            rows = first_rows
+            while rows:
+                if sent + len(rows) > limit:
+                    has_more = True
+                    rows = rows[:limit - sent]
+                if rows:
+                    # One encoder call per chunk; the rows go out as they come from the cursor
+                    yield (b',' if sent else b'') + app.json.dumps_bytes(rows)[1:-1]
+                    sent += len(rows)
+                    last_row = rows[-1]
+                if has_more:
+                    break
+                rows = cursor.fetchmany(LISTING_FETCH_SIZE)
+            next_cursor = encode_page_cursor(last_row['reservation_date'], last_row['rid']) if has_more else None
+            yield b'], "next_cursor": ' + app.json.dumps_bytes(next_cursor) + b'}'
+        except Exception as e:
+            app.logger.error(f"Error streaming reservations: {e}", exc_info=True)
+            raise
+        finally:
+            cursor.close()
+            release_db_connection(conn)
+
+    return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+
+# List restaurant tables, keyset-paginated on tid
+prepared.register('select_tables_page', "SELECT tid, table_number, capacity FROM tables WHERE tid > $1 ORDER BY tid LIMIT $2")
+
+@app.route('/api/v1/tables', methods=['GET'])
+def list_restaurant_tables():
+    limit = request.args.get('limit', MAX_PAGE_SIZE, type=int)
+    after_tid = request.args.get('cursor', 0, type=int)
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        return bad_request_error(f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_read_connection()
+        cursor = conn.cursor()
+        prepared.execute(cursor, 'select_tables_page', (after_tid, limit + 1))
+        rows = cursor.fetchall()
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
+    except Exception as e:
+        app.logger.error(f"Error listing tables: {e}", exc_info=True)
+        return bad_request_error(f"Error listing tables: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: release_db_connection(conn)
+
+    tables_data = [{'tid': row[0], 'table_number': row[1], 'capacity': row[2]} for row in rows[:limit]]
+    next_cursor = tables_data[-1]['tid'] if len(rows) > limit else None
+    return jsonify({'tables': tables_data, 'next_cursor': next_cursor}), 200
+
+# Free tables for a party at a given date and time.
+# The anti-join probes the GiST index of reservations_no_overlap once per candidate table. A booking
+# lasts at most MAX_DURATION_MINUTES, so only the partitions of the day before through the end date can clash.
+prepared.register('select_available_tables', """
+    SELECT t.tid, t.table_number, t.capacity
+    FROM tables t
+    WHERE t.capacity >= $1
+      AND NOT EXISTS (
+          SELECT 1
+          FROM reservations r
+          WHERE r.tid = t.tid
+            AND r.status = 'active'
+            AND r.reservation_date BETWEEN $2::timestamp::date - 1 AND $3::timestamp::date
+            AND r.reservation_period && tsrange($2::timestamp, $3::timestamp)
+      )
+    ORDER BY t.capacity, t.table_number
+""")
+
+@app.route('/api/v1/availability', methods=['GET'])
+def get_availability():
+    res_date = request.args.get('date')
+    res_time = request.args.get('time')
+    party_size = request.args.get('party_size', type=int)
+    duration_val = request.args.get('duration_minutes', DEFAULT_DURATION_MINUTES, type=int)
+    if not res_date or not res_time or party_size is None:
+        return bad_request_error("'date', 'time' and 'party_size' query parameters are required")
+
+    try:
+        date.fromisoformat(res_date)
+        start = datetime.fromisoformat(f"{res_date}T{res_time}")
+    except ValueError:
+        return bad_request_error("'date' must be YYYY-MM-DD and 'time' HH:MM[:SS]")
+    if party_size <= 0 or duration_val <= 0:
+        return bad_request_error("'party_size' and 'duration_minutes' must be positive")
+    end = start + timedelta(minutes=duration_val)
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_read_connection()
+        cursor = conn.cursor()
+        prepared.execute(cursor, 'select_available_tables', (party_size, start, end))
+        free_tables = [
+            {'tid': row[0], 'table_number': row[1], 'capacity': row[2]}
+            for row in cursor.fetchall()
+        ]
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
+    except Exception as e:
+        app.logger.error(f"Error fetching availability: {e}", exc_info=True)
+        return bad_request_error(f"Error fetching availability: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: release_db_connection(conn)
+
+    return jsonify({
+        'date': res_date,
+        'time': res_time,
+        'duration_minutes': duration_val,
+        'party_size': party_size,
+        'available_tables': free_tables
     }), 200
 
 # User Story 5: Display occupancy for the next 7 days
+# Reads the occupancy_daily rollup maintained by triggers on reservations.
+# Optional 'from' and 'to' (YYYY-MM-DD, inclusive) select another window.
+prepared.register('select_occupancy', """
+    SELECT reservation_date, people
+    FROM occupancy_daily
+    WHERE reservation_date BETWEEN $1 AND $2
+    ORDER BY reservation_date
+""")
+
 @app.route('/api/v1/occupancy_next_7_days', methods=['GET'])
+@app.route('/api/v1/occupancy', methods=['GET'])
 def get_occupancy_next_7_days():
+    today = datetime.date(datetime.now())
+    try:
+        from_date = date.fromisoformat(request.args['from']) if 'from' in request.args else today
+        to_date = date.fromisoformat(request.args['to']) if 'to' in request.args else from_date + timedelta(days=6)
+    except ValueError:
+        return bad_request_error("'from' and 'to' must be dates in YYYY-MM-DD format")
+    if to_date < from_date:
+        return bad_request_error("'to' must not be before 'from'")
+    if (to_date - from_date).days >= MAX_OCCUPANCY_WINDOW_DAYS:
+        return bad_request_error(f"The occupancy window is limited to {MAX_OCCUPANCY_WINDOW_DAYS} days")
+
+    cache_key = (from_date, to_date)
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        ensure_occupancy_listener()
+        occupancy_data = occupancy_cache.get(cache_key)
+        if occupancy_data is not None:
+            return jsonify({'occupancy_by_day': occupancy_data}), 200
+        cache_generation = occupancy_cache.generation()
+
+        conn = get_read_connection(occupancy_cache.min_lsn)
         cursor = conn.cursor()
-        query = """
-            SELECT
-                reservation_date,
-                COALESCE(SUM(number_of_people), 0) AS people_on_day
-            FROM
-                reservations
-            WHERE
-                status = 'active'
-                AND reservation_date BETWEEN CURRENT_DATE AND CURRENT_DATE + interval '6 days'
-            GROUP BY reservation_date
-            ORDER BY reservation_date;
-        """
-        cursor.execute(query)
+        prepared.execute(cursor, 'select_occupancy', (from_date, to_date))
         results = cursor.fetchall()
         
         occupancy_data = {}
-        today = datetime.date(datetime.now())
-        for i in range(7):
-            current_date = today + timedelta(days=i)
+        for i in range((to_date - from_date).days + 1):
+            current_date = from_date + timedelta(days=i)
             occupancy_data[current_date.strftime('%Y-%m-%d')] = 0
 
         for row in results:
             occupancy_data[row[0].strftime('%Y-%m-%d')] = row[1]
+        occupancy_cache.put(cache_key, occupancy_data, cache_generation)
 
+    except PoolTimeout as e:
+        app.logger.warning(f"Database pool exhausted: {e}")
+        return service_unavailable_error(str(e))
     except Exception as e:
         app.logger.error(f"Error fetching occupancy: {e}", exc_info=True)
         return bad_request_error(f"Error fetching occupancy: {e}")
     finally:
         if cursor: cursor.close()
-        if conn: conn.close()
+        if conn: release_db_connection(conn)
 
     return jsonify({'occupancy_by_day': occupancy_data}), 200
 
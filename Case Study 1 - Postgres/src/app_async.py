@@ -0,0 +1,293 @@
+from quart import Quart, request, jsonify, make_response
+import asyncio
+import asyncpg
+import os
+from dotenv import load_dotenv  # Import load_dotenv
+from datetime import date, datetime, time, timedelta
+import json_encoding
+
+load_dotenv()  # Load environment variables from .env file
+
+# Async edition of app.py: the same five user-story endpoints with the same
+# request and response contracts, served by an ASGI server on asyncpg.
+# Run with: uvicorn app_async:app --port 5000
+app = Quart(__name__)
+# Request and response bodies: JSON_ENCODER=auto (orjson when installed), orjson or stdlib
+json_encoding.install(app, os.getenv('JSON_ENCODER', 'auto'))
+
+DEFAULT_DURATION_MINUTES = 120
+MAX_OCCUPANCY_WINDOW_DAYS = 366
+RESERVATION_COLUMNS = ('rid, tid, cid, status, comment, number_of_people, reservation_date, reservation_time, '
+                       'duration_minutes, created_at, updated_at')
+RESERVATION_FIELDS = tuple(column.strip() for column in RESERVATION_COLUMNS.split(','))
+RESERVATION_UPDATE_FIELDS = ('tid', 'status', 'comment', 'number_of_people', 'reservation_date', 'reservation_time', 'duration_minutes')
+# 'soft' marks cancelled reservations as status 'cancelled', 'delete' removes them (see app.py)
+RESERVATION_CANCEL_MODE = os.getenv('RESERVATION_CANCEL_MODE', 'soft')
+
+# Database connection pool, opened when the server starts
+db_pool = None
+db_pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+
+@app.before_serving
+async def open_db_pool():
+    global db_pool
+    db_name = os.getenv('DB_NAME')
+    db_user = os.getenv('DB_USER')
+    db_password = os.getenv('DB_PASSWORD')
+    db_host = os.getenv('DB_HOST')
+    db_port = os.getenv('DB_PORT')
+
+    if not all([db_name, db_user, db_password, db_host, db_port]):
+        missing_vars = [var for var, val in {
+            "DB_NAME": db_name, "DB_USER": db_user, "DB_PASSWORD": db_password,
+            "DB_HOST": db_host, "DB_PORT": db_port
+        }.items() if not val]
+        raise ValueError(f"Missing database configuration in .env or environment: {', '.join(missing_vars)}")
+
+    # asyncpg prepares every statement once per connection and caches it by query text
+    db_pool = await asyncpg.create_pool(
+        database=db_name,
+        user=db_user,
+        password=db_password,
+        host=db_host,
+        port=int(db_port),
+        min_size=int(os.getenv('DB_POOL_MIN', '1')),
+        max_size=int(os.getenv('DB_POOL_MAX', '10'))
+    )
+
+@app.after_serving
+async def close_db_pool():
+    if db_pool is not None:
+        await db_pool.close()
+
+def get_db_connection():
+    # Use as `async with get_db_connection() as conn:`; raises asyncio.TimeoutError when the pool is exhausted
+    return db_pool.acquire(timeout=db_pool_timeout)
+
+async def error_response(message, details, status):
+    return await make_response(jsonify({"message": message, "details": str(details)}), status)
+
+async def bad_request_error(details):
+    return await error_response("Bad Request", details, 400)
+
+async def not_found_error(details):
+    return await error_response("Not Found", details, 404)
+
+async def conflict_error(details):
+    return await error_response("Conflict", details, 409)
+
+async def service_unavailable_error(details):
+    return await error_response("Service Unavailable", details, 503)
+
+def reservation_to_dict(row):
+    # Just the reservation's own columns; the JSON provider serializes dates, times and timestamps
+    return {field: row[field] for field in RESERVATION_FIELDS}
+
+def parse_reservation_values(data):
+    # asyncpg binds typed values, so dates and times are parsed up front
+    values = dict(data)
+    if 'reservation_date' in values:
+        values['reservation_date'] = date.fromisoformat(values['reservation_date'])
+    if 'reservation_time' in values:
+        values['reservation_time'] = time.fromisoformat(values['reservation_time'])
+    return values
+
+# User Story 1: Create tables (Restaurant Tables)
+@app.route('/api/v1/tables', methods=['POST'])
+async def create_restaurant_table():
+    data = await request.get_json()
+    if not data or 'capacity' not in data or 'table_number' not in data:
+        return await bad_request_error("'capacity' and 'table_number' are required fields")
+
+    capacity_val = data['capacity']
+    table_number_str = data['table_number']
+
+    try:
+        async with get_db_connection() as conn:
+            table_id = await conn.fetchval(
+                "INSERT INTO tables (capacity, table_number) VALUES ($1, $2) RETURNING tid",
+                capacity_val, table_number_str)
+    except asyncpg.UniqueViolationError as e:
+        if e.constraint_name == 'tables_table_number_key':
+            return await conflict_error(f"Table with number '{table_number_str}' already exists.")
+        return await conflict_error(f"Database integrity error: {e}")
+    except asyncio.TimeoutError:
+        return await service_unavailable_error("Timed out waiting for a database connection")
+    except Exception as e:
+        app.logger.error(f"Error creating table: {e}", exc_info=True)
+        return await bad_request_error(f"Error creating table: {e}")
+
+    return jsonify({'tid': table_id, 'message': 'Table created successfully'}), 201
+
+# User Story 2: Add new reservation
+# One round trip: upsert the customer by phone and insert the reservation,
+# leaving the table check to the tid foreign key
+CREATE_RESERVATION_SQL = """
+    WITH new_customer AS (
+        INSERT INTO customers (last_name, first_name, phone)
+        VALUES ($1::varchar, $2::varchar, $3::varchar)
+        ON CONFLICT (phone) DO NOTHING
+        RETURNING cid
+    ), customer AS (
+        SELECT cid FROM new_customer
+        UNION ALL
+        SELECT cid FROM customers WHERE phone = $3::varchar
+    )
+    INSERT INTO reservations (tid, cid, status, comment, number_of_people, reservation_date, reservation_time, duration_minutes)
+    SELECT $4::integer, cid, 'active', $5::text, $6::integer, $7::date, $8::time, $9::integer
+    FROM customer
+    LIMIT 1
+    RETURNING rid, cid
+"""
+
+@app.route('/api/v1/reservations', methods=['POST'])
+async def add_reservation():
+    data = await request.get_json()
+    required_fields = ['tid', 'number_of_people', 'reservation_date', 'reservation_time', 'last_name', 'first_name', 'phone']
+    if not all(field in data for field in required_fields):
+        missing_fields = [field for field in required_fields if field not in data]
+        return await bad_request_error(f"Missing required fields: {', '.join(missing_fields)}")
+
+    table_id_val = data['tid']
+    num_people = data['number_of_people']
+    res_date = data['reservation_date']
+    res_time = data['reservation_time']
+    phone_str = data['phone']
+    duration_val = data.get('duration_minutes', DEFAULT_DURATION_MINUTES)
+
+    try:
+        values = parse_reservation_values(data)
+        create_params = (data['last_name'], data['first_name'], phone_str, table_id_val, data.get('comment', ''),
+                         num_people, values['reservation_date'], values['reservation_time'], duration_val)
+        async with get_db_connection() as conn:
+            created_row = await conn.fetchrow(CREATE_RESERVATION_SQL, *create_params)
+            if created_row is None:
+                # A concurrent request inserted this phone number after our snapshot; the retry sees it
+                created_row = await conn.fetchrow(CREATE_RESERVATION_SQL, *create_params)
+        reservation_id_val, customer_id_val = created_row['rid'], created_row['cid']
+    except asyncpg.ExclusionViolationError:
+        return await conflict_error(f"Table with TID {table_id_val} is already booked on {res_date} around {res_time}.")
+    except asyncpg.ForeignKeyViolationError:
+        return await bad_request_error(f"Table with TID {table_id_val} does not exist.")
+    except asyncpg.IntegrityConstraintViolationError as e:
+        app.logger.error(f"Database integrity error: {e}", exc_info=True)
+        return await conflict_error(f"Database integrity error: {e}")
+    except asyncio.TimeoutError:
+        return await service_unavailable_error("Timed out waiting for a database connection")
+    except Exception as e:
+        app.logger.error(f"Error adding reservation: {e}", exc_info=True)
+        return await bad_request_error(f"Error adding reservation: {e}")
+
+    response_data = {
+        'rid': reservation_id_val,
+        'cid': customer_id_val,
+        'tid': table_id_val,
+        'reservation_date': res_date,
+        'reservation_time': res_time,
+        'duration_minutes': duration_val,
+        'number_of_people': num_people,
+        'message': 'Reservation created successfully'
+    }
+    return jsonify(response_data), 201
+
+# User Story 3: Cancel reservation
+@app.route('/api/v1/reservations/<int:rid>', methods=['DELETE'])
+async def cancel_reservation(rid):
+    try:
+        async with get_db_connection() as conn:
+            if RESERVATION_CANCEL_MODE == 'soft':
+                cancelled = await conn.fetchval(
+                    "UPDATE reservations SET status = 'cancelled' WHERE rid = $1 AND status = 'active' RETURNING rid", rid)
+            else:
+                cancelled = await conn.fetchval("DELETE FROM reservations WHERE rid = $1 RETURNING rid", rid)
+        if cancelled is None:
+            return await not_found_error(f"Reservation with RID {rid} not found or already cancelled.")
+    except asyncio.TimeoutError:
+        return await service_unavailable_error("Timed out waiting for a database connection")
+    except Exception as e:
+        app.logger.error(f"Error cancelling reservation: {e}", exc_info=True)
+        return await bad_request_error(f"Error cancelling reservation: {e}")
+    return jsonify({'message': f'Reservation {rid} cancelled successfully'}), 200
+
+# User Story 4: Modify reservation
+@app.route('/api/v1/reservations/<int:rid>', methods=['PUT'])
+async def modify_reservation(rid):
+    data = await request.get_json()
+    allowed_fields_to_update = RESERVATION_UPDATE_FIELDS
+
+    if not data or not any(field in data for field in allowed_fields_to_update):
+        return await bad_request_error(f"At least one of the following fields is required for update: {', '.join(allowed_fields_to_update)}")
+
+    update_fields = [field_key for field_key in allowed_fields_to_update if field_key in data]
+    assignments = ', '.join(f"{field} = ${i}" for i, field in enumerate(update_fields, start=2))
+    query = f"UPDATE reservations SET {assignments} WHERE rid = $1 RETURNING {RESERVATION_COLUMNS}"
+
+    try:
+        values = parse_reservation_values(data)
+        async with get_db_connection() as conn:
+            updated_res = await conn.fetchrow(query, rid, *[values[field_key] for field_key in update_fields])
+        if not updated_res:
+            return await not_found_error(f"Reservation with RID {rid} not found.")
+    except asyncpg.ExclusionViolationError:
+        return await conflict_error(f"Reservation {rid} would overlap another active reservation on the same table.")
+    except asyncpg.IntegrityConstraintViolationError as e:
+        app.logger.error(f"Integrity error: {e}", exc_info=True)
+        return await conflict_error(f"Database error: {e}. Check if table exists.")
+    except asyncio.TimeoutError:
+        return await service_unavailable_error("Timed out waiting for a database connection")
+    except Exception as e:
+        app.logger.error(f"Error modifying reservation: {e}", exc_info=True)
+        return await bad_request_error(f"Error: {e}")
+
+    return jsonify({
+        'message': f'Reservation {rid} modified successfully',
+        'reservation': reservation_to_dict(updated_res)
+    }), 200
+
+# User Story 5: Display occupancy for the next 7 days
+# Reads the occupancy_daily rollup; optional 'from' and 'to' select another window.
+@app.route('/api/v1/occupancy_next_7_days', methods=['GET'])
+@app.route('/api/v1/occupancy', methods=['GET'])
+async def get_occupancy_next_7_days():
+    today = datetime.date(datetime.now())
+    try:
+        from_date = date.fromisoformat(request.args['from']) if 'from' in request.args else today
+        to_date = date.fromisoformat(request.args['to']) if 'to' in request.args else from_date + timedelta(days=6)
+    except ValueError:
+        return await bad_request_error("'from' and 'to' must be dates in YYYY-MM-DD format")
+    if to_date < from_date:
+        return await bad_request_error("'to' must not be before 'from'")
+    if (to_date - from_date).days >= MAX_OCCUPANCY_WINDOW_DAYS:
+        return await bad_request_error(f"The occupancy window is limited to {MAX_OCCUPANCY_WINDOW_DAYS} days")
+
+    try:
+        async with get_db_connection() as conn:
+            results = await conn.fetch(
+                """
+                SELECT reservation_date, people
+                FROM occupancy_daily
+                WHERE reservation_date BETWEEN $1 AND $2
+                ORDER BY reservation_date
+                """,
+                from_date, to_date)
+    except asyncio.TimeoutError:
+        return await service_unavailable_error("Timed out waiting for a database connection")
+    except Exception as e:
+        app.logger.error(f"Error fetching occupancy: {e}", exc_info=True)
+        return await bad_request_error(f"Error fetching occupancy: {e}")
+
+    occupancy_data = {}
+    for i in range((to_date - from_date).days + 1):
+        current_date = from_date + timedelta(days=i)
+        occupancy_data[current_date.strftime('%Y-%m-%d')] = 0
+
+    for row in results:
+        occupancy_data[row['reservation_date'].strftime('%Y-%m-%d')] = row['people']
+
+    return jsonify({'occupancy_by_day': occupancy_data}), 200
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.INFO)
+    app.logger.info("Starting Quart application...")
+    app.run(debug=True)
@@ -0,0 +1,180 @@
+from quart import Quart, request, jsonify
+from sqlalchemy import select, func
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import os
+from dotenv import load_dotenv
+from datetime import date, datetime, time, timedelta
+import json_encoding
+from orm_models import Table, Customer, Reservation
+from orm_pool import PoolTelemetry, TimedAsyncAdaptedQueuePool, database_url, pool_options_from_env
+
+load_dotenv()
+
+# Async edition of app_with_orm.py: the same five user-story endpoints with the same request
+# and response contracts and the same models, through an AsyncEngine on asyncpg.
+# Run with: uvicorn app_orm_async:app --port 5000
+app = Quart(__name__)
+json_encoding.install(app, os.getenv('JSON_ENCODER', 'auto'))
+
+pool_telemetry = PoolTelemetry()
+
+# The ORM_POOL_* settings size this pool too; a checkout waits on the event loop, not a thread
+engine = create_async_engine(
+    database_url('asyncpg'),
+    poolclass=TimedAsyncAdaptedQueuePool,
+    **pool_options_from_env(),
+)
+engine.pool.telemetry = pool_telemetry
+pool_telemetry.attach(engine.sync_engine)
+# Nothing may be loaded implicitly in an AsyncSession, so objects keep their state after commit
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+@app.after_serving
+async def dispose_engine():
+    await engine.dispose()
+
+def pool_timeout_response(error):
+    app.logger.warning(f"Database pool exhausted: {error}")
+    return jsonify({"message": "Service Unavailable", "details": str(error)}), 503
+
+def parse_reservation_values(data):
+    # asyncpg binds typed values, so dates and times are parsed up front (see app_async.py)
+    values = dict(data)
+    if 'reservation_date' in values:
+        values['reservation_date'] = date.fromisoformat(values['reservation_date'])
+    if 'reservation_time' in values:
+        values['reservation_time'] = time.fromisoformat(values['reservation_time'])
+    return values
+
+# Connection pool statistics, for sizing the pool per worker
+@app.route('/api/v1/pool_stats', methods=['GET'])
+async def get_pool_stats():
+    return jsonify(pool_telemetry.stats(engine.pool)), 200
+
+# User Story 1: Create table
+@app.route('/api/v1/tables', methods=['POST'])
+async def create_restaurant_table():
+    data = await request.get_json()
+    if not data or 'capacity' not in data or 'table_number' not in data:
+        return jsonify({"message": "Missing required fields"}), 400
+
+    try:
+        async with Session() as session:
+            new_table = Table(capacity=data['capacity'], table_number=data['table_number'])
+            session.add(new_table)
+            await session.commit()
+        return jsonify({'tid': new_table.tid, 'message': 'Table created successfully'}), 201
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+# User Story 2: Add new reservation
+@app.route('/api/v1/reservations', methods=['POST'])
+async def add_reservation():
+    data = await request.get_json()
+    required = ['tid', 'number_of_people', 'reservation_date', 'reservation_time', 'last_name', 'first_name', 'phone']
+    if not all(field in data for field in required):
+        return jsonify({"message": "Missing required fields"}), 400
+
+    try:
+        values = parse_reservation_values(data)
+        async with Session() as session:
+            table = await session.get(Table, data['tid'])
+            if not table:
+                return jsonify({"message": f"Table {data['tid']} not found"}), 400
+
+            customer = await session.scalar(select(Customer).where(Customer.phone == data['phone']))
+            if not customer:
+                customer = Customer(last_name=data['last_name'], first_name=data['first_name'], phone=data['phone'])
+                session.add(customer)
+                await session.flush()
+
+            reservation = Reservation(
+                tid=data['tid'], cid=customer.cid, status='active',
+                comment=data.get('comment', ''), number_of_people=data['number_of_people'],
+                reservation_date=values['reservation_date'], reservation_time=values['reservation_time'],
+                duration_minutes=data.get('duration_minutes', 120)
+            )
+            session.add(reservation)
+            await session.commit()
+        return jsonify({
+            'rid': reservation.rid, 'cid': customer.cid, 'tid': data['tid'],
+            'reservation_date': data['reservation_date'], 'reservation_time': data['reservation_time'],
+            'duration_minutes': reservation.duration_minutes,
+            'number_of_people': data['number_of_people'], 'message': 'Reservation created successfully'
+        }), 201
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+# User Story 3: Cancel reservation
+@app.route('/api/v1/reservations/<int:rid>', methods=['DELETE'])
+async def cancel_reservation(rid):
+    try:
+        async with Session() as session:
+            reservation = await session.get(Reservation, rid)
+            if not reservation:
+                return jsonify({"message": f"Reservation {rid} not found"}), 404
+            await session.delete(reservation)
+            await session.commit()
+        return jsonify({'message': f'Reservation {rid} cancelled successfully'}), 200
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+# User Story 4: Modify reservation
+@app.route('/api/v1/reservations/<int:rid>', methods=['PUT'])
+async def modify_reservation(rid):
+    data = await request.get_json()
+    allowed_fields = {'tid', 'status', 'comment', 'number_of_people', 'reservation_date', 'reservation_time', 'duration_minutes'}
+    if not data or not any(field in data for field in allowed_fields):
+        return jsonify({"message": "No valid fields provided for update"}), 400
+
+    try:
+        values = parse_reservation_values(data)
+        async with Session() as session:
+            reservation = await session.get(Reservation, rid)
+            if not reservation:
+                return jsonify({"message": f"Reservation {rid} not found"}), 404
+            for field in allowed_fields:
+                if field in values:
+                    setattr(reservation, field, values[field])
+            # The new updated_at and reservation_period come back with the UPDATE (eager_defaults)
+            await session.commit()
+        return jsonify({
+            'message': f'Reservation {rid} modified successfully',
+            'reservation': reservation
+        }), 200
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+# User Story 5: Display occupancy for the next 7 days
+@app.route('/api/v1/occupancy_next_7_days', methods=['GET'])
+async def get_occupancy_next_7_days():
+    try:
+        today = datetime.now().date()
+        end_date = today + timedelta(days=6)
+        statement = (select(Reservation.reservation_date, func.sum(Reservation.number_of_people).label('people_on_day'))
+                     .where(Reservation.status == 'active', Reservation.reservation_date.between(today, end_date))
+                     .group_by(Reservation.reservation_date)
+                     .order_by(Reservation.reservation_date))
+        async with Session() as session:
+            results = (await session.execute(statement)).all()
+
+        occupancy_data = { (today + timedelta(days=i)).strftime('%Y-%m-%d'): 0 for i in range(7) }
+        for row in results:
+            occupancy_data[row[0].strftime('%Y-%m-%d')] = row[1]
+        return jsonify({'occupancy_by_day': occupancy_data}), 200
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+if __name__ == '__main__':
+    app.run(debug=True)
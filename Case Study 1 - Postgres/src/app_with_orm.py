@@ -1,48 +1,134 @@
-from flask import Flask, request, jsonify
-from sqlalchemy import create_engine, Column, Integer, String, Date, Text, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from flask import Flask, request, jsonify, Response, g
+from sqlalchemy import create_engine, tuple_, select, insert, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import TimeoutError as PoolTimeout, DBAPIError
+from sqlalchemy.orm import sessionmaker, scoped_session, joinedload, selectinload
+import base64
+import io
 import os
+from itertools import islice
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from sqlalchemy.sql import func
+import json_encoding
+from bulk_import import read_rows, validate_record, DEFAULT_BATCH_SIZE, MAX_REPORTED_ERRORS
+from metrics import RequestMetrics, InstrumentedConnection, render_samples
+from orm_models import Table, Customer, Reservation
+from orm_profile import QueryProfiler
+from orm_pool import PoolTelemetry, TimedQueuePool, database_url, pool_options_from_env
 
 load_dotenv()
 
 app = Flask(__name__)
+# Request and response bodies: JSON_ENCODER=auto (orjson when installed), orjson or stdlib
+json_encoding.install(app, os.getenv('JSON_ENCODER', 'auto'))
 
-# Database setup
-db_url = f"postgresql+psycopg2://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-engine = create_engine(db_url)
-Base = declarative_base()
-Session = sessionmaker(bind=engine)
-
-# Models
-class Table(Base):
-    __tablename__ = 'tables'
-    tid = Column(Integer, primary_key=True)
-    table_number = Column(String(255), unique=True, nullable=False)
-    capacity = Column(Integer, nullable=False)
-
-class Customer(Base):
-    __tablename__ = 'customers'
-    cid = Column(Integer, primary_key=True)
-    last_name = Column(String(255), nullable=False)
-    first_name = Column(String(255))
-    phone = Column(String(50), unique=True, nullable=False)
-
-class Reservation(Base):
-    __tablename__ = 'reservations'
-    rid = Column(Integer, primary_key=True)
-    tid = Column(Integer, nullable=False)
-    cid = Column(Integer, nullable=False)
-    status = Column(String(50), default='active', nullable=False)
-    comment = Column(Text)
-    number_of_people = Column(Integer, nullable=False)
-    reservation_date = Column(Date, nullable=False)
-    reservation_time = Column(String(8), nullable=False)
-    created_at = Column(DateTime, default=func.current_timestamp(), nullable=False)
-    updated_at = Column(DateTime, default=func.current_timestamp(), onupdate=func.current_timestamp(), nullable=False)
+# Request latency, DB time and connection wait time, served on /metrics (per worker process)
+metrics = RequestMetrics(enabled=os.getenv('METRICS_ENABLED', 'true').lower() == 'true')
+pool_telemetry = PoolTelemetry(on_wait=metrics.observe_acquire)
+
+# QueuePool per worker process: pool_size connections kept open, up to max_overflow more under load
+engine = create_engine(
+    database_url('psycopg2'),
+    poolclass=TimedQueuePool,
+    connect_args={'connection_factory': InstrumentedConnection} if metrics.enabled else {},
+    **pool_options_from_env(),
+)
+engine.pool.telemetry = pool_telemetry
+pool_telemetry.attach(engine)
+# One session per request: handlers call Session() as often as they like and get the same one,
+# and remove_session() closes it when the request ends, returning its connection to the pool
+session_factory = sessionmaker(bind=engine)
+Session = scoped_session(session_factory)
+
+# ORM_PROFILE=true splits each request's SQL time into compilation, execution and result
+# processing, served on /api/v1/profile. It buffers every SELECT result; not for production.
+profiler = QueryProfiler(enabled=os.getenv('ORM_PROFILE', 'false').lower() == 'true')
+profiler.attach(engine, session_factory)
+
+# Listing endpoint: default and maximum page size. Customers of a page are loaded with one
+# selectin query, which SQLAlchemy batches per 500 keys, so a page never needs more than one.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    Session.remove()
+
+# Statements of the per-request hot paths, built as lambdas: SQLAlchemy caches each one by the
+# lambda's code location, so the select() is constructed and its cache key computed once per
+# process, and later calls only pull their bound values (tid, phone, rid, dates) out of the closure.
+def table_by_tid(session, tid):
+    return session.scalars(lambda_stmt(lambda: select(Table).where(Table.tid == tid).limit(1))).first()
+
+def customer_by_phone(session, phone):
+    return session.scalars(lambda_stmt(lambda: select(Customer).where(Customer.phone == phone).limit(1))).first()
+
+def reservation_by_rid(session, rid):
+    return session.scalars(lambda_stmt(lambda: select(Reservation).where(Reservation.rid == rid).limit(1))).first()
+
+def occupancy_by_day(session, first_day, last_day):
+    return session.execute(lambda_stmt(lambda: (
+        select(Reservation.reservation_date, func.sum(Reservation.number_of_people).label('people_on_day'))
+        .where(Reservation.status == 'active', Reservation.reservation_date.between(first_day, last_day))
+        .group_by(Reservation.reservation_date)
+        .order_by(Reservation.reservation_date)))).all()
+
+def pool_timeout_response(error):
+    app.logger.warning(f"Database pool exhausted: {error}")
+    return jsonify({"message": "Service Unavailable", "details": str(error)}), 503
+
+@app.before_request
+def begin_request_metrics():
+    g.metrics_started = metrics.begin_request()
+    g.profile_started = profiler.begin_request()
+
+@app.after_request
+def end_request_metrics(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        method = request.method
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = response.status_code
+        response.call_on_close(lambda: metrics.end_request(started, method, route, status))
+    profile_started = g.pop('profile_started', None)
+    if profile_started is not None:
+        profiler.end_request(profile_started, request.method,
+                             request.url_rule.rule if request.url_rule else 'unmatched')
+    return response
+
+# Prometheus metrics for this worker process
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    pool_stats = pool_telemetry.stats(engine.pool)
+    extra_lines = (
+        render_samples('gauge', 'reservations_db_pool_connections', 'Pooled connections by state.',
+                       {'in_use': pool_stats['in_use'], 'idle': pool_stats['idle']}, labelname='state')
+        + render_samples('gauge', 'reservations_db_pool_overflow', 'Connections open beyond pool_size.',
+                         pool_stats['overflow'])
+        + render_samples('counter', 'reservations_db_pool_checkouts_total', 'Connection checkouts.',
+                         pool_stats['checkouts'])
+        + render_samples('counter', 'reservations_db_pool_timeouts_total', 'Checkouts that timed out.',
+                         pool_stats['timeouts'])
+        + render_samples('counter', 'reservations_db_pool_invalidations_total',
+                         'Connections discarded as broken (e.g. by pre-ping).', pool_stats['invalidations'])
+    )
+    return Response(metrics.render(extra_lines), status=200, mimetype='text/plain; version=0.0.4')
+
+# Connection pool statistics, for sizing the pool per worker
+@app.route('/api/v1/pool_stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(pool_telemetry.stats(engine.pool)), 200
+
+# Where each endpoint's SQL time goes (ORM_PROFILE=true); DELETE starts a new measurement
+@app.route('/api/v1/profile', methods=['GET', 'DELETE'])
+def get_profile():
+    if not profiler.enabled:
+        return jsonify({"message": "Profiling is off, start the app with ORM_PROFILE=true"}), 404
+    if request.method == 'DELETE':
+        profiler.reset()
+        return jsonify({'message': 'Profile reset'}), 200
+    return jsonify({'endpoints': profiler.report()}), 200
 
 # User Story 1: Create table
 @app.route('/api/v1/tables', methods=['POST'])
@@ -59,11 +145,11 @@ def create_restaurant_table():
         table_id = new_table.tid
         session.commit()
         return jsonify({'tid': table_id, 'message': 'Table created successfully'}), 201
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
     except Exception as e:
         session.rollback()
         return jsonify({"message": str(e)}), 400
-    finally:
-        session.close()
 
 # User Story 2: Add new reservation
 @app.route('/api/v1/reservations', methods=['POST'])
@@ -75,11 +161,11 @@ def add_reservation():
 
     session = Session()
     try:
-        table = session.query(Table).filter_by(tid=data['tid']).first()
+        table = table_by_tid(session, data['tid'])
         if not table:
             return jsonify({"message": f"Table {data['tid']} not found"}), 400
 
-        customer = session.query(Customer).filter_by(phone=data['phone']).first()
+        customer = customer_by_phone(session, data['phone'])
         if not customer:
             customer = Customer(last_name=data['last_name'], first_name=data['first_name'], phone=data['phone'])
             session.add(customer)
@@ -88,7 +174,8 @@ def add_reservation():
         reservation = Reservation(
             tid=data['tid'], cid=customer.cid, status='active',
             comment=data.get('comment', ''), number_of_people=data['number_of_people'],
-            reservation_date=data['reservation_date'], reservation_time=data['reservation_time']
+            reservation_date=data['reservation_date'], reservation_time=data['reservation_time'],
+            duration_minutes=data.get('duration_minutes', 120)
         )
         session.add(reservation)
         session.flush()
@@ -97,42 +184,176 @@ def add_reservation():
         return jsonify({
             'rid': reservation_id, 'cid': customer.cid, 'tid': data['tid'],
             'reservation_date': data['reservation_date'], 'reservation_time': data['reservation_time'],
+            'duration_minutes': reservation.duration_minutes,
             'number_of_people': data['number_of_people'], 'message': 'Reservation created successfully'
         }), 201
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
     except Exception as e:
         session.rollback()
         return jsonify({"message": str(e)}), 400
-    finally:
-        session.close()
+
+# Bulk import. Rows are written with Core INSERT statements executed through the session:
+# no ORM objects are created, so nothing goes through the unit of work or the identity map.
+def resolve_customers(session, rows):
+    """phone -> cid for the rows' customers, inserting the unknown ones, in one statement."""
+    customers = {}
+    for row in rows:
+        customers.setdefault(row['phone'], {'last_name': row['last_name'], 'first_name': row['first_name'],
+                                            'phone': row['phone']})
+    # As in app.py's create_reservation: the upsert returns the customers it inserted, the
+    # SELECT (which cannot see those yet) the ones that already existed
+    new_customers = (pg_insert(Customer).values(list(customers.values()))
+                     .on_conflict_do_nothing(index_elements=[Customer.phone])
+                     .returning(Customer.phone, Customer.cid)
+                     .cte('new_customers'))
+    statement = select(new_customers.c.phone, new_customers.c.cid).union_all(
+        select(Customer.phone, Customer.cid).where(Customer.phone.in_(list(customers))))
+    cids_by_phone = dict(session.execute(statement).all())
+    missing = [phone for phone in customers if phone not in cids_by_phone]
+    if missing:
+        # Inserted by a concurrent transaction after this statement's snapshot was taken
+        cids_by_phone.update(session.execute(
+            select(Customer.phone, Customer.cid).where(Customer.phone.in_(missing))).all())
+    return cids_by_phone
+
+def reservation_values(row):
+    return {'tid': row['tid'], 'cid': row['cid'], 'status': row['status'], 'comment': row['comment'],
+            'number_of_people': row['number_of_people'], 'reservation_date': row['reservation_date'],
+            'reservation_time': row['reservation_time'], 'duration_minutes': row['duration_minutes']}
+
+def import_reservation_batch(session, batch):
+    errors = []
+    rows = []
+    for row_number, record in batch:
+        try:
+            row = validate_record(record)
+        except ValueError as e:
+            errors.append((row_number, str(e)))
+            continue
+        row['row_number'] = row_number
+        rows.append(row)
+    if not rows:
+        return 0, errors
+
+    existing_tids = set(session.execute(
+        select(Table.tid).where(Table.tid.in_({row['tid'] for row in rows}))).scalars())
+    valid_rows = []
+    for row in rows:
+        if row['tid'] in existing_tids:
+            valid_rows.append(row)
+        else:
+            errors.append((row['row_number'], f"Table with TID {row['tid']} does not exist."))
+    rows = valid_rows
+    if not rows:
+        return 0, errors
+
+    cids_by_phone = resolve_customers(session, rows)
+    for row in rows:
+        row['cid'] = cids_by_phone[row['phone']]
+
+    try:
+        # A list of parameter sets makes this an executemany, sent as multi-row VALUES pages
+        with session.begin_nested():
+            session.execute(insert(Reservation), [reservation_values(row) for row in rows])
+        return len(rows), errors
+    except DBAPIError:
+        pass
+    # The batch was rejected (e.g. an overlapping booking): isolate each row to find the bad ones
+    imported = 0
+    for row in rows:
+        try:
+            with session.begin_nested():
+                session.execute(insert(Reservation), reservation_values(row))
+            imported += 1
+        except DBAPIError as e:
+            errors.append((row['row_number'], str(e.orig).strip()))
+    return imported, errors
+
+def import_reservations(session, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    The ORM edition of bulk_import.import_reservations: same validation, batching and
+    report ('imported', 'failed', 'errors'), one commit per batch.
+    """
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        try:
+            imported, errors = import_reservation_batch(session, batch)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        report['imported'] += imported
+        report['failed'] += len(errors)
+        for row_number, message in sorted(errors):
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'row': row_number, 'error': message})
+    return report
+
+@app.route('/api/v1/reservations/import', methods=['POST'])
+def import_reservations_bulk():
+    fmt = request.args.get('format')
+    if not fmt:
+        content_type = request.mimetype or ''
+        if content_type == 'text/csv':
+            fmt = 'csv'
+        elif content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+            fmt = 'ndjson'
+        else:
+            return jsonify({"message": "Send the import as text/csv or application/x-ndjson, or pass ?format=csv|ndjson"}), 400
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"message": f"Unsupported import format '{fmt}', expected 'csv' or 'ndjson'"}), 400
+    try:
+        batch_size = int(request.args.get('batch_size', DEFAULT_BATCH_SIZE))
+        if batch_size <= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"message": "'batch_size' must be a positive integer"}), 400
+
+    session = Session()
+    try:
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        report = import_reservations(session, read_rows(stream, fmt), batch_size=batch_size)
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
+    except Exception as e:
+        session.rollback()
+        return jsonify({"message": f"Error importing reservations: {e}"}), 400
+    report['message'] = f"Imported {report['imported']} reservations, {report['failed']} rows failed"
+    return jsonify(report), 200
 
 # User Story 3: Cancel reservation
 @app.route('/api/v1/reservations/<int:rid>', methods=['DELETE'])
 def cancel_reservation(rid):
     session = Session()
     try:
-        reservation = session.query(Reservation).filter_by(rid=rid).first()
+        reservation = reservation_by_rid(session, rid)
         if not reservation:
             return jsonify({"message": f"Reservation {rid} not found"}), 404
         session.delete(reservation)
         session.commit()
         return jsonify({'message': f'Reservation {rid} cancelled successfully'}), 200
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
     except Exception as e:
         session.rollback()
         return jsonify({"message": str(e)}), 400
-    finally:
-        session.close()
 
 # User Story 4: Modify reservation
 @app.route('/api/v1/reservations/<int:rid>', methods=['PUT'])
 def modify_reservation(rid):
     data = request.json
-    allowed_fields = {'tid', 'status', 'comment', 'number_of_people', 'reservation_date', 'reservation_time'}
+    allowed_fields = {'tid', 'status', 'comment', 'number_of_people', 'reservation_date', 'reservation_time', 'duration_minutes'}
     if not data or not any(field in data for field in allowed_fields):
         return jsonify({"message": "No valid fields provided for update"}), 400
 
     session = Session()
     try:
-        reservation = session.query(Reservation).filter_by(rid=rid).first()
+        reservation = reservation_by_rid(session, rid)
         if not reservation:
             return jsonify({"message": f"Reservation {rid} not found"}), 404
         for field in allowed_fields:
@@ -141,21 +362,13 @@ def modify_reservation(rid):
         session.commit()
         return jsonify({
             'message': f'Reservation {rid} modified successfully',
-            'reservation': {
-                'rid': reservation.rid, 'tid': reservation.tid, 'cid': reservation.cid,
-                'status': reservation.status, 'comment': reservation.comment,
-                'number_of_people': reservation.number_of_people,
-                'reservation_date': str(reservation.reservation_date) if reservation.reservation_date else None,
-                'reservation_time': reservation.reservation_time,
-                'created_at': str(reservation.created_at) if reservation.created_at else None,
-                'updated_at': str(reservation.updated_at) if reservation.updated_at else None
-            }
+            'reservation': reservation
         }), 200
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
     except Exception as e:
         session.rollback()
         return jsonify({"message": str(e)}), 400
-    finally:
-        session.close()
 
 # User Story 5: Display occupancy for the next 7 days
 @app.route('/api/v1/occupancy_next_7_days', methods=['GET'])
@@ -164,20 +377,102 @@ def get_occupancy_next_7_days():
     try:
         today = datetime.now().date()
         end_date = today + timedelta(days=6)
-        results = (session.query(Reservation.reservation_date, func.sum(Reservation.number_of_people).label('people_on_day'))
-                   .filter(Reservation.status == 'active', Reservation.reservation_date.between(today, end_date))
-                   .group_by(Reservation.reservation_date)
-                   .order_by(Reservation.reservation_date)
-                   .all())
+        results = occupancy_by_day(session, today, end_date)
 
         occupancy_data = { (today + timedelta(days=i)).strftime('%Y-%m-%d'): 0 for i in range(7) }
         for row in results:
             occupancy_data[row[0].strftime('%Y-%m-%d')] = row[1]
         return jsonify({'occupancy_by_day': occupancy_data}), 200
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+def reservation_details(reservation):
+    # The reservation's columns with its table and customer embedded (each written by the JSON provider)
+    return dict(json_encoding.to_json_compatible(reservation), table=reservation.table, customer=reservation.customer)
+
+# One reservation with its table and customer, joined into a single SELECT
+@app.route('/api/v1/reservations/<int:rid>', methods=['GET'])
+def get_reservation(rid):
+    session = Session()
+    try:
+        reservation = session.scalars(lambda_stmt(lambda: (
+            select(Reservation)
+            .options(joinedload(Reservation.table), joinedload(Reservation.customer))
+            .where(Reservation.rid == rid)
+            .limit(1)))).first()
+        if not reservation:
+            return jsonify({"message": f"Reservation {rid} not found"}), 404
+        return jsonify(reservation_details(reservation)), 200
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
+    except Exception as e:
+        return jsonify({"message": str(e)}), 400
+
+# Opaque page cursor: the (reservation_date, rid) of the last row on the previous page, as in app.py
+def encode_page_cursor(reservation_date, rid):
+    return base64.urlsafe_b64encode(f"{reservation_date.isoformat()}:{rid}".encode()).decode()
+
+def decode_page_cursor(token):
+    try:
+        reservation_date, rid = base64.urlsafe_b64decode(token.encode()).decode().split(':')
+        return date.fromisoformat(reservation_date), int(rid)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid page cursor '{token}'")
+
+# List reservations with their tables and customers, keyset-paginated on (reservation_date, rid).
+# Same filters and cursor as app.py. Two statements per page whatever its size: the reservations
+# joined with their (few, small) tables, then the page's distinct customers in one IN query.
+@app.route('/api/v1/reservations', methods=['GET'])
+def list_reservations():
+    status = request.args.get('status')
+    if status is not None and status not in ('active', 'cancelled', 'completed'):
+        return jsonify({"message": "'status' must be one of active, cancelled, completed"}), 400
+    try:
+        from_date = date.fromisoformat(request.args['from']) if 'from' in request.args else None
+        to_date = date.fromisoformat(request.args['to']) if 'to' in request.args else None
+    except ValueError:
+        return jsonify({"message": "'from' and 'to' must be dates in YYYY-MM-DD format"}), 400
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        return jsonify({"message": f"'limit' must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    try:
+        after = decode_page_cursor(request.args['cursor']) if 'cursor' in request.args else None
+    except ValueError:
+        return jsonify({"message": "Invalid 'cursor'"}), 400
+
+    session = Session()
+    try:
+        # Each combination of filters is cached as its own chain of lambdas
+        statement = lambda_stmt(lambda: (
+            select(Reservation)
+            .options(joinedload(Reservation.table), selectinload(Reservation.customer))
+            .order_by(Reservation.reservation_date, Reservation.rid)))
+        if after is not None:
+            after_date, after_rid = after
+            # The plain date bound lets the planner skip partitions before the cursor
+            statement += lambda s: s.where(Reservation.reservation_date >= after_date,
+                                           tuple_(Reservation.reservation_date, Reservation.rid) > tuple_(after_date, after_rid))
+        if status is not None:
+            statement += lambda s: s.where(Reservation.status == status)
+        if from_date is not None:
+            statement += lambda s: s.where(Reservation.reservation_date >= from_date)
+        if to_date is not None:
+            statement += lambda s: s.where(Reservation.reservation_date <= to_date)
+        # One extra row tells us whether there is a next page
+        page_limit = limit + 1
+        statement += lambda s: s.limit(page_limit)
+        reservations = session.scalars(statement).all()
+        page = reservations[:limit]
+        next_cursor = (encode_page_cursor(page[-1].reservation_date, page[-1].rid)
+                       if len(reservations) > limit else None)
+        return jsonify({'reservations': [reservation_details(reservation) for reservation in page],
+                        'next_cursor': next_cursor}), 200
+    except PoolTimeout as e:
+        return pool_timeout_response(e)
     except Exception as e:
         return jsonify({"message": str(e)}), 400
-    finally:
-        session.close()
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
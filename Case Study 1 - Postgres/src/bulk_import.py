@@ -0,0 +1,265 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import date, time
+from itertools import islice
+
+import psycopg2
+from psycopg2 import extras
+from dotenv import load_dotenv
+
+REQUIRED_FIELDS = ['tid', 'number_of_people', 'reservation_date', 'reservation_time', 'last_name', 'first_name', 'phone']
+VALID_STATUSES = {'active', 'cancelled', 'completed'}
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_DURATION_MINUTES = 120
+MAX_REPORTED_ERRORS = 1000
+
+RESERVATION_COPY_SQL = """
+    COPY reservations (tid, cid, status, comment, number_of_people, reservation_date, reservation_time, duration_minutes)
+    FROM STDIN WITH (FORMAT csv)
+"""
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (row_number, record) pairs from a CSV (with header) or NDJSON text stream.
+
+    A record is either a dict or, for lines that could not be parsed, the
+    exception describing why; the importer reports those as row errors.
+    """
+    if fmt == 'csv':
+        for row_number, record in enumerate(csv.DictReader(stream), start=1):
+            yield row_number, record
+    elif fmt == 'ndjson':
+        row_number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("each line must be a JSON object")
+            except ValueError as e:
+                record = ValueError(f"Invalid JSON: {e}")
+            yield row_number, record
+    else:
+        raise ValueError(f"Unsupported import format '{fmt}', expected 'csv' or 'ndjson'")
+
+
+def validate_record(record):
+    if isinstance(record, Exception):
+        raise record
+
+    missing_fields = [field for field in REQUIRED_FIELDS if record.get(field) in (None, '')]
+    if missing_fields:
+        raise ValueError(f"Missing required fields: {', '.join(missing_fields)}")
+
+    try:
+        tid = int(record['tid'])
+        num_people = int(record['number_of_people'])
+        duration = int(record.get('duration_minutes') or DEFAULT_DURATION_MINUTES)
+    except (TypeError, ValueError):
+        raise ValueError("'tid', 'number_of_people' and 'duration_minutes' must be integers")
+    if num_people <= 0 or duration <= 0:
+        raise ValueError("'number_of_people' and 'duration_minutes' must be positive")
+
+    res_date = str(record['reservation_date'])
+    try:
+        date.fromisoformat(res_date)
+    except ValueError:
+        raise ValueError(f"Invalid reservation_date '{res_date}', expected YYYY-MM-DD")
+
+    res_time = str(record['reservation_time'])
+    try:
+        time.fromisoformat(res_time)
+    except ValueError:
+        raise ValueError(f"Invalid reservation_time '{res_time}', expected HH:MM[:SS]")
+
+    status = record.get('status') or 'active'
+    if status not in VALID_STATUSES:
+        raise ValueError(f"Invalid status '{status}'")
+
+    phone = str(record['phone'])
+    if len(phone) > 50:
+        raise ValueError("'phone' must be at most 50 characters")
+    if len(str(record['last_name'])) > 255 or len(str(record['first_name'])) > 255:
+        raise ValueError("'last_name' and 'first_name' must be at most 255 characters")
+
+    return {
+        'tid': tid,
+        'number_of_people': num_people,
+        'reservation_date': res_date,
+        'reservation_time': res_time,
+        'duration_minutes': duration,
+        'last_name': str(record['last_name']),
+        'first_name': str(record['first_name']),
+        'phone': phone,
+        'status': status,
+        'comment': str(record.get('comment') or ''),
+    }
+
+
+def _resolve_customers(cursor, rows):
+    # One upsert for all new phone numbers in the batch, one lookup for all of them
+    customers_by_phone = {}
+    for row in rows:
+        customers_by_phone.setdefault(row['phone'], (row['last_name'], row['first_name'], row['phone']))
+
+    extras.execute_values(
+        cursor,
+        "INSERT INTO customers (last_name, first_name, phone) VALUES %s ON CONFLICT (phone) DO NOTHING",
+        list(customers_by_phone.values()),
+        page_size=len(customers_by_phone)
+    )
+    cursor.execute("SELECT phone, cid FROM customers WHERE phone = ANY(%s)", (list(customers_by_phone),))
+    return dict(cursor.fetchall())
+
+
+def _reservation_values(row):
+    return (row['tid'], row['cid'], row['status'], row['comment'], row['number_of_people'],
+            row['reservation_date'], row['reservation_time'], row['duration_minutes'])
+
+
+def _copy_reservations(cursor, rows):
+    buffer = io.StringIO()
+    # QUOTE_NONNUMERIC keeps empty comments as '' rather than NULL
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    writer.writerows(_reservation_values(row) for row in rows)
+    buffer.seek(0)
+    cursor.copy_expert(RESERVATION_COPY_SQL, buffer)
+
+
+def _insert_reservations_row_by_row(cursor, rows, errors):
+    # Fallback when COPY rejects the batch: isolate each row in a savepoint to find the bad ones
+    imported = 0
+    for row in rows:
+        cursor.execute("SAVEPOINT import_row")
+        try:
+            cursor.execute(
+                """
+                INSERT INTO reservations (tid, cid, status, comment, number_of_people, reservation_date, reservation_time, duration_minutes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                _reservation_values(row)
+            )
+            cursor.execute("RELEASE SAVEPOINT import_row")
+            imported += 1
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT import_row")
+            errors.append((row['row_number'], str(e).strip()))
+    return imported
+
+
+def _import_batch(conn, batch):
+    errors = []
+    rows = []
+    for row_number, record in batch:
+        try:
+            row = validate_record(record)
+        except ValueError as e:
+            errors.append((row_number, str(e)))
+            continue
+        row['row_number'] = row_number
+        rows.append(row)
+
+    if not rows:
+        return 0, errors
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT tid FROM tables WHERE tid = ANY(%s)", (list({row['tid'] for row in rows}),))
+        existing_tids = {r[0] for r in cursor.fetchall()}
+        valid_rows = []
+        for row in rows:
+            if row['tid'] in existing_tids:
+                valid_rows.append(row)
+            else:
+                errors.append((row['row_number'], f"Table with TID {row['tid']} does not exist."))
+        rows = valid_rows
+        if not rows:
+            return 0, errors
+
+        cids_by_phone = _resolve_customers(cursor, rows)
+        for row in rows:
+            row['cid'] = cids_by_phone[row['phone']]
+
+        cursor.execute("SAVEPOINT import_copy")
+        try:
+            _copy_reservations(cursor, rows)
+            cursor.execute("RELEASE SAVEPOINT import_copy")
+            imported = len(rows)
+        except psycopg2.Error:
+            cursor.execute("ROLLBACK TO SAVEPOINT import_copy")
+            imported = _insert_reservations_row_by_row(cursor, rows, errors)
+
+    return imported, errors
+
+
+def import_reservations(conn, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load reservations (and their customers) from an iterable of (row_number, record) pairs.
+
+    Rows are processed and committed in batches of `batch_size`. Customers
+    are matched by phone number; unknown phone numbers create new customers.
+    Invalid rows are skipped and reported, they never abort the import.
+    Returns a report dict with 'imported', 'failed' and 'errors'.
+    """
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        try:
+            imported, errors = _import_batch(conn, batch)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        report['imported'] += imported
+        report['failed'] += len(errors)
+        for row_number, message in sorted(errors):
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'row': row_number, 'error': message})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import reservations from a CSV or NDJSON file.")
+    parser.add_argument('file', help="Path to the input file, or '-' for stdin")
+    parser.add_argument('--format', choices=['csv', 'ndjson'],
+                        help="Input format (default: derived from the file extension)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Rows per COPY batch and commit (default: {DEFAULT_BATCH_SIZE})")
+    args = parser.parse_args()
+
+    fmt = args.format or ('ndjson' if args.file.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+    # Load .env from the project directory, one level up from src/
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.env'))
+    conn = psycopg2.connect(
+        dbname=os.getenv('DB_NAME'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        host=os.getenv('DB_HOST'),
+        port=os.getenv('DB_PORT')
+    )
+    try:
+        if args.file == '-':
+            report = import_reservations(conn, read_rows(sys.stdin, fmt), args.batch_size)
+        else:
+            with open(args.file, newline='', encoding='utf-8') as f:
+                report = import_reservations(conn, read_rows(f, fmt), args.batch_size)
+    finally:
+        conn.close()
+
+    print(f"Imported {report['imported']} reservations, {report['failed']} rows failed.")
+    for error in report['errors']:
+        print(f"  row {error['row']}: {error['error']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+
+class PoolTimeout(pool.PoolError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool.
+
+    `minconn` connections are opened up front and more are opened on demand
+    up to `maxconn`; returned connections stay open for reuse. A checkout
+    blocks for at most `timeout` seconds when the pool is exhausted.
+    Connections that sat idle for longer than `health_check_interval` seconds
+    are pinged before being handed out, and replaced if the server dropped
+    them.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=5.0, health_check_interval=30.0, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._connect_kwargs = connect_kwargs
+
+        self._lock = threading.Condition()
+        self._idle = deque()        # (connection, returned_at) pairs, most recently used on the right
+        self._in_use = set()
+        self._opening = 0           # connections being opened outside the lock
+        self._closed = False
+
+        # Counters for stats()
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._health_check_failures = 0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+
+        while True:
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise pool.PoolError("Connection pool is closed")
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        self._in_use.add(conn)
+                        break
+                    if self._size() < self.maxconn:
+                        conn, idle_since = None, None
+                        self._opening += 1
+                        break
+                    remaining = timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"Timed out after {timeout:.1f}s waiting for a database connection "
+                            f"(pool max size {self.maxconn})")
+                    waited = True
+                    self._lock.wait(remaining)
+
+            if conn is None:
+                # Open the new connection without holding the lock
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opening -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._opening -= 1
+                    self._in_use.add(conn)
+            elif not self._is_healthy(conn, idle_since):
+                with self._lock:
+                    self._in_use.discard(conn)
+                    self._health_check_failures += 1
+                    self._lock.notify()
+                self._discard(conn)
+                continue
+
+            wait_time = time.monotonic() - started
+            with self._lock:
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                self._wait_time_total += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+            return conn
+
+    def putconn(self, conn, close=False):
+        with self._lock:
+            if conn not in self._in_use:
+                raise pool.PoolError("Connection was not checked out from this pool")
+            self._in_use.discard(conn)
+
+        if not close and not conn.closed:
+            # Never hand out a connection with a transaction left open by the previous user
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                close = True
+
+        with self._lock:
+            keep = not (close or conn.closed or self._closed)
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+        if not keep:
+            self._discard(conn)
+
+    def discard_idle(self):
+        """Close every idle connection, e.g. once the server is known to have gone away."""
+        with self._lock:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+        return len(idle)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': self._size(),
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_time_total_ms': round(self._wait_time_total * 1000, 3),
+                'wait_time_avg_ms': round(self._wait_time_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 3),
+                'health_check_failures': self._health_check_failures,
+            }
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._lock.notify_all()
+        for conn in idle:
+            self._discard(conn)
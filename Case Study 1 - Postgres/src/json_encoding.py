@@ -0,0 +1,134 @@
+import dataclasses
+import json
+from datetime import date, time
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:     # optional, the stdlib encoder is used without it
+    orjson = None
+
+
+def to_json_compatible(obj):
+    """
+    `default` hook shared by the encoders, for everything JSON has no type for.
+
+    Dates, times and timestamps become ISO 8601 strings, Decimals strings (so
+    no precision is lost), ranges {"lower": ..., "upper": ...} and database
+    rows objects: psycopg2 DictRow and RealDictRow, SQLAlchemy Row and mapped
+    model instances.
+    """
+    if isinstance(obj, (date, time)):     # datetime is a date too
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, dict):             # RealDictRow and other dict subclasses
+        return dict(obj)
+    if hasattr(obj, '_mapping'):          # SQLAlchemy Row
+        return dict(obj._mapping)
+    if isinstance(obj, list) and hasattr(obj, 'items'):     # psycopg2 DictRow
+        return dict(obj.items())
+    if hasattr(obj, 'isempty') and hasattr(obj, 'lower'):     # psycopg2 or SQLAlchemy range
+        return None if obj.isempty else {'lower': obj.lower, 'upper': obj.upper}
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__table__'):         # SQLAlchemy model instance
+        return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+    for base in (str, int, float, list, tuple):
+        if isinstance(obj, base):         # e.g. enums and markup strings
+            return base(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _rows_to_dicts(obj):
+    # The stdlib encoder writes any list subclass as an array without asking `default`
+    if isinstance(obj, dict):
+        return {key: _rows_to_dicts(value) for key, value in obj.items()}
+    if isinstance(obj, list) and hasattr(obj, 'items'):
+        return {key: _rows_to_dicts(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_rows_to_dicts(value) for value in obj]
+    return obj
+
+
+class StdlibEncoder:
+    name = 'stdlib'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(default=to_json_compatible, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(self, obj):
+        return self._encoder.encode(_rows_to_dicts(obj)).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonEncoder:
+    name = 'orjson'
+
+    # Subclasses of dict and list (the psycopg2 rows) go through to_json_compatible,
+    # otherwise a DictRow would come out as an array; dataclasses (SQLAlchemy ranges) too,
+    # so both encoders write them the same way. Keys must be strings, as with the stdlib.
+    OPTIONS = orjson.OPT_PASSTHROUGH_SUBCLASS | orjson.OPT_PASSTHROUGH_DATACLASS if orjson else 0
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=to_json_compatible, option=self.OPTIONS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+ENCODERS = {'stdlib': StdlibEncoder, 'orjson': OrjsonEncoder}
+
+
+def get_encoder(name='auto'):
+    """An encoder by name; 'auto' is orjson when it is installed, else the stdlib."""
+    if name == 'auto':
+        name = 'orjson' if orjson else 'stdlib'
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown JSON encoder '{name}', expected 'auto' or one of {', '.join(ENCODERS)}")
+    if name == 'orjson' and orjson is None:
+        raise ValueError("JSON encoder 'orjson' requested but the orjson package is not installed")
+    return ENCODERS[name]()
+
+
+class EncoderJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by one of ENCODERS, for jsonify(), request.json
+    and handlers returning dicts or lists. Responses are built from the
+    encoder's bytes without a round trip through str.
+    """
+
+    mimetype = 'application/json'
+
+    def __init__(self, app, encoder):
+        super().__init__(app)
+        self.encoder = encoder
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Formatting options (indent, sort_keys, default, ...) are only supported by the stdlib
+            kwargs.setdefault('default', to_json_compatible)
+            return json.dumps(_rows_to_dicts(obj), **kwargs)
+        return self.encoder.dumps(obj).decode()
+
+    def dumps_bytes(self, obj):
+        return self.encoder.dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return self.encoder.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.encoder.dumps(obj) + b'\n', mimetype=self.mimetype)
+
+
+def install(app, name='auto'):
+    """Makes `app` serialize with the named encoder; returns the provider."""
+    app.json = EncoderJSONProvider(app, get_encoder(name))
+    return app.json
@@ -0,0 +1,228 @@
+import bisect
+import threading
+from time import perf_counter
+
+from psycopg2 import extensions
+
+# Latency buckets in seconds, from sub-millisecond queries to slow streamed listings
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Rows returned per request
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# DB time and rows of the request currently handled by this thread
+_current = threading.local()
+
+
+class Histogram:
+    """Cumulative Prometheus histogram with a fixed label set."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le=le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_samples(metric_type, name, documentation, values, labelname=None):
+    # Renders values read from elsewhere (pool / cache stats): a number, or {label value: number} with labelname
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    if labelname is None:
+        lines.append(f"{name} {values}")
+    else:
+        lines.extend(f"{name}{_labels((labelname,), (key,))} {value}" for key, value in values.items())
+    return lines
+
+
+class RequestMetrics:
+    """
+    Per-process request instrumentation rendered in the Prometheus text format.
+
+    Records request latency per method, route and status, the time each
+    request spent inside psycopg2 calls, the rows it fetched and how long it
+    waited for a pooled connection. Database time is collected by
+    InstrumentedConnection cursors into a thread-local accumulator, so a
+    request only pays for a few perf_counter() calls and one lock per
+    histogram. With `enabled=False` every method returns immediately.
+    """
+
+    def __init__(self, enabled=True, prefix='reservations'):
+        self.enabled = enabled
+        self.request_duration = Histogram(
+            f'{prefix}_http_request_duration_seconds', 'Request latency, including streaming the response body.',
+            ('method', 'route', 'status'))
+        self.request_db_duration = Histogram(
+            f'{prefix}_http_request_db_duration_seconds', 'Time per request spent inside psycopg2 calls.',
+            ('method', 'route'))
+        self.request_rows = Histogram(
+            f'{prefix}_http_request_db_rows', 'Rows fetched from the database per request.',
+            ('method', 'route'), buckets=ROW_BUCKETS)
+        self.db_statements = Counter(
+            f'{prefix}_db_statements_total', 'Statements executed, per route.', ('method', 'route'))
+        self.acquire_duration = Histogram(
+            f'{prefix}_db_connection_acquire_duration_seconds', 'Time spent waiting for a pooled connection.')
+
+    def begin_request(self):
+        if not self.enabled:
+            return None
+        _current.db_seconds = 0.0
+        _current.rows = 0
+        _current.statements = 0
+        return perf_counter()
+
+    def end_request(self, started, method, route, status):
+        if started is None:
+            return
+        elapsed = perf_counter() - started
+        self.request_duration.observe(elapsed, (method, route, str(status)))
+        self.request_db_duration.observe(_current.db_seconds, (method, route))
+        self.request_rows.observe(_current.rows, (method, route))
+        if _current.statements:
+            self.db_statements.inc(_current.statements, (method, route))
+
+    def observe_acquire(self, seconds):
+        if self.enabled:
+            self.acquire_duration.observe(seconds)
+
+    def render(self, extra_lines=()):
+        lines = []
+        for metric in (self.request_duration, self.request_db_duration, self.request_rows,
+                       self.db_statements, self.acquire_duration):
+            lines.extend(metric.render())
+        lines.extend(extra_lines)
+        return '\n'.join(lines) + '\n'
+
+
+def _record_db(seconds, rows=0, statements=0):
+    # Outside a request (e.g. pool health checks at startup) there is nothing to attribute to
+    if hasattr(_current, 'db_seconds'):
+        _current.db_seconds += seconds
+        _current.rows += rows
+        _current.statements += statements
+
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        started = perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record_db(perf_counter() - started, statements=1)
+
+    def executemany(self, query, vars_list):
+        started = perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record_db(perf_counter() - started, statements=1)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _record_db(perf_counter() - started, statements=1)
+
+    def fetchone(self):
+        started = perf_counter()
+        row = super().fetchone()
+        _record_db(perf_counter() - started, rows=0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        _record_db(perf_counter() - started, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        started = perf_counter()
+        rows = super().fetchall()
+        _record_db(perf_counter() - started, rows=len(rows))
+        return rows
+
+    def __iter__(self):
+        # Named cursors iterate in itersize round trips; time each step
+        iterator = super().__iter__()
+        while True:
+            started = perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                _record_db(perf_counter() - started)
+                return
+            _record_db(perf_counter() - started, rows=1)
+            yield row
+
+
+_timed_cursor_classes = {}
+
+
+def _timed_cursor_class(cursor_class):
+    timed = _timed_cursor_classes.get(cursor_class)
+    if timed is None:
+        timed = type(f'Timed{cursor_class.__name__}', (_TimedCursorMixin, cursor_class), {})
+        _timed_cursor_classes[cursor_class] = timed
+    return timed
+
+
+class InstrumentedConnection(extensions.connection):
+    """psycopg2 connection whose cursors report their time and rows to the current request."""
+
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = _timed_cursor_class(cursor_class)
+        return super().cursor(*args, **kwargs)
@@ -0,0 +1,170 @@
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import psycopg2
+from psycopg2 import extensions
+
+from read_replicas import current_wal_insert_lsn
+
+logger = logging.getLogger(__name__)
+
+# Channel the occupancy_daily trigger notifies with the changed dates ('*' for everything)
+NOTIFY_CHANNEL = 'occupancy_changed'
+
+
+class OccupancyCache:
+    """
+    Per-process LRU cache of occupancy responses keyed by (from_date, to_date).
+
+    Entries expire after `ttl` seconds and at most `max_entries` are kept.
+    The cache only serves hits while `active` is set, i.e. while the
+    invalidation listener is connected; otherwise every lookup is a miss.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.active = False
+        self._entries = OrderedDict()   # (from_date, to_date) -> (expires_at, value)
+        self._lock = threading.Lock()
+        # Bumped by every invalidation so a result computed before it is not cached after it
+        self._generation = 0
+        # Primary WAL position at the latest invalidation: a read replica must have replayed it
+        # before a result read from it may be cached
+        self.min_lsn = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key) if self.active else None
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation):
+        with self._lock:
+            if not self.active or generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, dates=None, lsn=None):
+        """Drop entries whose window contains one of `dates`, or all entries if `dates` is None."""
+        with self._lock:
+            if lsn is not None:
+                self.min_lsn = max(self.min_lsn, lsn)
+            self._generation += 1
+            self.invalidations += 1
+            if dates is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries
+                        if any(key[0] <= day <= key[1] for day in dates)]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'active': self.active,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def parse_notify_payload(payload):
+    # Payload is a comma-separated list of YYYY-MM-DD dates, or '*'
+    if not payload or payload == '*':
+        return None
+    try:
+        return [date.fromisoformat(day) for day in payload.split(',')]
+    except ValueError:
+        return None
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Background thread that LISTENs on `channel` (NOTIFY_CHANNEL by default) over
+    its own connection and invalidates `cache` for every notification. Any cache
+    with `active` and `invalidate(dates=None)` works, e.g. the BookingIndex of
+    table_allocator.py. With `record_lsn` the primary's current WAL position is
+    passed along as `invalidate(dates, lsn=...)`, for caches filled from read
+    replicas.
+
+    The cache is activated only while the listener is connected, and fully
+    cleared whenever the connection is (re-)established, so no entry can
+    outlive a notification that was missed while disconnected.
+    """
+
+    def __init__(self, cache, connect_kwargs, reconnect_delay=1.0, channel=NOTIFY_CHANNEL, record_lsn=False):
+        super().__init__(name=f'{channel}-listener', daemon=True)
+        self.cache = cache
+        self.channel = channel
+        self.record_lsn = record_lsn
+        self.connect_kwargs = connect_kwargs
+        self.reconnect_delay = reconnect_delay
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.connect_kwargs)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                self._invalidate(conn)
+                self.cache.active = True
+                logger.info(f"Cache listening on channel '{self.channel}'")
+
+                while not self._stop_event.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._invalidate(conn, parse_notify_payload(notify.payload))
+            except psycopg2.Error as e:
+                logger.warning(f"Listener on channel '{self.channel}' disconnected, cache disabled: {e}")
+            finally:
+                self.cache.active = False
+                self.cache.invalidate()
+                if conn is not None:
+                    conn.close()
+            self._stop_event.wait(self.reconnect_delay)
+
+    def _invalidate(self, conn, dates=None):
+        # Sampled after the notification arrived, so it is past the commit that sent it
+        if self.record_lsn:
+            self.cache.invalidate(dates, lsn=current_wal_insert_lsn(conn))
+        else:
+            self.cache.invalidate(dates)
@@ -0,0 +1,54 @@
+"""
+SQLAlchemy models of the reservation schema (database_setup/script.sql), shared by
+the sync ORM edition (app_with_orm.py) and the async one (app_orm_async.py).
+"""
+from sqlalchemy import Column, Computed, Date, DateTime, ForeignKey, Integer, String, Text, Time
+from sqlalchemy.dialects.postgresql import TSRANGE
+from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy.sql import func
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Table(Base):
+    __tablename__ = 'tables'
+    tid = Column(Integer, primary_key=True)
+    table_number = Column(String(255), unique=True, nullable=False)
+    capacity = Column(Integer, nullable=False)
+    # Reservations go with their table through ON DELETE CASCADE in the database, not the ORM
+    reservations = relationship('Reservation', back_populates='table', passive_deletes=True)
+
+
+class Customer(Base):
+    __tablename__ = 'customers'
+    cid = Column(Integer, primary_key=True)
+    last_name = Column(String(255), nullable=False)
+    first_name = Column(String(255))
+    phone = Column(String(50), unique=True, nullable=False)
+    reservations = relationship('Reservation', back_populates='customer', passive_deletes=True)
+
+
+class Reservation(Base):
+    __tablename__ = 'reservations'
+    rid = Column(Integer, primary_key=True)
+    tid = Column(Integer, ForeignKey('tables.tid', ondelete='CASCADE'), nullable=False)
+    cid = Column(Integer, ForeignKey('customers.cid', ondelete='CASCADE'), nullable=False)
+    status = Column(String(50), default='active', nullable=False)
+    comment = Column(Text)
+    number_of_people = Column(Integer, nullable=False)
+    reservation_date = Column(Date, nullable=False)
+    reservation_time = Column(Time, nullable=False)
+    duration_minutes = Column(Integer, default=120, nullable=False)
+    reservation_period = Column(TSRANGE, Computed(
+        "tsrange(reservation_date + reservation_time, reservation_date + reservation_time + duration_minutes * interval '1 minute')"))
+    created_at = Column(DateTime, default=func.current_timestamp(), nullable=False)
+    updated_at = Column(DateTime, default=func.current_timestamp(), onupdate=func.current_timestamp(), nullable=False)
+    # Lazy loading is left as a fallback; the endpoints that return these load them eagerly
+    table = relationship(Table, back_populates='reservations')
+    customer = relationship(Customer, back_populates='reservations')
+
+    # Read the trigger-maintained timestamps back with RETURNING when a row is written, rather
+    # than with a SELECT when they are next used (which an AsyncSession could not do implicitly)
+    __mapper_args__ = {'eager_defaults': True}
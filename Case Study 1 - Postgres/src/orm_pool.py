@@ -0,0 +1,129 @@
+import os
+import threading
+from time import perf_counter
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+def database_url(driver):
+    return (f"postgresql+{driver}://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
+            f"@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}")
+
+
+def pool_options_from_env():
+    """create_engine() / create_async_engine() pool arguments from the ORM_POOL_* settings."""
+    return {
+        'pool_size': int(os.getenv('ORM_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('ORM_POOL_MAX_OVERFLOW', '5')),
+        'pool_timeout': float(os.getenv('ORM_POOL_TIMEOUT', '5')),
+        'pool_recycle': int(os.getenv('ORM_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': os.getenv('ORM_POOL_PRE_PING', 'true').lower() == 'true',
+    }
+
+
+class PoolTelemetry:
+    """
+    Checkout, checkin and wait counters of one SQLAlchemy engine's pool.
+
+    The SQLAlchemy counterpart of ConnectionPool.stats() in db_pool.py: the
+    same keys where the two pools mean the same thing, plus overflow and
+    recycling, which only QueuePool has. `on_wait` is called with the
+    seconds every checkout waited, for the acquire-time histogram.
+    """
+
+    def __init__(self, on_wait=None):
+        self.on_wait = on_wait
+        self.checkouts = 0
+        self.checkins = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self._lock = threading.Lock()
+
+    def attach(self, engine):
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            # Anything over a millisecond waited for another request to check a connection in
+            if seconds > 0.001:
+                self.waits += 1
+            if timed_out:
+                self.timeouts += 1
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+        if self.on_wait is not None:
+            self.on_wait(seconds)
+
+    def stats(self, pool):
+        with self._lock:
+            return {
+                'pool_size': pool.size(),
+                'max_overflow': pool._max_overflow,
+                'overflow': max(pool.overflow(), 0),
+                'in_use': pool.checkedout(),
+                'idle': pool.checkedin(),
+                'recycle_seconds': pool._recycle,
+                'pre_ping': pool._pre_ping,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'wait_time_total_ms': round(self.wait_time_total * 1000, 3),
+                'wait_time_avg_ms': round(self.wait_time_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_time_max_ms': round(self.wait_time_max * 1000, 3),
+            }
+
+
+class _TimedCheckoutMixin:
+    # Reports how long each checkout waited (including opening a new connection) to `telemetry`
+    telemetry = None
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.telemetry.record_wait(perf_counter() - started, timed_out=True)
+            raise
+        self.telemetry.record_wait(perf_counter() - started)
+        return conn
+
+    def recreate(self):
+        # Engine.dispose() swaps in a recreated pool, which keeps reporting to the same telemetry
+        pool = super().recreate()
+        pool.telemetry = self.telemetry
+        return pool
+
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    """The same for create_async_engine(); attach PoolTelemetry to the AsyncEngine's sync_engine."""
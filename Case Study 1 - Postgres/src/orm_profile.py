@@ -0,0 +1,150 @@
+import threading
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_MISS
+
+# Phase timings of the request currently handled by this thread
+_current = threading.local()
+
+PHASES = ('compile', 'execute', 'result')
+
+
+class QueryProfiler:
+    """
+    Splits the time each ORM request spends on its SQL statements into phases.
+
+    compile  from execute() to the cursor: the statement's cache key, the
+             compiled-statement cache lookup (a full compile on a miss) and
+             parameter processing
+    execute  inside cursor.execute(), i.e. Postgres plus the round trip; this
+             is the part app.py pays as well
+    result   turning the fetched rows into Rows and ORM objects, including
+             identity map lookups and eager loading
+
+    Everything else the request does (routing, building statements, the unit
+    of work, JSON encoding) is reported as 'other'. ORM SELECT results are
+    buffered while they are timed, so a profiled app loads every result fully
+    before the handler sees it; leave profiling off in production.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._endpoints = {}   # (method, route) -> running totals
+        self._lock = threading.Lock()
+
+    def attach(self, engine, session_factory):
+        if not self.enabled:
+            return
+        event.listen(engine, 'before_execute', self._before_execute)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(session_factory, 'do_orm_execute', self._do_orm_execute)
+
+    def detach(self, engine, session_factory):
+        if not self.enabled:
+            return
+        event.remove(engine, 'before_execute', self._before_execute)
+        event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.remove(session_factory, 'do_orm_execute', self._do_orm_execute)
+
+    def begin_request(self):
+        if not self.enabled:
+            return None
+        _current.compile = _current.execute = _current.result = 0.0
+        _current.statements = 0
+        _current.cache_misses = 0
+        _current.orm_depth = 0
+        _current.keep_mark = False
+        _current.mark = None
+        return perf_counter()
+
+    def end_request(self, started, method, route):
+        if started is None:
+            return
+        elapsed = perf_counter() - started
+        with self._lock:
+            totals = self._endpoints.get((method, route))
+            if totals is None:
+                totals = self._endpoints[(method, route)] = dict.fromkeys(
+                    ('requests', 'statements', 'cache_misses', 'total') + PHASES, 0)
+            totals['requests'] += 1
+            totals['statements'] += _current.statements
+            totals['cache_misses'] += _current.cache_misses
+            totals['total'] += elapsed
+            for phase in PHASES:
+                totals[phase] += getattr(_current, phase)
+        del _current.mark
+
+    def report(self):
+        """Per endpoint: requests, statements and compiled-cache misses, and the mean milliseconds per phase."""
+        with self._lock:
+            endpoints = sorted((key, dict(totals)) for key, totals in self._endpoints.items())
+        report = []
+        for (method, route), totals in endpoints:
+            requests = totals['requests']
+            timings = {f'{phase}_ms': round(totals[phase] * 1000 / requests, 3) for phase in PHASES}
+            other = totals['total'] - sum(totals[phase] for phase in PHASES)
+            timings['other_ms'] = round(other * 1000 / requests, 3)
+            timings['total_ms'] = round(totals['total'] * 1000 / requests, 3)
+            report.append({'method': method, 'route': route, 'requests': requests,
+                           'statements_per_request': round(totals['statements'] / requests, 2),
+                           'compiled_cache_misses': totals['cache_misses'], **timings})
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    # Outside a request (e.g. statements at startup) there is nothing to attribute to
+    def _before_execute(self, conn, clauseelement, multiparams, params, execution_options):
+        if not hasattr(_current, 'mark'):
+            return
+        if _current.keep_mark:
+            # The first statement of an ORM execute: compilation started with Session.execute()
+            _current.keep_mark = False
+        else:
+            _current.mark = perf_counter()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not hasattr(_current, 'mark'):
+            return
+        now = perf_counter()
+        if _current.mark is not None:
+            _current.compile += now - _current.mark
+        _current.cursor_started = now
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not hasattr(_current, 'mark'):
+            return
+        now = perf_counter()
+        _current.execute += now - _current.cursor_started
+        _current.statements += 1
+        if context is not None and context.cache_hit == CACHE_MISS:
+            _current.cache_misses += 1
+        # Rendering the next batch of an executemany counts as compilation again
+        _current.mark = now
+
+    def _do_orm_execute(self, orm_execute_state):
+        # Relationship loads run inside the result processing of the statement that triggered them
+        if not hasattr(_current, 'mark') or _current.orm_depth:
+            return None
+        started = _current.mark = perf_counter()
+        _current.keep_mark = True
+        compiled, executed = _current.compile, _current.execute
+        _current.orm_depth += 1
+        try:
+            result = orm_execute_state.invoke_statement()
+            buffer = (orm_execute_state.is_select
+                      and not orm_execute_state.execution_options.get('stream_results')
+                      and not orm_execute_state.execution_options.get('yield_per'))
+            if buffer:
+                # Fetch and load every row now, so that their processing is timed here
+                result = result.freeze()()
+        finally:
+            _current.orm_depth -= 1
+            _current.keep_mark = False
+        elapsed = perf_counter() - started
+        _current.result += elapsed - (_current.compile - compiled) - (_current.execute - executed)
+        return result
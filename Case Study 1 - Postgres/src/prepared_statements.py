@@ -0,0 +1,77 @@
+import re
+import threading
+import weakref
+
+_PLACEHOLDER = re.compile(r'\$(\d+)')
+
+
+class PreparedStatements:
+    """
+    Registry of named SQL statements that are PREPAREd once per connection.
+
+    Statements use Postgres' $1, $2, ... placeholders. The first execute()
+    on a connection sends PREPARE, later ones only send EXECUTE, so the
+    server parses and plans each statement once per session. Prepared
+    statements are not transactional and survive rollbacks; they go away
+    with the connection, which is why the bookkeeping is weakly keyed on it.
+
+    With `enabled=False` the same statements run as plain parameterized
+    queries, which is useful for comparing the two modes.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._statements = {}
+        self._prepared = weakref.WeakKeyDictionary()    # connection -> names prepared on it
+        self._lock = threading.Lock()
+        self.prepares = 0
+        self.executions = 0
+
+    def register(self, name, query):
+        self._statements[name] = query
+        return name
+
+    def __contains__(self, name):
+        return name in self._statements
+
+    def execute(self, cursor, name, params=()):
+        query = self._statements[name]
+        with self._lock:
+            self.executions += 1
+        if not self.enabled:
+            cursor.execute(*_to_pyformat(query, params))
+            return
+
+        conn = cursor.connection
+        with self._lock:
+            prepared = self._prepared.setdefault(conn, set())
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {query}")
+            prepared.add(name)
+            with self._lock:
+                self.prepares += 1
+
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'registered': len(self._statements),
+                'prepares': self.prepares,
+                'executions': self.executions,
+            }
+
+
+def _to_pyformat(query, params):
+    # Rewrite $n placeholders into psycopg2's %s, reordering params to match
+    ordered_params = []
+
+    def replace(match):
+        ordered_params.append(params[int(match.group(1)) - 1])
+        return '%s'
+
+    return _PLACEHOLDER.sub(replace, query.replace('%', '%%')), ordered_params
@@ -0,0 +1,227 @@
+import itertools
+import logging
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+from db_pool import ConnectionPool, PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+# A replica whose last successful check is older than this many check intervals is not used
+STALE_CHECK_INTERVALS = 3
+
+# WAL written so far, for the monitor's lag sampling
+PRIMARY_LSN_SQL = "SELECT pg_current_wal_lsn()"
+# WAL inserted so far, which includes commit records not yet written out (synchronous_commit=off);
+# a replica that has replayed this position has replayed every commit made before it was read
+PRIMARY_INSERT_LSN_SQL = "SELECT pg_current_wal_insert_lsn()"
+REPLICA_STATUS_SQL = """
+    SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn(),
+           EXTRACT(EPOCH FROM clock_timestamp() - pg_last_xact_replay_timestamp())
+"""
+
+
+def parse_lsn(text):
+    """'16/B374D848' -> integer WAL position, so positions compare as numbers."""
+    high, low = text.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def format_lsn(value):
+    return f"{value >> 32:X}/{value & 0xFFFFFFFF:X}"
+
+
+def current_wal_lsn(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(PRIMARY_LSN_SQL)
+        return parse_lsn(cursor.fetchone()[0])
+
+
+def current_wal_insert_lsn(conn):
+    """Position to wait for before reading a write committed on `conn` (or before it) from a replica."""
+    with conn.cursor() as cursor:
+        cursor.execute(PRIMARY_INSERT_LSN_SQL)
+        return parse_lsn(cursor.fetchone()[0])
+
+
+class Replica:
+    def __init__(self, name, pool, connect_kwargs):
+        self.name = name
+        self.pool = pool
+        self.connect_kwargs = connect_kwargs
+        self.healthy = False
+        self.replay_lsn = 0
+        self.lag_seconds = None
+        self.checked_at = None      # time.monotonic() of the last successful check
+        self.error = None
+        self.checkouts = 0
+        self.failures = 0
+
+
+class ReplicaRouter:
+    """
+    Hands out connections to streaming replicas for read-only work.
+
+    A monitor thread checks every replica each `check_interval` seconds over
+    its own connections: the replica's replay position and lag are compared
+    with the primary's current WAL position. A replica is used only while it
+    is in recovery, was checked recently, lags at most `max_lag_seconds`, and
+    has replayed at least the WAL position the caller needs (e.g. the
+    session's last write). getconn() returns None when no replica qualifies
+    or the chosen one cannot be reached; the caller then uses the primary.
+    """
+
+    def __init__(self, primary_connect_kwargs, replica_connect_kwargs, max_lag_seconds=5.0, check_interval=1.0,
+                 **pool_kwargs):
+        self.primary_connect_kwargs = primary_connect_kwargs
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.replicas = [
+            Replica(f"replica-{index}", ConnectionPool(minconn=0, **pool_kwargs, **connect_kwargs), connect_kwargs)
+            for index, connect_kwargs in enumerate(replica_connect_kwargs, start=1)
+        ]
+        self.primary_lsn = 0
+        self.fallbacks = 0
+        self._owners = {}           # checked out connection -> Replica
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._monitor = threading.Thread(target=self._run_monitor, name='replica-monitor', daemon=True)
+        self._monitor.start()
+
+    def _usable(self, replica, min_lsn, now):
+        return (replica.healthy
+                and now - replica.checked_at <= STALE_CHECK_INTERVALS * self.check_interval
+                and replica.lag_seconds <= self.max_lag_seconds
+                and replica.replay_lsn >= min_lsn)
+
+    def getconn(self, min_lsn=0):
+        """A connection to a replica that has replayed `min_lsn`, or None to use the primary."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [replica for replica in self.replicas if self._usable(replica, min_lsn, now)]
+            if not candidates:
+                self.fallbacks += 1
+                return None
+            replica = candidates[next(self._round_robin) % len(candidates)]
+        try:
+            conn = replica.pool.getconn()
+        except (psycopg2.Error, PoolTimeout) as e:
+            logger.warning(f"Read replica {replica.name} unavailable, using the primary: {e}")
+            self._mark_down(replica, e)
+            with self._lock:
+                self.fallbacks += 1
+            return None
+        with self._lock:
+            replica.checkouts += 1
+            self._owners[conn] = replica
+        return conn
+
+    def putconn(self, conn):
+        """Returns a connection from getconn() to its pool; False if it is not a replica connection."""
+        with self._lock:
+            replica = self._owners.pop(conn, None)
+        if replica is None:
+            return False
+        if conn.closed:
+            # The server went away mid-request: the idle connections to it are gone too
+            self._mark_down(replica, "connection lost")
+        replica.pool.putconn(conn)
+        return True
+
+    def _mark_down(self, replica, error):
+        # Left out until the monitor sees it healthy again
+        with self._lock:
+            replica.healthy = False
+            replica.error = str(error).strip()
+            replica.failures += 1
+        replica.pool.discard_idle()
+
+    def _check(self, connections):
+        # The primary is sampled first: a replica that has replayed that position is fully caught up
+        if connections.get(None) is None:
+            connections[None] = self._connect(self.primary_connect_kwargs)
+        primary_lsn = current_wal_lsn(connections[None])
+        self.primary_lsn = primary_lsn
+
+        for replica in self.replicas:
+            try:
+                if connections.get(replica.name) is None:
+                    connections[replica.name] = self._connect(replica.connect_kwargs)
+                with connections[replica.name].cursor() as cursor:
+                    cursor.execute(REPLICA_STATUS_SQL)
+                    in_recovery, replay_lsn, replay_age = cursor.fetchone()
+            except psycopg2.Error as e:
+                self._close(connections.pop(replica.name, None))
+                if replica.healthy:
+                    self._mark_down(replica, e)
+                continue
+            with self._lock:
+                if not in_recovery or replay_lsn is None:
+                    replica.healthy = False
+                    replica.error = "not a standby server"
+                    continue
+                replica.replay_lsn = parse_lsn(replay_lsn)
+                # Nothing to replay means no lag, however long ago the last transaction was
+                replica.lag_seconds = 0.0 if replica.replay_lsn >= primary_lsn else float(replay_age or 0.0)
+                replica.checked_at = time.monotonic()
+                replica.healthy = True
+                replica.error = None
+
+    def _run_monitor(self):
+        connections = {}    # None for the primary, else replica name -> monitoring connection
+        while not self._stop_event.is_set():
+            try:
+                self._check(connections)
+            except psycopg2.Error as e:
+                # Without the primary's position lag is unknown, so replicas age out after a few intervals
+                logger.warning(f"Replica monitor cannot reach the primary: {e}")
+                self._close(connections.pop(None, None))
+            self._stop_event.wait(self.check_interval)
+        for conn in connections.values():
+            self._close(conn)
+
+    @staticmethod
+    def _connect(connect_kwargs):
+        conn = psycopg2.connect(**connect_kwargs)
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        if conn is not None:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def stop(self):
+        self._stop_event.set()
+
+    def closeall(self):
+        self.stop()
+        for replica in self.replicas:
+            replica.pool.closeall()
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'max_lag_seconds': self.max_lag_seconds,
+                'primary_lsn': format_lsn(self.primary_lsn),
+                'fallbacks_to_primary': self.fallbacks,
+                'replicas': [{
+                    'name': replica.name,
+                    'host': replica.connect_kwargs.get('host'),
+                    'usable': self._usable(replica, 0, now),
+                    'replay_lsn': format_lsn(replica.replay_lsn),
+                    'lag_seconds': round(replica.lag_seconds, 3) if replica.lag_seconds is not None else None,
+                    'error': replica.error,
+                    'checkouts': replica.checkouts,
+                    'failures': replica.failures,
+                    'pool': replica.pool.stats(),
+                } for replica in self.replicas],
+            }
@@ -0,0 +1,214 @@
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+from time import perf_counter
+
+# Channel the reservations triggers notify with the dates whose active bookings changed ('*' for everything)
+NOTIFY_CHANNEL = 'bookings_changed'
+MINUTES_PER_DAY = 24 * 60
+# A day's schedule holds the bookings overlapping that day and the next one, so any request
+# starting on the day and lasting at most this long can be checked against it
+MAX_DURATION_MINUTES = MINUTES_PER_DAY
+
+
+class DaySchedule:
+    """
+    Active bookings of every table over a two-day window starting at `day`.
+
+    Times are minutes since midnight of `day`. Per table the bookings are kept
+    as two parallel sorted lists of start and end minutes; active bookings of
+    one table never overlap (the reservations_no_overlap constraints), so
+    whether a table is free is one bisect.
+    """
+
+    def __init__(self, day, tables, bookings):
+        self.day = day
+        self.tables = sorted(tables, key=lambda table: (table[2], table[1]))   # (tid, table_number, capacity)
+        midnight = datetime.combine(day, datetime.min.time())
+        intervals = {}
+        for tid, start, end in bookings:
+            # Whole minutes, rounded outwards so a booking never looks shorter than it is
+            intervals.setdefault(tid, []).append((int((start - midnight).total_seconds()) // 60,
+                                                  -(int((midnight - end).total_seconds()) // 60)))
+        self._starts = {}
+        self._ends = {}
+        for tid, table_intervals in intervals.items():
+            table_intervals.sort()
+            self._starts[tid] = [start for start, _ in table_intervals]
+            self._ends[tid] = [end for _, end in table_intervals]
+
+    def free_gap(self, tid, start, end):
+        """Length of the free gap around [start, end) on table `tid`, or None if the table is busy."""
+        starts = self._starts.get(tid)
+        if not starts:
+            return 2 * MINUTES_PER_DAY
+        index = bisect.bisect_left(starts, end)
+        previous_end = self._ends[tid][index - 1] if index else -MINUTES_PER_DAY
+        if previous_end > start:
+            return None
+        next_start = starts[index] if index < len(starts) else 2 * MINUTES_PER_DAY
+        return next_start - previous_end
+
+    def allocate(self, start, duration, party_size, max_tables=3):
+        """
+        Picks the tables for a party from `start` (minutes after midnight) for `duration` minutes.
+
+        A single table is preferred whenever one fits, the smallest one that does.
+        Otherwise up to `max_tables` tables are combined, with the fewest wasted
+        seats and then the fewest tables. Among tables of the same capacity the one
+        whose free gap is tightest is taken, which keeps long gaps open for later
+        bookings. Returns a list of (tid, table_number, capacity), or None.
+        """
+        end = start + duration
+        free_by_capacity = {}
+        for tid, table_number, capacity in self.tables:
+            gap = self.free_gap(tid, start, end)
+            if gap is not None:
+                free_by_capacity.setdefault(capacity, []).append((gap, tid, table_number))
+        if not free_by_capacity:
+            return None
+        for tables in free_by_capacity.values():
+            tables.sort()
+
+        capacities = sorted(free_by_capacity)
+        single = bisect.bisect_left(capacities, party_size)
+        if single < len(capacities):
+            capacity = capacities[single]
+            _, tid, table_number = free_by_capacity[capacity][0]
+            return [(tid, table_number, capacity)]
+
+        combination = _best_combination(capacities[::-1], {c: len(t) for c, t in free_by_capacity.items()},
+                                        party_size, max_tables)
+        if combination is None:
+            return None
+        allocated = []
+        used = {}
+        for capacity in combination:
+            _, tid, table_number = free_by_capacity[capacity][used.get(capacity, 0)]
+            used[capacity] = used.get(capacity, 0) + 1
+            allocated.append((tid, table_number, capacity))
+        return allocated
+
+
+def _best_combination(capacities, available, party_size, max_tables):
+    # Multiset of capacities (largest first) with sum >= party_size minimising (waste, table count).
+    # Searches distinct capacities rather than tables, so hundreds of tables with a handful of
+    # table sizes stay cheap.
+    best = None
+
+    def search(first, chosen, seats):
+        nonlocal best
+        if seats >= party_size:
+            key = (seats - party_size, len(chosen))
+            if best is None or key < best[0]:
+                best = (key, list(chosen))
+            return
+        remaining = max_tables - len(chosen)
+        if remaining == 0 or seats + remaining * capacities[first] < party_size:
+            return
+        for index in range(first, len(capacities)):
+            capacity = capacities[index]
+            if chosen.count(capacity) >= available[capacity]:
+                continue
+            if best is not None and seats + capacity - party_size > best[0][0] and seats + capacity >= party_size:
+                continue
+            chosen.append(capacity)
+            search(index, chosen, seats + capacity)
+            chosen.pop()
+
+    search(0, [], 0)
+    return best[1] if best else None
+
+
+def split_party(party_size, tables):
+    """Seats per table for a party spread over `tables`: fill each one in order, the rest on the last."""
+    seats = []
+    remaining = party_size
+    for index, (_, _, capacity) in enumerate(tables):
+        count = remaining if index == len(tables) - 1 else min(capacity, remaining)
+        seats.append(count)
+        remaining -= count
+    return seats
+
+
+class BookingIndex:
+    """
+    Per-process cache of DaySchedules, loaded from Postgres on first use of a day.
+
+    Mirrors OccupancyCache: schedules are only reused while `active` is set,
+    i.e. while an InvalidationListener on NOTIFY_CHANNEL is connected, and
+    expire after `ttl` seconds as a safety net. A stale schedule is harmless
+    for correctness, since the overlap constraints reject a table that is no
+    longer free, but the caller should invalidate the day and try again.
+    """
+
+    def __init__(self, ttl=60.0, max_days=62):
+        self.ttl = ttl
+        self.max_days = max_days
+        self.active = False
+        self._schedules = {}    # day -> (expires_at, DaySchedule)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.invalidations = 0
+        self.decisions = 0
+        self.decision_seconds = 0.0
+        self.max_decision_seconds = 0.0
+
+    def schedule(self, day, load):
+        """The DaySchedule of `day`; `load(day)` returns (tables, bookings) from the database on a miss."""
+        with self._lock:
+            entry = self._schedules.get(day) if self.active else None
+            if entry is not None and entry[0] >= time.monotonic():
+                self.hits += 1
+                return entry[1]
+        started = perf_counter()
+        schedule = DaySchedule(day, *load(day))
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += perf_counter() - started
+            if self.active:
+                if len(self._schedules) >= self.max_days and day not in self._schedules:
+                    del self._schedules[min(self._schedules, key=lambda key: self._schedules[key][0])]
+                self._schedules[day] = (time.monotonic() + self.ttl, schedule)
+        return schedule
+
+    def allocate(self, schedule, start, duration, party_size, max_tables):
+        started = perf_counter()
+        tables = schedule.allocate(start, duration, party_size, max_tables)
+        elapsed = perf_counter() - started
+        with self._lock:
+            self.decisions += 1
+            self.decision_seconds += elapsed
+            self.max_decision_seconds = max(self.max_decision_seconds, elapsed)
+        return tables
+
+    def invalidate(self, dates=None):
+        """Drop the schedules that include one of `dates` (a booking's date or the day after), or all."""
+        with self._lock:
+            self.invalidations += 1
+            if dates is None:
+                self._schedules.clear()
+                return
+            for day in dates:
+                for affected in (day - timedelta(days=1), day, day + timedelta(days=1)):
+                    self._schedules.pop(affected, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self.active,
+                'days': len(self._schedules),
+                'max_days': self.max_days,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'loads': self.loads,
+                'avg_load_ms': round(self.load_seconds / self.loads * 1000, 3) if self.loads else 0.0,
+                'invalidations': self.invalidations,
+                'decisions': self.decisions,
+                'avg_decision_ms': round(self.decision_seconds / self.decisions * 1000, 4) if self.decisions else 0.0,
+                'max_decision_ms': round(self.max_decision_seconds * 1000, 4),
+            }
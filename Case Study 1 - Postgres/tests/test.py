@@ -2,6 +2,8 @@ import pytest
 import requests
 from datetime import date, datetime, timedelta # Use datetime.date for date objects
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os # For loading .env if needed by app.py or for test-specific DB connection
 
 # Attempt to load .env if your app.py doesn't do it or if tests need direct DB access later
@@ -312,3 +314,427 @@ def test_display_occupancy_next_7_days():
         except ValueError:
             pytest.fail(f"Occupancy key '{day_str}' is not a valid YYYY-MM-DD date string.")
         assert isinstance(count, int), f"Occupancy count for '{day_str}' should be an integer, got {type(count)}."
+
+def test_pool_stats():
+    """Test that the connection pool statistics endpoint reports usage counters."""
+    print("\nRunning test_pool_stats")
+    create_table_api(capacity=2, table_number_prefix="PoolStatsTestTable-")
+
+    response = requests.get(f'{BASE_URL}/pool_stats')
+    assert response.status_code == 200, \
+        f"Failed to get pool stats: {response.status_code} - {response.text}"
+
+    stats = response.json()
+    for key in ('in_use', 'idle', 'size', 'max_size', 'checkouts', 'wait_time_avg_ms'):
+        assert key in stats, f"Pool stats should contain '{key}'."
+    assert stats['checkouts'] >= 1, "At least one connection checkout should have been recorded."
+    assert stats['size'] <= stats['max_size'], "Pool should never exceed its configured max size."
+
+def test_bulk_import_reservations():
+    """Test bulk importing reservations from NDJSON, with per-row error reporting."""
+    print("\nRunning test_bulk_import_reservations")
+    tid_import = create_table_api(capacity=6, table_number_prefix="ImportTestTable-")
+    shared_phone = f"088{str(uuid.uuid4().int)[:7]}"
+
+    lines = []
+    for i in range(20):
+        lines.append({
+            'tid': tid_import,
+            'number_of_people': 2,
+            # One booking per evening, so the rows never overlap on the shared table
+            'reservation_date': (date.today() + timedelta(days=30 + i)).strftime('%Y-%m-%d'),
+            'reservation_time': '19:00:00',
+            'last_name': f"TestImportLast-{i}",
+            'first_name': 'TestFirst',
+            # Every other row belongs to the same repeat customer
+            'phone': shared_phone if i % 2 == 0 else f"087{str(uuid.uuid4().int)[:7]}",
+            'comment': f"TestReservation import row {i + 1}"
+        })
+    lines.append({'tid': tid_import, 'number_of_people': 2})  # Missing fields
+    body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n"
+
+    response = requests.post(f'{BASE_URL}/reservations/import', data=body,
+                             headers={'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == 200, \
+        f"Failed to import reservations: {response.status_code} - {response.text}"
+
+    report = response.json()
+    assert report['imported'] == 20, f"Expected 20 imported rows, got {report['imported']}"
+    assert report['failed'] == 2, f"Expected 2 failed rows, got {report['failed']}"
+    assert [error['row'] for error in report['errors']] == [21, 22], "Errors should point at the bad rows."
+
+def test_double_booking_and_availability():
+    """Test that overlapping bookings are rejected and availability reflects bookings."""
+    print("\nRunning test_double_booking_and_availability")
+    tid_booked = create_table_api(capacity=4, table_number_prefix="AvailabilityTestTable-")
+    res_date_str = (date.today() + timedelta(days=5)).strftime('%Y-%m-%d')
+    add_reservation_api(tid_booked, 4, res_date_str, '19:00:00', comment="TestReservation availability")
+
+    # Default duration is two hours, so 20:00 on the same table overlaps
+    payload = {
+        'tid': tid_booked, 'number_of_people': 2, 'reservation_date': res_date_str,
+        'reservation_time': '20:00:00', 'last_name': 'TestCustLast-overlap', 'first_name': 'TestFirst',
+        'phone': f"066{str(uuid.uuid4().int)[:7]}", 'comment': 'TestReservation overlap'
+    }
+    response = requests.post(f'{BASE_URL}/reservations', json=payload)
+    assert response.status_code == 409, \
+        f"Overlapping booking should be rejected: {response.status_code} - {response.text}"
+
+    # Back-to-back bookings are fine
+    add_reservation_api(tid_booked, 2, res_date_str, '21:00:00', comment="TestReservation back-to-back")
+
+    response = requests.get(f'{BASE_URL}/availability',
+                            params={'date': res_date_str, 'time': '19:30', 'party_size': 4})
+    assert response.status_code == 200, \
+        f"Failed to get availability: {response.status_code} - {response.text}"
+    free_tids = [table['tid'] for table in response.json()['available_tables']]
+    assert tid_booked not in free_tids, "A booked table should not be reported as available."
+    assert all(table['capacity'] >= 4 for table in response.json()['available_tables']), \
+        "Available tables must fit the party."
+
+    response = requests.get(f'{BASE_URL}/availability',
+                            params={'date': res_date_str, 'time': '12:00', 'party_size': 4})
+    assert tid_booked in [table['tid'] for table in response.json()['available_tables']], \
+        "The table should be free at lunch time."
+
+def test_double_booking_across_month_boundary():
+    """Test that a booking running past midnight into the next month is checked against that month's bookings."""
+    print("\nRunning test_double_booking_across_month_boundary")
+    first_of_month = (date.today().replace(day=1) + timedelta(days=32)).replace(day=1)
+    last_of_month = first_of_month - timedelta(days=1)
+
+    def book(tid, day, res_time):
+        return requests.post(f'{BASE_URL}/reservations', json={
+            'tid': tid, 'number_of_people': 2, 'reservation_date': day.isoformat(), 'reservation_time': res_time,
+            'last_name': 'TestCustLast-month', 'first_name': 'TestFirst',
+            'phone': f"069{str(uuid.uuid4().int)[:7]}", 'comment': 'TestReservation month boundary'
+        })
+
+    # 23:00 for the default two hours reaches 00:30 on the first of the next month, in either order
+    tid_late_first = create_table_api(capacity=2, table_number_prefix="MonthBoundaryTestTable-")
+    add_reservation_api(tid_late_first, 2, last_of_month.isoformat(), '23:00:00', comment="TestReservation month end")
+    response = book(tid_late_first, first_of_month, '00:30:00')
+    assert response.status_code == 409, \
+        f"A booking overlapping the previous month should be rejected: {response.status_code} - {response.text}"
+    response = book(tid_late_first, first_of_month, '01:00:00')
+    assert response.status_code == 201, \
+        f"A back-to-back booking in the next month should be accepted: {response.status_code} - {response.text}"
+
+    tid_early_first = create_table_api(capacity=2, table_number_prefix="MonthBoundaryTestTable-")
+    add_reservation_api(tid_early_first, 2, first_of_month.isoformat(), '00:30:00', comment="TestReservation month start")
+    response = book(tid_early_first, last_of_month, '23:00:00')
+    assert response.status_code == 409, \
+        f"A booking overlapping the next month should be rejected: {response.status_code} - {response.text}"
+
+def test_occupancy_custom_window():
+    """Test occupancy for an explicit from/to window, including updates and cancellations."""
+    print("\nRunning test_occupancy_custom_window")
+    tid_window = create_table_api(capacity=8, table_number_prefix="OccupancyWindowTestTable-")
+    day = date.today() + timedelta(days=200)
+    day_str = day.isoformat()
+    params = {'from': (day - timedelta(days=1)).isoformat(), 'to': (day + timedelta(days=1)).isoformat()}
+
+    before = requests.get(f'{BASE_URL}/occupancy', params=params).json()['occupancy_by_day']
+    assert len(before) == 3, "Occupancy data should cover the requested 3 days."
+
+    kept = add_reservation_api(tid_window, 6, day_str, '18:00:00', comment="TestReservation window kept")
+    changed = add_reservation_api(tid_window, 2, day_str, '20:30:00', comment="TestReservation window changed")
+    requests.put(f"{BASE_URL}/reservations/{changed['rid']}", json={'number_of_people': 3})
+    requests.delete(f"{BASE_URL}/reservations/{kept['rid']}")
+
+    response = requests.get(f'{BASE_URL}/occupancy', params=params)
+    assert response.status_code == 200, \
+        f"Failed to get occupancy: {response.status_code} - {response.text}"
+    after = response.json()['occupancy_by_day']
+    assert after[day_str] - before[day_str] == 3, \
+        f"Expected occupancy on {day_str} to grow by 3, got {before[day_str]} -> {after[day_str]}"
+
+    response = requests.get(f'{BASE_URL}/occupancy', params={'from': day_str, 'to': params['from']})
+    assert response.status_code == 400, "A window ending before it starts should be rejected."
+
+def test_occupancy_cache_stats():
+    """Test that repeated occupancy reads are served from the cache and counted."""
+    print("\nRunning test_occupancy_cache_stats")
+    params = {'from': (date.today() + timedelta(days=300)).isoformat(),
+              'to': (date.today() + timedelta(days=306)).isoformat()}
+    requests.get(f'{BASE_URL}/occupancy', params=params)
+    before = requests.get(f'{BASE_URL}/cache_stats').json()
+
+    first = requests.get(f'{BASE_URL}/occupancy', params=params)
+    second = requests.get(f'{BASE_URL}/occupancy', params=params)
+    assert first.json() == second.json(), "Cached and uncached occupancy should be identical."
+
+    after = requests.get(f'{BASE_URL}/cache_stats').json()
+    if after['active']:
+        assert after['hits'] > before['hits'], "Repeated reads should be cache hits."
+    else:
+        # Without a LISTEN connection the cache must never serve entries
+        assert after['hits'] == before['hits'], "An inactive cache should not report hits."
+
+def test_list_reservations_keyset_pagination():
+    """Test paging through reservations with cursors and filters."""
+    print("\nRunning test_list_reservations_keyset_pagination")
+    tid_listing = create_table_api(capacity=4, table_number_prefix="ListingTestTable-")
+    first_day = date.today() + timedelta(days=400)
+    created_rids = []
+    for i in range(5):
+        details = add_reservation_api(tid_listing, 2, (first_day + timedelta(days=i // 2)).isoformat(),
+                                      '12:00:00' if i % 2 == 0 else '18:00:00',
+                                      comment=f"TestReservation listing {i + 1}")
+        created_rids.append(details['rid'])
+
+    params = {'from': first_day.isoformat(), 'to': (first_day + timedelta(days=2)).isoformat(),
+              'status': 'active', 'limit': 2}
+    listed = []
+    pages = 0
+    while True:
+        response = requests.get(f'{BASE_URL}/reservations', params=params)
+        assert response.status_code == 200, \
+            f"Failed to list reservations: {response.status_code} - {response.text}"
+        page = response.json()
+        assert len(page['reservations']) <= 2, "A page should not exceed the requested limit."
+        listed.extend(page['reservations'])
+        pages += 1
+        if not page['next_cursor']:
+            break
+        params['cursor'] = page['next_cursor']
+
+    listed_rids = [res['rid'] for res in listed if res['tid'] == tid_listing]
+    assert listed_rids == created_rids, f"Expected {created_rids} in order, got {listed_rids}"
+    assert pages >= 3, "Five reservations with limit 2 should span at least three pages."
+    keys = [(res['reservation_date'], res['rid']) for res in listed]
+    assert keys == sorted(keys), "Reservations should be ordered by date, then rid."
+
+def test_list_tables():
+    """Test listing restaurant tables."""
+    print("\nRunning test_list_tables")
+    tid = create_table_api(capacity=3, table_number_prefix="ListTablesTestTable-")
+    response = requests.get(f'{BASE_URL}/tables')
+    assert response.status_code == 200, \
+        f"Failed to list tables: {response.status_code} - {response.text}"
+    assert tid in [table['tid'] for table in response.json()['tables']], "New table should be listed."
+
+def test_batch_operations():
+    """Test that a batch applies all operations in one transaction, or none of them."""
+    print("\nRunning test_batch_operations")
+    tid_batch = create_table_api(capacity=6, table_number_prefix="BatchTestTable-")
+    res_date_str = (date.today() + timedelta(days=60)).strftime('%Y-%m-%d')
+    first = add_reservation_api(tid_batch, 2, res_date_str, '18:00:00', comment="TestReservation batch first")
+    second = add_reservation_api(tid_batch, 3, res_date_str, '20:00:00', comment="TestReservation batch second")
+
+    # Merge the two parties: cancel the second one, grow the first one, add a new booking
+    operations = [
+        {'op': 'cancel', 'rid': second['rid']},
+        {'op': 'modify', 'rid': first['rid'], 'data': {'number_of_people': 5, 'duration_minutes': 240}},
+        {'op': 'create', 'data': {
+            'tid': tid_batch, 'number_of_people': 4, 'reservation_date': res_date_str,
+            'reservation_time': '22:00:00', 'last_name': 'TestCustLast-batch', 'first_name': 'TestFirst',
+            'phone': f"067{str(uuid.uuid4().int)[:7]}", 'comment': 'TestReservation batch created'
+        }},
+    ]
+    response = requests.post(f'{BASE_URL}/batch', json={'operations': operations})
+    assert response.status_code == 200, \
+        f"Batch failed: {response.status_code} - {response.text}"
+    result = response.json()
+    assert result['committed'] is True
+    assert [r['status'] for r in result['results']] == [200, 200, 201]
+    assert result['results'][1]['result']['reservation']['number_of_people'] == 5
+    assert result['results'][2]['result']['tid'] == tid_batch
+
+    # The second operation overlaps the created booking, so the cancel before it must be rolled back too
+    other = add_reservation_api(tid_batch, 2, res_date_str, '12:00:00', comment="TestReservation batch other")
+    operations = [
+        {'op': 'cancel', 'rid': other['rid']},
+        {'op': 'modify', 'rid': first['rid'], 'data': {'reservation_time': '21:00:00'}},
+    ]
+    response = requests.post(f'{BASE_URL}/batch', json={'operations': operations})
+    assert response.status_code == 409, \
+        f"Overlapping modification should fail the batch: {response.status_code} - {response.text}"
+    assert response.json()['failed_index'] == 1
+    response = requests.delete(f"{BASE_URL}/reservations/{other['rid']}")
+    assert response.status_code == 200, "The cancel in a failed batch must not be applied."
+
+    response = requests.post(f'{BASE_URL}/batch', json={'operations': [{'op': 'cancel'}]})
+    assert response.status_code == 400, "A cancel without 'rid' should be rejected."
+
+def test_metrics():
+    """Test that /metrics exposes per-route latency, DB time and pool metrics in Prometheus format."""
+    print("\nRunning test_metrics")
+    requests.get(f'{BASE_URL}/occupancy_next_7_days')
+    response = requests.get('http://localhost:5000/metrics')
+    assert response.status_code == 200, \
+        f"Failed to get metrics: {response.status_code} - {response.text}"
+    assert response.headers['Content-Type'].startswith('text/plain')
+    body = response.text
+    route_labels = 'method="GET",route="/api/v1/occupancy_next_7_days"'
+    assert f'reservations_http_request_duration_seconds_count{{{route_labels},status="200"}}' in body
+    assert f'reservations_http_request_db_duration_seconds_count{{{route_labels}}}' in body
+    assert 'reservations_db_connection_acquire_duration_seconds_bucket{le="+Inf"}' in body
+    assert 'reservations_db_pool_connections{state="idle"}' in body
+
+def test_soft_cancel_keeps_reservation():
+    """Test that cancelling (RESERVATION_CANCEL_MODE=soft) keeps the row as 'cancelled' and frees the table."""
+    print("\nRunning test_soft_cancel_keeps_reservation")
+    tid_soft = create_table_api(capacity=4, table_number_prefix="SoftCancelTestTable-")
+    day_str = (date.today() + timedelta(days=450)).isoformat()
+    booking = add_reservation_api(tid_soft, 3, day_str, '19:00:00', comment="TestReservation soft cancel")
+
+    response = requests.delete(f"{BASE_URL}/reservations/{booking['rid']}")
+    assert response.status_code == 200, \
+        f"Failed to cancel reservation: {response.status_code} - {response.text}"
+    response = requests.delete(f"{BASE_URL}/reservations/{booking['rid']}")
+    assert response.status_code == 404, "Cancelling twice should report the reservation as already cancelled."
+
+    response = requests.get(f'{BASE_URL}/reservations', params={'from': day_str, 'to': day_str, 'status': 'cancelled'})
+    assert response.status_code == 200, \
+        f"Failed to list reservations: {response.status_code} - {response.text}"
+    cancelled = [res for res in response.json()['reservations'] if res['rid'] == booking['rid']]
+    assert len(cancelled) == 1 and cancelled[0]['status'] == 'cancelled', \
+        "The cancelled reservation should still be listed with status 'cancelled'."
+
+    # The cancelled booking no longer blocks its slot
+    add_reservation_api(tid_soft, 2, day_str, '19:00:00', comment="TestReservation soft cancel rebooked")
+
+def test_idempotency_key_replays_reservation():
+    """Test that retries with the same Idempotency-Key return the original reservation instead of a new one."""
+    print("\nRunning test_idempotency_key_replays_reservation")
+    tid_idem = create_table_api(capacity=4, table_number_prefix="IdempotencyTestTable-")
+    day_str = (date.today() + timedelta(days=460)).isoformat()
+    payload = {
+        'tid': tid_idem, 'number_of_people': 2, 'reservation_date': day_str, 'reservation_time': '19:00:00',
+        'last_name': 'TestCustLast-idem', 'first_name': 'TestFirst', 'phone': f"067{str(uuid.uuid4().int)[:7]}",
+        'comment': 'TestReservation idempotent'
+    }
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+
+    first = requests.post(f'{BASE_URL}/reservations', json=payload, headers=headers)
+    assert first.status_code == 201, f"Failed to add reservation: {first.status_code} - {first.text}"
+    retry = requests.post(f'{BASE_URL}/reservations', json=payload, headers=headers)
+    assert retry.status_code == 201, f"Retry should replay the original response: {retry.status_code} - {retry.text}"
+    assert retry.json() == first.json(), "The replayed response should match the original one."
+    assert retry.headers.get('Idempotent-Replayed') == 'true', "A replay should be marked as such."
+
+    changed = dict(payload, number_of_people=3)
+    response = requests.post(f'{BASE_URL}/reservations', json=changed, headers=headers)
+    assert response.status_code == 422, "Reusing a key for a different request should be rejected."
+
+    # Concurrent duplicates collapse into one reservation
+    concurrent_payload = dict(payload, reservation_time='12:00:00')
+    concurrent_headers = {'Idempotency-Key': str(uuid.uuid4())}
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        responses = list(executor.map(
+            lambda _: requests.post(f'{BASE_URL}/reservations', json=concurrent_payload, headers=concurrent_headers),
+            range(5)))
+    assert all(r.status_code == 201 for r in responses), \
+        f"All concurrent duplicates should succeed: {[r.status_code for r in responses]}"
+    assert len({r.json()['rid'] for r in responses}) == 1, "Concurrent duplicates should share one reservation."
+
+    response = requests.get(f'{BASE_URL}/reservations', params={'from': day_str, 'to': day_str, 'status': 'active'})
+    booked = [res for res in response.json()['reservations'] if res['tid'] == tid_idem]
+    assert len(booked) == 2, f"Expected exactly two reservations on the table, got {len(booked)}"
+
+def test_allocate_reservation_picks_best_fit():
+    """Test that the allocator picks the smallest fitting table, combines tables when needed and never double-books."""
+    print("\nRunning test_allocate_reservation_picks_best_fit")
+    for capacity in (35, 36, 37):
+        create_table_api(capacity=capacity, table_number_prefix="AllocationTestTable-")
+    day_str = (date.today() + timedelta(days=470)).isoformat()
+
+    def allocate(num_people, res_time):
+        return requests.post(f'{BASE_URL}/reservations/allocate', json={
+            'number_of_people': num_people, 'reservation_date': day_str, 'reservation_time': res_time,
+            'last_name': 'TestCustLast-alloc', 'first_name': 'TestFirst', 'phone': f"068{str(uuid.uuid4().int)[:7]}",
+            'comment': 'TestReservation allocated'
+        })
+
+    response = allocate(37, '19:00:00')
+    assert response.status_code == 201, f"Failed to allocate: {response.status_code} - {response.text}"
+    allocation = response.json()
+    assert [table['capacity'] for table in allocation['tables']] == [37], \
+        f"A party of 37 should get the 37-seat table, got {allocation['tables']}"
+    assert allocation['wasted_seats'] == 0
+
+    # No single table is left for 71 people at that time: the 36- and 35-seat tables are combined
+    response = allocate(71, '19:30:00')
+    assert response.status_code == 201, f"Failed to allocate: {response.status_code} - {response.text}"
+    allocation = response.json()
+    assert sorted(table['capacity'] for table in allocation['tables']) == [35, 36], \
+        f"A party of 71 should get the 35- and 36-seat tables, got {allocation['tables']}"
+    assert sum(table['number_of_people'] for table in allocation['tables']) == 71
+    assert len({table['rid'] for table in allocation['tables']}) == 2, "Each table gets its own reservation."
+
+    response = allocate(1000, '12:00:00')
+    assert response.status_code == 409, "A party larger than any table combination should be rejected."
+
+    # Concurrent allocations that all prefer the 35-seat table end up on different tables
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        responses = list(executor.map(lambda _: allocate(30, '13:00:00'), range(3)))
+    assert all(r.status_code == 201 for r in responses), \
+        f"All concurrent allocations should succeed: {[r.text for r in responses if r.status_code != 201]}"
+    tids = [table['tid'] for r in responses for table in r.json()['tables']]
+    assert len(tids) == len(set(tids)), f"A table was allocated twice: {tids}"
+
+def test_read_your_writes_with_replicas():
+    """Test that a client reads its own writes right away when reads are routed to replicas."""
+    print("\nRunning test_read_your_writes_with_replicas")
+    if 'read_replicas' not in requests.get(f'{BASE_URL}/pool_stats').json():
+        pytest.skip("The API server has no read replicas configured (DB_REPLICA_DSNS)")
+
+    session = requests.Session()
+    for i in range(5):
+        table_number = f"ReplicaTestTable-{uuid.uuid4().hex[:8]}"
+        response = session.post(f'{BASE_URL}/tables', json={'capacity': 2, 'table_number': table_number})
+        assert response.status_code == 201, f"Failed to create table: {response.status_code} - {response.text}"
+        assert 'read_after_lsn' in session.cookies, "A write should return the read-your-writes cookie."
+        tid = response.json()['tid']
+        response = session.get(f'{BASE_URL}/tables', params={'cursor': tid - 1, 'limit': 1})
+        assert response.status_code == 200, f"Failed to list tables: {response.status_code} - {response.text}"
+        assert [table['tid'] for table in response.json()['tables']] == [tid], \
+            "The table just created should be visible to the session that created it."
+
+def test_modify_reservation_with_if_match():
+    """Test that PUT with If-Match only applies to the version the client has seen and reports 412 otherwise."""
+    print("\nRunning test_modify_reservation_with_if_match")
+    tid_etag = create_table_api(capacity=6, table_number_prefix="IfMatchTestTable-")
+    day_str = (date.today() + timedelta(days=480)).isoformat()
+    booking = add_reservation_api(tid_etag, 2, day_str, '19:00:00', comment="TestReservation if-match")
+    rid = booking['rid']
+
+    response = requests.get(f"{BASE_URL}/reservations/{rid}")
+    assert response.status_code == 200, f"Failed to get reservation: {response.status_code} - {response.text}"
+    etag = response.headers.get('ETag')
+    assert etag, "GET should return the reservation's ETag."
+
+    response = requests.put(f"{BASE_URL}/reservations/{rid}", json={'number_of_people': 3}, headers={'If-Match': etag})
+    assert response.status_code == 200, f"Conditional update failed: {response.status_code} - {response.text}"
+    new_etag = response.headers.get('ETag')
+    assert new_etag and new_etag != etag, "A modified reservation should get a new ETag."
+
+    response = requests.put(f"{BASE_URL}/reservations/{rid}", json={'number_of_people': 4}, headers={'If-Match': etag})
+    assert response.status_code == 412, "An update based on an outdated ETag should be rejected."
+    assert requests.get(f"{BASE_URL}/reservations/{rid}").json()['number_of_people'] == 3, \
+        "The rejected update must not change the reservation."
+
+    # Two clients editing the same version at once: exactly one of them wins
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        responses = list(executor.map(
+            lambda people: requests.put(f"{BASE_URL}/reservations/{rid}", json={'number_of_people': people},
+                                        headers={'If-Match': new_etag}),
+            (5, 6)))
+    assert sorted(r.status_code for r in responses) == [200, 412], \
+        f"Expected one success and one 412, got {[r.status_code for r in responses]}"
+
+    response = requests.put(f"{BASE_URL}/reservations/999999999", json={'number_of_people': 2}, headers={'If-Match': etag})
+    assert response.status_code == 404, "A conditional update of a missing reservation should return 404."
+
+    # If-Match uses the strong comparison: a weak validator never matches, a malformed one is a bad request
+    current_etag = requests.get(f"{BASE_URL}/reservations/{rid}").headers.get('ETag')
+    response = requests.put(f"{BASE_URL}/reservations/{rid}", json={'number_of_people': 2},
+                            headers={'If-Match': f'W/{current_etag}'})
+    assert response.status_code == 412, f"A weak ETag should not match: {response.status_code} - {response.text}"
+    response = requests.put(f"{BASE_URL}/reservations/{rid}", json={'number_of_people': 2},
+                            headers={'If-Match': f'W/{current_etag}, {current_etag}'})
+    assert response.status_code == 200, f"The strong ETag in the list should match: {response.status_code} - {response.text}"
+    response = requests.put(f"{BASE_URL}/reservations/{rid}", json={'number_of_people': 2},
+                            headers={'If-Match': '"not-an-etag"'})
+    assert response.status_code == 400, "A malformed If-Match header should be rejected with 400."
@@ -0,0 +1,182 @@
+"""
+Statement count tests for the ORM edition.
+
+Drives the reservation detail, listing and import endpoints of app_with_orm.py
+through Flask's test client and counts the SQL statements each request sends.
+Tables and customers are eagerly loaded, so the count must not grow with the page
+size (no N+1 lazy loads), and an import batch is written with the same handful
+of statements however many rows it has, and the lookups are served from the
+compiled-statement cache (checked with the ORM_PROFILE profiler). They use the database from .env
+(override with DB_NAME=...) directly, no running server is needed; the rows they
+create are removed again.
+    pytest -v tests/test_orm_queries.py
+"""
+import os
+import sys
+import uuid
+from datetime import date, timedelta
+
+import pytest
+from dotenv import load_dotenv
+from sqlalchemy import event, text
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'src'))
+load_dotenv(dotenv_path=os.path.join(PROJECT_DIR, '.env'))
+
+import app_with_orm as orm_app  # noqa: E402
+from orm_profile import QueryProfiler  # noqa: E402
+
+TABLES = 3
+SLOTS_PER_TABLE = 10
+# Far enough out that nothing else books this day
+DAY = date.today() + timedelta(days=900)
+
+
+class StatementCounter:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@pytest.fixture(scope='module')
+def client():
+    return orm_app.app.test_client()
+
+
+@pytest.fixture(scope='module')
+def bookings(client):
+    prefix = f"orm-{uuid.uuid4().hex[:8]}-"
+    try:
+        rids = []
+        for table_index in range(TABLES):
+            response = client.post('/api/v1/tables', json={'capacity': 4, 'table_number': f'{prefix}{table_index}'})
+            assert response.status_code == 201, response.get_data(as_text=True)
+            tid = response.get_json()['tid']
+            for slot in range(SLOTS_PER_TABLE):
+                response = client.post('/api/v1/reservations', json={
+                    'tid': tid, 'number_of_people': 2, 'reservation_date': DAY.isoformat(),
+                    'reservation_time': f'{11 + slot}:00:00', 'duration_minutes': 60,
+                    'last_name': 'OrmTest', 'first_name': f'Guest{slot}', 'phone': f'{prefix}{table_index}-{slot}'})
+                assert response.status_code == 201, response.get_data(as_text=True)
+                rids.append(response.get_json()['rid'])
+        yield rids
+    finally:
+        with orm_app.engine.begin() as conn:
+            conn.execute(text("DELETE FROM tables WHERE table_number LIKE :prefix"), {'prefix': prefix + '%'})
+            conn.execute(text("DELETE FROM customers WHERE phone LIKE :prefix"), {'prefix': prefix + '%'})
+
+
+def count_statements(client, url, method='GET', **kwargs):
+    counter = StatementCounter()
+    event.listen(orm_app.engine, 'before_cursor_execute', counter)
+    try:
+        response = client.open(url, method=method, **kwargs)
+    finally:
+        event.remove(orm_app.engine, 'before_cursor_execute', counter)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json(), counter.statements
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    profiler = QueryProfiler(enabled=True)
+    profiler.attach(orm_app.engine, orm_app.session_factory)
+    monkeypatch.setattr(orm_app, 'profiler', profiler)
+    try:
+        yield profiler
+    finally:
+        profiler.detach(orm_app.engine, orm_app.session_factory)
+
+
+def test_reservation_detail_single_statement(client, bookings):
+    """Test that a reservation comes with its table and customer from one SELECT."""
+    print("\nRunning test_reservation_detail_single_statement")
+    body, statements = count_statements(client, f'/api/v1/reservations/{bookings[0]}')
+    assert len(statements) == 1, statements
+    assert body['rid'] == bookings[0]
+    assert body['table']['tid'] == body['tid']
+    assert body['customer']['cid'] == body['cid']
+    assert body['customer']['last_name'] == 'OrmTest'
+
+
+def test_reservation_listing_constant_statements(client, bookings):
+    """Test that listing reservations with tables and customers takes the same statements for any page size."""
+    print("\nRunning test_reservation_listing_constant_statements")
+    counts = {}
+    for limit in (1, 5, len(bookings)):
+        body, statements = count_statements(client, f'/api/v1/reservations?from={DAY}&to={DAY}&limit={limit}')
+        assert len(body['reservations']) == limit
+        for reservation in body['reservations']:
+            assert reservation['table']['tid'] == reservation['tid']
+            assert reservation['customer']['cid'] == reservation['cid']
+        counts[limit] = len(statements)
+    assert len(set(counts.values())) == 1, f"Statements per page size: {counts}"
+    assert counts[1] == 2, f"Expected the page plus one customers query, got {counts}"
+
+    # Following the cursor covers the rest of the day with no overlap
+    first, _ = count_statements(client, f'/api/v1/reservations?from={DAY}&to={DAY}&limit=10')
+    rest, _ = count_statements(client, f"/api/v1/reservations?to={DAY}&limit=100&cursor={first['next_cursor']}")
+    rids = [r['rid'] for r in first['reservations']] + [r['rid'] for r in rest['reservations']]
+    assert sorted(rids) == sorted(bookings)
+    assert rest['next_cursor'] is None
+
+
+def test_import_constant_statements(client, bookings):
+    """Test that an import batch takes the same statements for any number of rows and reports bad rows."""
+    print("\nRunning test_import_constant_statements")
+    tid = client.get(f'/api/v1/reservations/{bookings[0]}').get_json()['tid']
+    prefix = f"orm-import-{uuid.uuid4().hex[:8]}-"
+    header = 'tid,number_of_people,reservation_date,reservation_time,duration_minutes,last_name,first_name,phone\n'
+    try:
+        counts = {}
+        for offset, rows in ((1, 2), (2, 20)):
+            day = DAY + timedelta(days=offset)
+            body = header + ''.join(f'{tid},2,{day},{10 + i // 2}:{30 * (i % 2):02d}:00,30,Import,Row,{prefix}{i % 5}\n'
+                                    for i in range(rows))
+            report, statements = count_statements(client, '/api/v1/reservations/import', method='POST',
+                                                  data=body, content_type='text/csv')
+            assert report['imported'] == rows and report['failed'] == 0, report
+            counts[rows] = len(statements)
+        assert len(set(counts.values())) == 1, f"Statements per batch size: {counts}"
+
+        # An overlapping booking and an unknown table are reported, the rest is imported
+        day = DAY + timedelta(days=3)
+        body = header + (f'{tid},2,{day},12:00:00,60,Import,Row,{prefix}0\n'
+                         f'{tid},2,{day},12:30:00,60,Import,Row,{prefix}0\n'
+                         f'0,2,{day},12:00:00,60,Import,Row,{prefix}0\n')
+        report, _ = count_statements(client, '/api/v1/reservations/import', method='POST',
+                                     data=body, content_type='text/csv')
+        assert report['imported'] == 1 and report['failed'] == 2, report
+        assert [error['row'] for error in report['errors']] == [2, 3]
+        assert 'reservations_no_overlap' in report['errors'][0]['error']
+    finally:
+        with orm_app.engine.begin() as conn:
+            conn.execute(text("DELETE FROM customers WHERE phone LIKE :prefix"), {'prefix': prefix + '%'})
+
+
+def test_lookups_use_compiled_cache(client, bookings, profiler):
+    """Test that repeated lookups bind new values to cached statements and that the profile adds up."""
+    print("\nRunning test_lookups_use_compiled_cache")
+    client.get(f'/api/v1/reservations/{bookings[0]}')
+    client.get(f'/api/v1/reservations?from={DAY}&to={DAY}&limit=5')
+    profiler.reset()
+    for rid in bookings[1:6]:
+        assert client.get(f'/api/v1/reservations/{rid}').get_json()['rid'] == rid
+    first = client.get(f'/api/v1/reservations?from={DAY}&to={DAY}&limit=5').get_json()
+    rest = client.get(f"/api/v1/reservations?to={DAY}&limit=5&cursor={first['next_cursor']}").get_json()
+    assert [r['rid'] for r in first['reservations']] == bookings[:5]
+    assert [r['rid'] for r in rest['reservations']] == bookings[5:10]
+
+    report = {entry['route']: entry for entry in profiler.report()}
+    detail = report['/api/v1/reservations/<int:rid>']
+    assert detail['requests'] == 5 and detail['statements_per_request'] == 1
+    # The cursor page adds two filters, a statement of its own
+    assert report['/api/v1/reservations']['compiled_cache_misses'] <= 2, report
+    assert detail['compiled_cache_misses'] == 0, report
+    for entry in report.values():
+        phases = entry['compile_ms'] + entry['execute_ms'] + entry['result_ms']
+        assert min(entry['compile_ms'], entry['execute_ms'], entry['result_ms']) >= 0, entry
+        assert phases <= entry['total_ms'] + 0.01, entry
@@ -0,0 +1,443 @@
+"""
+Query plan regression tests.
+
+Drives every endpoint of app.py and app_with_orm.py through Flask's test client,
+records each SQL statement they send to Postgres and runs EXPLAIN (FORMAT JSON)
+on it (on the same connection, right before the statement itself runs). Every
+plan must then satisfy the expectations in EXPECTED_PLANS: the indexes it uses,
+a ceiling on its estimated cost and on the partitions it reads, and no sequential
+scan of a large relation.
+
+Plans are only meaningful on realistic data, so the tests run against a seeded
+database and are skipped when `reservations` is small, e.g.:
+    python benchmarks/generate_data.py postgres --reservations 1000000 --customers 200000 --tables 300 --truncate
+    pytest -v tests/test_query_plans.py
+They use the database from .env (override with DB_NAME=...) directly, no running
+server is needed. The statements write a handful of rows, which are removed again.
+
+On failure the current plan is printed next to a diff against the last known-good
+plan shape in tests/query_plans/. Refresh those files after an intended plan change
+with UPDATE_PLAN_BASELINES=1.
+"""
+import difflib
+import fnmatch
+import json
+import os
+import re
+import sys
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+
+import psycopg2
+import pytest
+from dotenv import load_dotenv
+from psycopg2 import extensions, sql
+from sqlalchemy import event
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_plans')
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'src'))
+
+# The recorder needs every statement as plain SQL: no PREPARE / EXECUTE and no cached occupancy or schedules
+os.environ['DB_PREPARED_STATEMENTS'] = 'false'
+os.environ['OCCUPANCY_CACHE_ENABLED'] = 'false'
+os.environ['ALLOCATION_INDEX_ENABLED'] = 'false'
+os.environ['METRICS_ENABLED'] = 'false'
+load_dotenv(dotenv_path=os.path.join(PROJECT_DIR, '.env'))
+
+import app as api_app  # noqa: E402
+import app_with_orm as orm_app  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+
+# Below this many rows in reservations the planner rightly prefers sequential scans everywhere
+MIN_RESERVATIONS = 100000
+# A sequential scan of a relation (or partition) estimated at this many rows or more fails the test
+SEQ_SCAN_MAX_ROWS = 10000
+# Estimated total cost ceiling for statements that do not set their own
+DEFAULT_MAX_COST = 1000
+
+# Plan expectations per statement. app.py statements are named after their prepared statement
+# (or server-side cursor), app_with_orm.py statements after the endpoint and their position
+# in the request; a later statement with the same name but different SQL gets a ' (2)' suffix.
+# 'indexes': index names or fnmatch patterns that must all appear in the plan, as reported by
+# root_name() for partitions. 'max_cost': ceiling on the estimated total cost. 'max_partitions':
+# ceiling on the reservations partitions the plan reads, for statements whose date bounds must
+# prune the rest. Small tables such as `tables` are rightly read with sequential scans, so lookups
+# on them expect no index.
+EXPECTED_PLANS = {
+    'app.py: insert_table': {},
+    'app.py: select_tables_page': {'indexes': ['tables_pkey']},
+    'app.py: create_reservation': {'indexes': ['customers_phone_key']},
+    'app.py: claim_idempotency_key': {},
+    'app.py: select_idempotent_response': {},
+    'app.py: store_idempotent_response': {},
+    'app.py: select_table': {},
+    'app.py: select_customer_by_phone': {'indexes': ['customers_phone_key']},
+    'app.py: insert_customer': {},
+    'app.py: insert_reservation': {},
+    'app.py: select_reservation': {'indexes': ['reservations_pkey']},
+    'app.py: update_reservation_4': {'indexes': ['reservations_pkey']},
+    'app.py: update_reservation_40': {'indexes': ['reservations_pkey']},
+    'app.py: update_reservation_4_if_match': {'indexes': ['reservations_pkey']},
+    'app.py: soft_cancel_reservation': {'indexes': ['reservations_pkey']},
+    'app.py: delete_reservation': {'indexes': ['reservations_pkey']},
+    'app.py: list_reservations': {'indexes': ['idx_reservations_date_rid']},
+    'app.py: list_reservations (2)': {'indexes': ['idx_reservations_date_rid']},
+    'app.py: select_available_tables': {'indexes': ['reservations_no_overlap_<month>'], 'max_partitions': 2},
+    'app.py: select_allocation_tables': {},
+    'app.py: select_day_bookings': {'indexes': ['reservations_no_overlap_<month>'], 'max_partitions': 2},
+    'app.py: select_occupancy': {'indexes': ['occupancy_daily_pkey']},
+    'app.py: POST /api/v1/reservations/import #1': {},
+    'app.py: POST /api/v1/reservations/import #2': {},
+    'app.py: POST /api/v1/reservations/import #3': {'indexes': ['customers_phone_key']},
+    'app_with_orm.py: POST /api/v1/tables #1': {},
+    'app_with_orm.py: POST /api/v1/reservations #1': {},
+    'app_with_orm.py: POST /api/v1/reservations #2': {'indexes': ['customers_phone_key']},
+    'app_with_orm.py: POST /api/v1/reservations #3': {},
+    'app_with_orm.py: POST /api/v1/reservations #4': {},
+    'app_with_orm.py: POST /api/v1/reservations #5': {'indexes': ['customers_pkey']},
+    'app_with_orm.py: POST /api/v1/reservations #6': {'indexes': ['reservations_pkey']},
+    'app_with_orm.py: PUT /api/v1/reservations/<int:rid> #1': {'indexes': ['reservations_pkey']},
+    'app_with_orm.py: PUT /api/v1/reservations/<int:rid> #2': {'indexes': ['reservations_pkey']},
+    'app_with_orm.py: PUT /api/v1/reservations/<int:rid> #3': {'indexes': ['reservations_pkey']},
+    'app_with_orm.py: GET /api/v1/reservations/<int:rid> #1': {'indexes': ['reservations_pkey']},
+    'app_with_orm.py: GET /api/v1/reservations #1': {'indexes': ['idx_reservations_date_rid']},
+    'app_with_orm.py: GET /api/v1/reservations #1 (2)': {'indexes': ['idx_reservations_date_rid']},
+    'app_with_orm.py: GET /api/v1/reservations #2': {'indexes': ['customers_pkey']},
+    'app_with_orm.py: DELETE /api/v1/reservations/<int:rid> #1': {'indexes': ['reservations_pkey']},
+    'app_with_orm.py: DELETE /api/v1/reservations/<int:rid> #2': {'indexes': ['reservations_pkey']},
+    'app_with_orm.py: POST /api/v1/reservations/import #1': {},
+    'app_with_orm.py: POST /api/v1/reservations/import #2': {'indexes': ['customers_phone_key']},
+    'app_with_orm.py: POST /api/v1/reservations/import #3': {},
+    'app_with_orm.py: GET /api/v1/occupancy_next_7_days #1': {'indexes': ['idx_reservations_active_date']},
+}
+
+# Statements worth explaining: they read or write the application's tables
+EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+APP_RELATIONS = re.compile(r'\b(tables|customers|reservations|occupancy_daily|idempotency_keys)\b', re.IGNORECASE)
+PARTITION_SUFFIX = re.compile(r'_(\d{4}_\d{2}|default)$')
+
+
+class PlanRecorder:
+    """Collects {statement name: (SQL, EXPLAIN plan)} while the scenarios run."""
+
+    def __init__(self):
+        self.plans = {}
+        self.templates = {}
+        self.source = None
+        self.endpoint = None
+        self.position = 0
+        self.prepared_name = threading.local()
+
+    def start_request(self, source, endpoint):
+        self.source = source
+        self.endpoint = endpoint
+        self.position = 0
+
+    def capture(self, conn, template, statement, cursor_name=None):
+        # template: the SQL before parameters are bound, statement: the SQL that runs
+        if isinstance(statement, bytes):
+            statement = statement.decode()
+        if not EXPLAINABLE.match(statement) or not APP_RELATIONS.search(statement):
+            return
+        self.position += 1
+        name = (getattr(self.prepared_name, 'value', None) or cursor_name
+                or f"{self.endpoint} #{self.position}")
+        key = f"{self.source}: {name}"
+        variant = 1
+        while key in self.plans:
+            if self.templates[key] == template:
+                return
+            variant += 1
+            key = f"{self.source}: {name} ({variant})"
+        self.templates[key] = template
+        # A plain cursor of the same connection: sees the same temp tables and transaction
+        with extensions.cursor(conn) as plan_cursor:
+            plan_cursor.execute("EXPLAIN (FORMAT JSON) " + statement)
+            plan = plan_cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        self.plans[key] = (statement, plan[0]['Plan'])
+
+
+recorder = PlanRecorder()
+
+
+class _RecordingCursorMixin:
+    def execute(self, query, vars=None):
+        template = query.as_string(self) if isinstance(query, sql.Composable) else query
+        recorder.capture(self.connection, template, self.mogrify(query, vars), self.name)
+        return super().execute(query, vars)
+
+
+_recording_cursor_classes = {}
+
+
+class RecordingConnection(extensions.connection):
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        if cursor_class not in _recording_cursor_classes:
+            _recording_cursor_classes[cursor_class] = type(
+                f'Recording{cursor_class.__name__}', (_RecordingCursorMixin, cursor_class), {})
+        kwargs['cursor_factory'] = _recording_cursor_classes[cursor_class]
+        return super().cursor(*args, **kwargs)
+
+
+def call(client, source, method, url, endpoint, **kwargs):
+    recorder.start_request(source, f"{method} {endpoint}")
+    response = client.open(url, method=method, **kwargs)
+    body = response.get_data()  # runs streamed responses to completion
+    assert response.status_code < 300, f"{source} {method} {url} failed: {response.status_code} {body[:500]}"
+    return response.get_json()
+
+
+def booking(tid, day, time_str, phone):
+    return {'tid': tid, 'number_of_people': 2, 'reservation_date': day.isoformat(), 'reservation_time': time_str,
+            'last_name': 'PlanTest', 'first_name': 'Query', 'phone': phone, 'comment': 'Query plan test'}
+
+
+def run_api_scenario(monkeypatch, prefix):
+    """Calls every app.py endpoint that touches the database."""
+    original_execute = api_app.prepared.execute
+
+    def named_execute(cursor, name, params=()):
+        recorder.prepared_name.value = name
+        try:
+            return original_execute(cursor, name, params)
+        finally:
+            recorder.prepared_name.value = None
+
+    monkeypatch.setattr(api_app.prepared, 'execute', named_execute)
+    monkeypatch.setattr(api_app, '_db_pool', ConnectionPool(
+        minconn=1, maxconn=2, connection_factory=RecordingConnection, **api_app.get_db_config()))
+    client = api_app.app.test_client()
+    src = 'app.py'
+    day = date.today() + timedelta(days=30)
+
+    tid = call(client, src, 'POST', '/api/v1/tables', '/api/v1/tables',
+               json={'capacity': 4, 'table_number': f'{prefix}api'})['tid']
+    call(client, src, 'GET', '/api/v1/tables?limit=5', '/api/v1/tables')
+    first = call(client, src, 'POST', '/api/v1/reservations', '/api/v1/reservations',
+                 json=booking(tid, day, '12:00:00', f'{prefix}1'), headers={'Idempotency-Key': prefix})
+    call(client, src, 'POST', '/api/v1/reservations', '/api/v1/reservations',
+         json=booking(tid, day, '12:00:00', f'{prefix}1'), headers={'Idempotency-Key': prefix})
+    monkeypatch.setattr(api_app, 'RESERVATION_CREATE_MODE', 'multi_statement')
+    second = call(client, src, 'POST', '/api/v1/reservations', '/api/v1/reservations',
+                  json=booking(tid, day, '15:00:00', f'{prefix}2'))
+    monkeypatch.setattr(api_app, 'RESERVATION_CREATE_MODE', 'single_statement')
+    call(client, src, 'PUT', f"/api/v1/reservations/{first['rid']}", '/api/v1/reservations/<int:rid>',
+         json={'number_of_people': 3, 'reservation_time': '12:30:00'})
+    current = call(client, src, 'GET', f"/api/v1/reservations/{first['rid']}", '/api/v1/reservations/<int:rid>')
+    etag = api_app.reservation_etag({'updated_at': datetime.fromisoformat(current['updated_at'])})
+    call(client, src, 'PUT', f"/api/v1/reservations/{first['rid']}", '/api/v1/reservations/<int:rid>',
+         json={'comment': 'Query plan test, if-match'}, headers={'If-Match': etag})
+    page = call(client, src, 'GET', f'/api/v1/reservations?from={day}&to={day}&limit=1',
+                '/api/v1/reservations')
+    call(client, src, 'GET', f"/api/v1/reservations?from={day}&limit=1&cursor={page['next_cursor']}",
+         '/api/v1/reservations')
+    call(client, src, 'GET', f'/api/v1/availability?date={day}&time=19:00&party_size=2', '/api/v1/availability')
+    allocation = dict(booking(None, day, '19:00:00', f'{prefix}6'))
+    del allocation['tid']
+    call(client, src, 'POST', '/api/v1/reservations/allocate', '/api/v1/reservations/allocate', json=allocation)
+    call(client, src, 'GET', f'/api/v1/occupancy?from={day}&to={day + timedelta(days=6)}', '/api/v1/occupancy')
+    call(client, src, 'POST', '/api/v1/batch', '/api/v1/batch', json={'operations': [
+        {'op': 'create', 'data': booking(tid, day, '18:00:00', f'{prefix}3')},
+        {'op': 'modify', 'rid': second['rid'], 'data': {'comment': 'Query plan test, modified'}},
+        {'op': 'cancel', 'rid': second['rid']},
+    ]})
+    call(client, src, 'DELETE', f"/api/v1/reservations/{first['rid']}", '/api/v1/reservations/<int:rid>')
+    monkeypatch.setattr(api_app, 'RESERVATION_CANCEL_MODE', 'delete')
+    third = call(client, src, 'POST', '/api/v1/reservations', '/api/v1/reservations',
+                 json=booking(tid, day, '21:00:00', f'{prefix}1'))
+    call(client, src, 'DELETE', f"/api/v1/reservations/{third['rid']}", '/api/v1/reservations/<int:rid>')
+    csv_body = ('tid,number_of_people,reservation_date,reservation_time,last_name,first_name,phone\n'
+                f'{tid},2,{day + timedelta(days=1)},12:00:00,PlanTest,Import,{prefix}4\n')
+    call(client, src, 'POST', '/api/v1/reservations/import', '/api/v1/reservations/import',
+         data=csv_body, content_type='text/csv')
+    api_app._db_pool.closeall()
+
+
+def run_orm_scenario(prefix):
+    """Calls every app_with_orm.py endpoint."""
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            recorder.capture(cursor.connection, statement, cursor.mogrify(statement, parameters))
+
+    event.listen(orm_app.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        client = orm_app.app.test_client()
+        src = 'app_with_orm.py'
+        day = date.today() + timedelta(days=31)
+        tid = call(client, src, 'POST', '/api/v1/tables', '/api/v1/tables',
+                   json={'capacity': 4, 'table_number': f'{prefix}orm'})['tid']
+        created = call(client, src, 'POST', '/api/v1/reservations', '/api/v1/reservations',
+                       json=booking(tid, day, '12:00:00', f'{prefix}5'))
+        call(client, src, 'PUT', f"/api/v1/reservations/{created['rid']}", '/api/v1/reservations/<int:rid>',
+             json={'number_of_people': 3})
+        call(client, src, 'GET', f"/api/v1/reservations/{created['rid']}", '/api/v1/reservations/<int:rid>')
+        page = call(client, src, 'GET', f'/api/v1/reservations?from={day}&to={day}&limit=1', '/api/v1/reservations')
+        call(client, src, 'GET', f"/api/v1/reservations?from={day}&limit=1&cursor={page['next_cursor']}",
+             '/api/v1/reservations')
+        call(client, src, 'GET', '/api/v1/occupancy_next_7_days', '/api/v1/occupancy_next_7_days')
+        call(client, src, 'DELETE', f"/api/v1/reservations/{created['rid']}", '/api/v1/reservations/<int:rid>')
+        csv_body = ('tid,number_of_people,reservation_date,reservation_time,last_name,first_name,phone\n'
+                    f'{tid},2,{day + timedelta(days=1)},12:00:00,PlanTest,Import,{prefix}7\n')
+        call(client, src, 'POST', '/api/v1/reservations/import', '/api/v1/reservations/import',
+             data=csv_body, content_type='text/csv')
+    finally:
+        event.remove(orm_app.engine, 'before_cursor_execute', before_cursor_execute)
+        orm_app.engine.dispose()
+
+
+@pytest.fixture(scope='module')
+def db_conn():
+    conn = psycopg2.connect(**api_app.get_db_config())
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope='module')
+def relations(db_conn):
+    """relation or index name -> (name of its partitioned root, or itself; estimated rows)"""
+    with db_conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM (SELECT 1 FROM reservations LIMIT %s) AS sample", (MIN_RESERVATIONS,))
+        if cursor.fetchone()[0] < MIN_RESERVATIONS:
+            pytest.skip(f"Needs a seeded database with at least {MIN_RESERVATIONS} reservations "
+                        "(see benchmarks/generate_data.py)")
+        cursor.execute("""
+            SELECT c.relname, COALESCE(pg_partition_root(c.oid), c.oid)::regclass::text, c.reltuples
+            FROM pg_class c
+            WHERE c.relnamespace = 'public'::regnamespace
+        """)
+        return {name: (root, rows) for name, root, rows in cursor.fetchall()}
+
+
+@pytest.fixture(scope='module')
+def recorded_plans(relations, db_conn):
+    prefix = f"plan-{uuid.uuid4().hex[:8]}-"
+    try:
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            run_api_scenario(monkeypatch, prefix)
+        run_orm_scenario(prefix)
+    finally:
+        with db_conn.cursor() as cursor:
+            cursor.execute("DELETE FROM tables WHERE table_number LIKE %s", (prefix + '%',))
+            cursor.execute("DELETE FROM customers WHERE phone LIKE %s", (prefix + '%',))
+            cursor.execute("DELETE FROM idempotency_keys WHERE idempotency_key = %s", (prefix,))
+    return recorder.plans
+
+
+def root_name(name, relations):
+    # Partitions and their indexes are reported under their partitioned parent. The overlap
+    # constraints are created per partition, so their indexes have no parent: drop the month.
+    root = relations.get(name, (name,))[0]
+    return PARTITION_SUFFIX.sub('_<month>', root)
+
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk(child)
+
+
+def describe(node, relations):
+    text = node['Node Type']
+    for key in ('Strategy', 'Join Type'):
+        if key in node:
+            text += f" ({node[key]})"
+    if 'Index Name' in node:
+        text += f" using {root_name(node['Index Name'], relations)}"
+    if 'Relation Name' in node:
+        text += f" on {root_name(node['Relation Name'], relations)}"
+    return text
+
+
+def plan_shape(node, relations, depth=0):
+    """Plan outline without costs or partition names; identical per-partition children are listed once."""
+    lines = ['  ' * depth + describe(node, relations)]
+    children = [plan_shape(child, relations, depth + 1) for child in node.get('Plans', [])]
+    for index, child in enumerate(children):
+        if index > 0 and child == children[index - 1]:
+            continue
+        if index + 1 < len(children) and child == children[index + 1]:
+            child = [child[0] + '  [per partition]'] + child[1:]
+        lines.extend(child)
+    return lines
+
+
+def plan_text(node, depth=0):
+    """Full plan with costs, like EXPLAIN's text format."""
+    text = node['Node Type']
+    if 'Index Name' in node:
+        text += f" using {node['Index Name']}"
+    if 'Relation Name' in node:
+        text += f" on {node['Relation Name']}"
+    text += f"  (cost={node['Startup Cost']}..{node['Total Cost']} rows={node['Plan Rows']})"
+    for key in ('Index Cond', 'Filter', 'Hash Cond', 'Join Filter'):
+        if key in node:
+            text += f"\n{'  ' * depth}      {key}: {node[key]}"
+    lines = ['  ' * depth + ('-> ' if depth else '') + text]
+    for child in node.get('Plans', []):
+        lines.append(plan_text(child, depth + 1))
+    return '\n'.join(lines)
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') + '.txt')
+
+
+def plan_report(name, statement, plan, relations):
+    shape = plan_shape(plan, relations)
+    report = [f"Statement: {statement.strip()}", "", "Current plan:", plan_text(plan)]
+    if os.path.exists(baseline_path(name)):
+        with open(baseline_path(name)) as f:
+            baseline = f.read().splitlines()
+        diff = list(difflib.unified_diff(baseline, shape, 'known-good plan', 'current plan', lineterm=''))
+        report += ["", "Plan shape diff:" if diff else "Plan shape unchanged from the known-good plan."] + diff
+    return '\n'.join(report)
+
+
+@pytest.mark.parametrize('name', sorted(EXPECTED_PLANS))
+def test_query_plan(name, recorded_plans, relations):
+    """Test that a statement's plan uses the expected indexes, stays under its cost and partition ceilings and scans no large relation."""
+    print(f"\nRunning test_query_plan for {name}")
+    assert name in recorded_plans, f"{name} was not issued by the scenario; update EXPECTED_PLANS."
+    statement, plan = recorded_plans[name]
+    expected = EXPECTED_PLANS[name]
+    nodes = list(walk(plan))
+    problems = []
+
+    for node in nodes:
+        if node['Node Type'] == 'Seq Scan':
+            rows = relations.get(node['Relation Name'], (None, 0))[1]
+            if rows >= SEQ_SCAN_MAX_ROWS:
+                problems.append(f"sequential scan of {node['Relation Name']} (~{rows:.0f} rows)")
+    used_indexes = {root_name(node['Index Name'], relations)
+                    for node in nodes if 'Index Name' in node}
+    for index in expected.get('indexes', []):
+        if not fnmatch.filter(used_indexes, index):
+            problems.append(f"does not use index {index} (uses: {', '.join(sorted(used_indexes)) or 'none'})")
+    partitions = {node['Relation Name'] for node in nodes
+                  if 'Relation Name' in node and root_name(node['Relation Name'], relations) == 'reservations'}
+    if 'max_partitions' in expected and len(partitions) > expected['max_partitions']:
+        problems.append(f"reads {len(partitions)} reservations partitions, at most {expected['max_partitions']} expected")
+    max_cost = expected.get('max_cost', DEFAULT_MAX_COST)
+    if plan['Total Cost'] > max_cost:
+        problems.append(f"estimated cost {plan['Total Cost']} exceeds {max_cost}")
+
+    if os.getenv('UPDATE_PLAN_BASELINES') and not problems:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(name), 'w') as f:
+            f.write('\n'.join(plan_shape(plan, relations)) + '\n')
+
+    assert not problems, f"{name}: " + '; '.join(problems) + '\n\n' + plan_report(name, statement, plan, relations)
+
+
+def test_every_statement_has_expectations(recorded_plans):
+    """Test that no statement issued by the apps is missing from EXPECTED_PLANS."""
+    print("\nRunning test_every_statement_has_expectations")
+    unexpected = sorted(set(recorded_plans) - set(EXPECTED_PLANS))
+    assert not unexpected, "Statements without plan expectations:\n" + '\n\n'.join(
+        f"{name}:\n{recorded_plans[name][0].strip()}" for name in unexpected)
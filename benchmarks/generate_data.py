@@ -0,0 +1,401 @@
+"""
+Synthetic reservation data for performance work.
+
+Fills the Postgres schema from `database_setup/script.sql` (tables, customers,
+reservations) or the equivalent MongoDB collections of app_mongo.py with a
+production-sized dataset:
+
+    python benchmarks/generate_data.py postgres --reservations 2000000 --workers 4 --truncate
+    python benchmarks/generate_data.py mongo --reservations 2000000 --workers 4 --truncate
+    python benchmarks/generate_data.py snapshot postgres
+    python benchmarks/generate_data.py restore postgres
+
+Bookings follow weekday and month seasonality, a small share of customers
+makes most of the bookings, and past reservations are mostly completed while
+future ones are mostly active, with cancellations throughout. No table is
+double booked. The data is split into one-week chunks that each get their own
+random generator derived from --seed, so the same seed produces the same rows
+whatever the number of workers. Chunks are loaded in parallel with COPY
+(Postgres) or unordered insert_many (MongoDB).
+
+`snapshot` copies the loaded database (Postgres: CREATE DATABASE ... TEMPLATE,
+MongoDB: $out into a second database) and `restore` puts it back, which is
+much faster than generating again between benchmark runs.
+"""
+import argparse
+import csv
+import io
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POSTGRES_ENV = os.path.join(REPO_ROOT, 'Case Study 1 - Postgres', '.env')
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+MONGO_URI = 'mongodb://localhost:27017/'
+MONGO_DB = 'reservation_db'
+
+CHUNK_DAYS = 7
+# Relative demand per weekday (Monday first) and per month (January first)
+WEEKDAY_WEIGHTS = (0.7, 0.75, 0.85, 1.0, 1.4, 1.5, 1.1)
+MONTH_WEIGHTS = (0.8, 0.85, 0.95, 1.0, 1.1, 1.1, 1.0, 0.9, 1.0, 1.0, 1.05, 1.35)
+CAPACITIES = ((2, 0.3), (4, 0.4), (6, 0.2), (8, 0.1))
+DURATIONS = ((60, 0.2), (90, 0.35), (120, 0.35), (150, 0.1))
+# Service hours in minutes after midnight: first seating and latest end
+OPENING, CLOSING = 11 * 60, 23 * 60
+CANCELLED_SHARE = 0.12
+# Share of past reservations nobody marked as completed
+STALE_ACTIVE_SHARE = 0.03
+# Booking probability per customer falls off like random() ** SKEW: with 2, a tenth of customers makes ~30% of bookings
+CUSTOMER_SKEW = 2.0
+COMMENTS = ('', '', '', '', '', 'Window seat', 'Birthday', 'High chair needed', 'Vegetarian', 'Anniversary', 'Late arrival')
+FIRST_NAMES = ('Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta', 'Hannah', 'Jonas', 'Lea', 'Lukas', 'Mia',
+               'Noah', 'Paul', 'Sophie', 'Tim', 'Lena', 'Max', 'Marie', 'Elias')
+LAST_NAMES = ('Muller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker', 'Schulz', 'Hoffmann',
+              'Koch', 'Richter', 'Klein', 'Wolf', 'Neumann', 'Schwarz', 'Zimmermann', 'Braun', 'Hartmann', 'Kruger')
+
+
+# --- Generation (shared by both stores) ---
+
+def weighted_choice(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def table_rows(count, seed):
+    rng = random.Random(seed)
+    return [(tid, f"T{tid:04d}", weighted_choice(rng, CAPACITIES)) for tid in range(1, count + 1)]
+
+
+def customer_row(cid):
+    # Derived from the id alone, so reservations can embed the customer without a lookup
+    return (cid, LAST_NAMES[cid % len(LAST_NAMES)], FIRST_NAMES[(cid // len(LAST_NAMES)) % len(FIRST_NAMES)],
+            f"+49{cid:010d}")
+
+
+def day_weight(day):
+    return WEEKDAY_WEIGHTS[day.weekday()] * MONTH_WEIGHTS[day.month - 1]
+
+
+def table_day_bookings(rng, expected):
+    # Back-to-back seatings of random length with gaps, never past closing time
+    count = int(expected) + (1 if rng.random() < expected - int(expected) else 0)
+    start = OPENING + rng.choice((0, 30, 60, 90))
+    for _ in range(count):
+        duration = weighted_choice(rng, DURATIONS)
+        if start + duration > CLOSING:
+            return
+        yield start, duration
+        start += duration + rng.choice((0, 30, 30, 60, 120))
+
+
+def generate_chunk(args):
+    """Reservation rows for the days [chunk_start, chunk_start + days) as tuples in COPY column order."""
+    seed, chunk_index, chunk_start, days, tables, customers, per_table_day, today = args
+    rng = random.Random(seed * 1000003 + chunk_index)
+    rows = []
+    for offset in range(days):
+        day = chunk_start + timedelta(days=offset)
+        expected = per_table_day * day_weight(day)
+        for tid, _, capacity in tables:
+            for start, duration in table_day_bookings(rng, expected):
+                roll = rng.random()
+                if roll < CANCELLED_SHARE:
+                    status = 'cancelled'
+                elif day < today:
+                    status = 'active' if roll < CANCELLED_SHARE + STALE_ACTIVE_SHARE else 'completed'
+                else:
+                    status = 'active'
+                booked_at = datetime.combine(day, datetime.min.time()) - timedelta(
+                    days=rng.randint(0, 60), minutes=rng.randint(0, 24 * 60 - 1))
+                rows.append((
+                    tid,
+                    1 + int(customers * rng.random() ** CUSTOMER_SKEW),
+                    status,
+                    rng.choice(COMMENTS),
+                    rng.randint(1, capacity),
+                    day.isoformat(),
+                    f"{start // 60:02d}:{start % 60:02d}:00",
+                    duration,
+                    booked_at.isoformat(sep=' ') + '+00',
+                ))
+    return rows
+
+
+def plan_chunks(args, tables):
+    start = args.start or date.today() - timedelta(days=args.days // 2)
+    days = [start + timedelta(days=offset) for offset in range(args.days)]
+    mean_weight = sum(day_weight(day) for day in days) / len(days)
+    per_table_day = args.reservations / (len(tables) * len(days) * mean_weight)
+    chunks = []
+    for index, offset in enumerate(range(0, args.days, CHUNK_DAYS)):
+        chunks.append((args.seed, index, start + timedelta(days=offset), min(CHUNK_DAYS, args.days - offset),
+                       tables, args.customers, per_table_day, date.today()))
+    return chunks
+
+
+def run_chunks(loader, initializer, initargs, chunks, workers):
+    started = time.monotonic()
+    loaded = 0
+    with multiprocessing.Pool(workers, initializer=initializer, initargs=initargs) as workers_pool:
+        for done, count in enumerate(workers_pool.imap_unordered(loader, chunks), start=1):
+            loaded += count
+            print(f"\r  {done}/{len(chunks)} weeks, {loaded} reservations", end='', flush=True)
+    elapsed = time.monotonic() - started
+    print(f"\nLoaded {loaded} reservations in {elapsed:.1f}s ({loaded / elapsed:.0f} rows/s)")
+
+
+# --- Postgres ---
+
+def postgres_config():
+    load_dotenv(dotenv_path=POSTGRES_ENV)
+    config = {
+        'dbname': os.getenv('DB_NAME'),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD'),
+        'host': os.getenv('DB_HOST'),
+        'port': os.getenv('DB_PORT')
+    }
+    if config['host'] not in LOCAL_HOSTS:
+        raise SystemExit(f"Refusing to run: DB_HOST '{config['host']}' is not a local database")
+    return config
+
+
+def copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+_worker_conn = None
+
+
+def _postgres_worker_init(config):
+    import psycopg2
+    global _worker_conn
+    _worker_conn = psycopg2.connect(**config)
+
+
+def _postgres_load_chunk(chunk):
+    rows = generate_chunk(chunk)
+    with _worker_conn.cursor() as cursor:
+        copy_rows(cursor, 'reservations', ('tid', 'cid', 'status', 'comment', 'number_of_people', 'reservation_date',
+                                           'reservation_time', 'duration_minutes', 'created_at'), rows)
+    _worker_conn.commit()
+    return len(rows)
+
+
+def generate_postgres(args):
+    import psycopg2
+    config = postgres_config()
+    conn = psycopg2.connect(**config)
+    try:
+        with conn.cursor() as cursor:
+            if args.truncate:
+                cursor.execute("TRUNCATE TABLE reservations, customers, tables, occupancy_daily RESTART IDENTITY CASCADE")
+            else:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM tables) OR EXISTS (SELECT 1 FROM customers)")
+                if cursor.fetchone()[0]:
+                    raise SystemExit("The database already has data; pass --truncate to replace it")
+
+            tables = table_rows(args.tables, args.seed)
+            print(f"Loading {len(tables)} tables and {args.customers} customers into {config['dbname']}")
+            copy_rows(cursor, 'tables', ('tid', 'table_number', 'capacity'), tables)
+            for first in range(1, args.customers + 1, 100000):
+                copy_rows(cursor, 'customers', ('cid', 'last_name', 'first_name', 'phone'),
+                          (customer_row(cid) for cid in range(first, min(first + 100000, args.customers + 1))))
+            # Rows were copied with explicit ids; move the sequences past them
+            cursor.execute("SELECT setval(pg_get_serial_sequence('tables', 'tid'), %s)", (args.tables,))
+            cursor.execute("SELECT setval(pg_get_serial_sequence('customers', 'cid'), %s)", (args.customers,))
+
+            chunks = plan_chunks(args, tables)
+            # With a partitioned reservations table, give every generated month its own partition
+            # so the rows do not all land in reservations_default
+            cursor.execute("SELECT to_regproc('create_reservation_partition') IS NOT NULL")
+            if cursor.fetchone()[0]:
+                first_day = chunks[0][2]
+                last_day = chunks[-1][2] + timedelta(days=chunks[-1][3] - 1)
+                cursor.execute("""
+                    SELECT create_reservation_partition(month::date)
+                    FROM generate_series(date_trunc('month', %s::date), %s::date, interval '1 month') AS month
+                """, (first_day, last_day))
+        conn.commit()
+
+        # Each chunk covers its own dates, so parallel COPYs never update the same occupancy_daily row
+        run_chunks(_postgres_load_chunk, _postgres_worker_init, (config,), chunks, args.workers)
+
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            print("Analyzing")
+            cursor.execute("ANALYZE tables, customers, reservations, occupancy_daily")
+    finally:
+        conn.close()
+
+
+def _postgres_admin(config, force, *databases):
+    import psycopg2
+    admin = psycopg2.connect(**dict(config, dbname='postgres'))
+    admin.autocommit = True
+    cursor = admin.cursor()
+    if force:
+        cursor.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = ANY(%s) AND pid <> pg_backend_pid()",
+                       (list(databases),))
+    return admin, cursor
+
+
+def snapshot_postgres(args):
+    from psycopg2 import sql
+    config = postgres_config()
+    name = args.name or f"{config['dbname']}_snapshot"
+    admin, cursor = _postgres_admin(config, args.force, config['dbname'], name)
+    try:
+        cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)))
+        # Needs exclusive access to the source database: stop the app first or pass --force
+        cursor.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(sql.Identifier(name), sql.Identifier(config['dbname'])))
+        print(f"Snapshot of {config['dbname']} saved as {name}")
+    finally:
+        admin.close()
+
+
+def restore_postgres(args):
+    from psycopg2 import sql
+    config = postgres_config()
+    name = args.name or f"{config['dbname']}_snapshot"
+    admin, cursor = _postgres_admin(config, args.force, config['dbname'], name)
+    try:
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (name,))
+        if cursor.fetchone() is None:
+            raise SystemExit(f"No snapshot named {name}")
+        cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(config['dbname'])))
+        cursor.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(sql.Identifier(config['dbname']), sql.Identifier(name)))
+        print(f"{config['dbname']} restored from {name}")
+    finally:
+        admin.close()
+
+
+# --- MongoDB ---
+
+MONGO_BATCH_SIZE = 10000
+_worker_db = None
+
+
+def _mongo_worker_init(uri, db_name):
+    from pymongo import MongoClient
+    global _worker_db
+    _worker_db = MongoClient(uri)[db_name]
+
+
+def _mongo_load_chunk(chunk):
+    # Same rows as the Postgres loader, shaped like the documents app_mongo.py writes
+    rows = generate_chunk(chunk)
+    table_numbers = {tid: table_number for tid, table_number, _ in chunk[4]}
+    documents = []
+    for tid, cid, status, comment, num_people, res_date, res_time, _, _ in rows:
+        _, last_name, first_name, phone = customer_row(cid)
+        documents.append({
+            'status': status,
+            'comment': comment,
+            'number_of_people': num_people,
+            'reservation_date': res_date,
+            'reservation_time': res_time[:5],
+            'customer': {'last_name': last_name, 'first_name': first_name, 'phone': phone},
+            'tables': [{'table_number': table_numbers[tid]}],
+        })
+    for first in range(0, len(documents), MONGO_BATCH_SIZE):
+        _worker_db.reservations.insert_many(documents[first:first + MONGO_BATCH_SIZE], ordered=False)
+    return len(documents)
+
+
+def check_mongo_uri(uri):
+    from pymongo.uri_parser import parse_uri
+    hosts = [host for host, _ in parse_uri(uri)['nodelist']]
+    if any(host not in LOCAL_HOSTS for host in hosts):
+        raise SystemExit(f"Refusing to run: {', '.join(hosts)} is not a local MongoDB")
+
+
+def generate_mongo(args):
+    from pymongo import MongoClient
+    check_mongo_uri(args.mongo_uri)
+    db = MongoClient(args.mongo_uri)[args.mongo_db]
+    if args.truncate:
+        db.drop_collection('tables')
+        db.drop_collection('reservations')
+    elif db.tables.estimated_document_count() or db.reservations.estimated_document_count():
+        raise SystemExit("The database already has data; pass --truncate to replace it")
+
+    tables = table_rows(args.tables, args.seed)
+    print(f"Loading {len(tables)} tables into {args.mongo_db}")
+    db.tables.insert_many([{'capacity': capacity, 'table_number': table_number} for _, table_number, capacity in tables])
+    run_chunks(_mongo_load_chunk, _mongo_worker_init, (args.mongo_uri, args.mongo_db), plan_chunks(args, tables), args.workers)
+
+
+def _mongo_copy_database(uri, source, target):
+    from pymongo import MongoClient
+    check_mongo_uri(uri)
+    client = MongoClient(uri)
+    for collection in client[source].list_collection_names():
+        # $out replaces the target collection atomically
+        client[source][collection].aggregate([{'$match': {}}, {'$out': {'db': target, 'coll': collection}}])
+
+
+def snapshot_mongo(args):
+    name = args.name or f"{args.mongo_db}_snapshot"
+    _mongo_copy_database(args.mongo_uri, args.mongo_db, name)
+    print(f"Snapshot of {args.mongo_db} saved as {name}")
+
+
+def restore_mongo(args):
+    name = args.name or f"{args.mongo_db}_snapshot"
+    _mongo_copy_database(args.mongo_uri, name, args.mongo_db)
+    print(f"{args.mongo_db} restored from {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate, snapshot and restore synthetic reservation datasets.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for store in ('postgres', 'mongo'):
+        generate = commands.add_parser(store, help=f"Fill the {store} database with synthetic data")
+        generate.add_argument('--reservations', type=int, default=1000000,
+                              help="Approximate number of reservations (default: 1000000)")
+        generate.add_argument('--customers', type=int, default=200000, help="Customers (default: 200000)")
+        generate.add_argument('--tables', type=int, default=400, help="Restaurant tables (default: 400)")
+        generate.add_argument('--days', type=int, default=730, help="Days of bookings (default: 730)")
+        generate.add_argument('--start', type=date.fromisoformat,
+                              help="First booking day, YYYY-MM-DD (default: half of --days before today)")
+        generate.add_argument('--seed', type=int, default=1)
+        generate.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Parallel loader processes")
+        generate.add_argument('--truncate', action='store_true', help="Replace existing data")
+
+    for command in ('snapshot', 'restore'):
+        sub = commands.add_parser(command, help=f"{command.capitalize()} a generated dataset")
+        sub.add_argument('store', choices=['postgres', 'mongo'])
+        sub.add_argument('--name', help="Snapshot database name (default: <database>_snapshot)")
+        sub.add_argument('--force', action='store_true',
+                         help="Postgres: disconnect other sessions (e.g. a running app) from the databases involved")
+
+    for sub in commands.choices.values():
+        sub.add_argument('--mongo-uri', default=MONGO_URI)
+        sub.add_argument('--mongo-db', default=MONGO_DB)
+    args = parser.parse_args()
+
+    if args.command in ('postgres', 'mongo'):
+        if args.tables <= 0 or args.customers <= 0 or args.days <= 0 or args.reservations <= 0:
+            parser.error("--reservations, --customers, --tables and --days must be positive")
+        (generate_postgres if args.command == 'postgres' else generate_mongo)(args)
+    else:
+        handlers = {
+            ('snapshot', 'postgres'): snapshot_postgres, ('restore', 'postgres'): restore_postgres,
+            ('snapshot', 'mongo'): snapshot_mongo, ('restore', 'mongo'): restore_mongo,
+        }
+        handlers[(args.command, args.store)](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Serialization benchmark for the reservation listing payloads.
+
+Encodes listings of reservation rows the way GET /api/v1/reservations does
+(psycopg2 RealDictRows carrying dates, times and timestamps) with every
+encoder of `src/json_encoding.py`, next to the stdlib path app.py used
+before it (str() on each temporal column, then json.dumps per row), and
+reports the best time and throughput per size:
+
+    python benchmarks/json_benchmark.py --rows 1000 10000 100000 --repeat 5
+    python benchmarks/json_benchmark.py --rows 100000 --output results/json.json
+
+No database is needed; the rows are synthetic but have the shape and value
+mix of real listing rows. orjson is skipped when it is not installed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from psycopg2.extras import RealDictRow
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'Case Study 1 - Postgres', 'src'))
+
+import json_encoding  # noqa: E402
+
+STATUSES = (('active', 0.6), ('completed', 0.3), ('cancelled', 0.1))
+COMMENTS = (None, None, None, 'Window seat please', 'Birthday', 'High chair needed')
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    first_day = date(2026, 1, 1)
+    created = datetime(2025, 12, 1, tzinfo=timezone.utc)
+    rows = []
+    for rid in range(1, count + 1):
+        row = RealDictRow()
+        row['rid'] = rid
+        row['tid'] = rng.randint(1, 200)
+        row['cid'] = rng.randint(1, 50000)
+        row['status'] = rng.choices([s for s, _ in STATUSES], [w for _, w in STATUSES])[0]
+        row['comment'] = rng.choice(COMMENTS)
+        row['number_of_people'] = rng.randint(1, 8)
+        row['reservation_date'] = first_day + timedelta(days=rid * 365 // count)
+        row['reservation_time'] = (datetime.min + timedelta(minutes=rng.randrange(11 * 60, 22 * 60, 30))).time()
+        row['duration_minutes'] = rng.choice((60, 90, 120, 150))
+        row['created_at'] = created + timedelta(seconds=rng.randint(0, 30 * 86400), microseconds=rng.randint(0, 999999))
+        row['updated_at'] = row['created_at']
+        rows.append(row)
+    return rows
+
+
+def legacy_dumps(rows):
+    # Before json_encoding: temporal columns turned into strings by hand, one json.dumps per row
+    encoded = []
+    for row in rows:
+        converted = dict(row)
+        for field in ('reservation_date', 'reservation_time', 'created_at', 'updated_at'):
+            if converted[field] is not None:
+                converted[field] = str(converted[field])
+        encoded.append(json.dumps(converted))
+    return ('{"reservations": [' + ','.join(encoded) + '], "next_cursor": null}').encode()
+
+
+def encoder_dumps(encoder):
+    return lambda rows: encoder.dumps({'reservations': rows, 'next_cursor': None})
+
+
+def candidates():
+    yield 'legacy (str + json.dumps)', legacy_dumps
+    for name in json_encoding.ENCODERS:
+        try:
+            yield name, encoder_dumps(json_encoding.get_encoder(name))
+        except ValueError as e:
+            print(f"Skipping {name}: {e}")
+
+
+def best_time(dumps, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload = dumps(rows)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON encoders on reservation listing payloads.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="Listing sizes to encode (default: 1000 10000 100000)")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per encoder and size; the best one counts")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    encoders = list(candidates())
+    for count in args.rows:
+        rows = make_rows(count, args.seed)
+        baseline = None
+        print(f"\n{count} rows")
+        print(f"  {'encoder':<28}{'best ms':>10}{'rows/s':>14}{'MB':>8}{'speedup':>9}")
+        for name, dumps in encoders:
+            seconds, size = best_time(dumps, rows, args.repeat)
+            baseline = baseline or seconds
+            print(f"  {name:<28}{seconds * 1000:>10.1f}{count / seconds:>14,.0f}{size / 1e6:>8.1f}"
+                  f"{baseline / seconds:>8.1f}x")
+            results.append({'rows': count, 'encoder': name, 'best_seconds': seconds, 'bytes': size})
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
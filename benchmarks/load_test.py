@@ -0,0 +1,345 @@
+"""
+Load test for the reservation API implementations.
+
+Drives one running implementation (app.py, app_with_orm.py, app_orm_async.py
+or app_mongo.py) with a weighted mix of the user stories from a pool of worker
+threads, then reports throughput and latency percentiles per endpoint and
+writes them as JSON for comparing runs:
+
+    python benchmarks/load_test.py --target postgres --concurrency 16 --duration 60 --output results/postgres.json
+    python benchmarks/load_test.py --compare results/baseline.json results/postgres.json
+
+Only loopback URLs are accepted, and for the Postgres targets the database
+configured in `Case Study 1 - Postgres/.env` must be local too.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import requests
+from dotenv import dotenv_values
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POSTGRES_ENV = os.path.join(REPO_ROOT, 'Case Study 1 - Postgres', '.env')
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+# Mostly occupancy reads, the rest bookings, modifications and cancellations
+DEFAULT_MIX = 'occupancy=70,create=15,modify=10,cancel=5'
+OPERATIONS = ('occupancy', 'create', 'modify', 'cancel')
+# Bookings land on a 30-minute grid between 11:00 and 22:00, this many days out,
+# so a run rarely collides with itself or with the rows the test suite creates
+BOOKING_DAYS = (400, 765)
+BOOKING_SLOTS = [f"{hour:02d}:{minute:02d}:00" for hour in range(11, 22) for minute in (0, 30)]
+# Distinct phone numbers per run, so some bookings come from returning customers
+REPEAT_CUSTOMERS = 5000
+
+
+class Target:
+    """Request shapes of one implementation."""
+
+    name = None
+    supported = OPERATIONS
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def create_table(self, session, table_number, capacity):
+        response = session.post(f'{self.base_url}/tables', json={'capacity': capacity, 'table_number': table_number})
+        if response.status_code != 201:
+            raise RuntimeError(f"Could not create table {table_number}: {response.status_code} {response.text}")
+        return self.table_ref(response.json(), table_number)
+
+    def table_ref(self, body, table_number):
+        return body['tid']
+
+    def reservation_payload(self, table, num_people, res_date, res_time, phone):
+        return {
+            'tid': table, 'number_of_people': num_people,
+            'reservation_date': res_date, 'reservation_time': res_time,
+            'last_name': 'LoadTest', 'first_name': 'Guest', 'phone': phone, 'comment': 'LoadTest reservation'
+        }
+
+    def reservation_ref(self, body):
+        return body['rid']
+
+
+class PostgresTarget(Target):
+    name = 'postgres'
+
+
+class OrmTarget(Target):
+    name = 'orm'
+
+
+class OrmAsyncTarget(Target):
+    name = 'orm-async'
+
+
+class MongoTarget(Target):
+    # app_mongo.py only implements user stories 1, 2 and 5
+    name = 'mongo'
+    supported = ('occupancy', 'create')
+
+    def table_ref(self, body, table_number):
+        return table_number
+
+    def reservation_payload(self, table, num_people, res_date, res_time, phone):
+        payload = super().reservation_payload(None, num_people, res_date, res_time, phone)
+        del payload['tid']
+        payload['tables'] = [{'table_number': table}]
+        return payload
+
+    def reservation_ref(self, body):
+        return body['reservation_id']
+
+
+TARGETS = {target.name: target for target in (PostgresTarget, OrmTarget, OrmAsyncTarget, MongoTarget)}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid weight for '{name}': '{weight}'")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one positive weight")
+    return mix
+
+
+def check_local(base_url, target):
+    host = urlparse(base_url).hostname
+    if host not in LOCAL_HOSTS:
+        raise SystemExit(f"Refusing to load-test '{host}': only local instances may be benchmarked")
+    if target in ('postgres', 'orm', 'orm-async'):
+        db_host = os.getenv('DB_HOST') or dotenv_values(POSTGRES_ENV).get('DB_HOST')
+        if db_host not in LOCAL_HOSTS:
+            raise SystemExit(f"Refusing to run: DB_HOST '{db_host}' in {POSTGRES_ENV} is not a local database")
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(ms for ms, _ in samples)
+    statuses = defaultdict(int)
+    for _, status in samples:
+        statuses[str(status)] += 1
+    errors = sum(count for status, count in statuses.items() if status == 'error' or int(status) >= 500)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'status_codes': dict(sorted(statuses.items())),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+        },
+    }
+
+
+class LoadTest:
+    def __init__(self, target, mix, concurrency, duration, tables, seed):
+        self.target = target
+        self.mix = {name: weight for name, weight in mix.items() if name in target.supported and weight > 0}
+        self.skipped = sorted(name for name, weight in mix.items() if name not in target.supported and weight > 0)
+        if not self.mix:
+            raise SystemExit(f"None of the requested operations are supported by the '{target.name}' target")
+        self.concurrency = concurrency
+        self.duration = duration
+        self.table_count = tables
+        self.seed = seed
+        self.run_id = uuid.uuid4().hex[:8]
+
+        self.tables = []
+        self.reservations = []            # references of bookings made by this run, for modify / cancel
+        self._reservations_lock = threading.Lock()
+        self.samples = defaultdict(list)  # operation -> [(latency_ms, status)]
+        self._samples_lock = threading.Lock()
+
+    def setup(self):
+        with requests.Session() as session:
+            for i in range(self.table_count):
+                table_number = f"LT-{self.run_id}-{i}"
+                self.tables.append(self.target.create_table(session, table_number, capacity=random.choice((2, 4, 6, 8))))
+
+    def _request(self, session, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=30, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 'error'
+        return response, (time.perf_counter() - started) * 1000, status
+
+    def _book(self, session, rng):
+        res_date = (date.today() + timedelta(days=rng.randint(*BOOKING_DAYS))).isoformat()
+        payload = self.target.reservation_payload(
+            rng.choice(self.tables), rng.randint(1, 6), res_date, rng.choice(BOOKING_SLOTS),
+            phone=f"LT{self.run_id}{rng.randrange(REPEAT_CUSTOMERS):05d}")
+        response, ms, status = self._request(session, 'POST', f'{self.target.base_url}/reservations', json=payload)
+        if status == 201:
+            with self._reservations_lock:
+                self.reservations.append(self.target.reservation_ref(response.json()))
+        return ms, status
+
+    def _pick_reservation(self, rng, remove):
+        with self._reservations_lock:
+            if not self.reservations:
+                return None
+            index = rng.randrange(len(self.reservations))
+            if remove:
+                self.reservations[index], self.reservations[-1] = self.reservations[-1], self.reservations[index]
+                return self.reservations.pop()
+            return self.reservations[index]
+
+    def run_operation(self, session, rng, operation):
+        base_url = self.target.base_url
+        if operation == 'occupancy':
+            _, ms, status = self._request(session, 'GET', f'{base_url}/occupancy_next_7_days')
+            return operation, ms, status
+        if operation == 'create':
+            return (operation,) + self._book(session, rng)
+
+        rid = self._pick_reservation(rng, remove=(operation == 'cancel'))
+        if rid is None:
+            # Nothing to modify or cancel yet
+            return ('create',) + self._book(session, rng)
+        if operation == 'modify':
+            _, ms, status = self._request(session, 'PUT', f'{base_url}/reservations/{rid}',
+                                          json={'number_of_people': rng.randint(1, 6), 'comment': 'LoadTest modified'})
+        else:
+            _, ms, status = self._request(session, 'DELETE', f'{base_url}/reservations/{rid}')
+        return operation, ms, status
+
+    def worker(self, index, deadline):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        operations, weights = zip(*self.mix.items())
+        local_samples = defaultdict(list)
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                operation, ms, status = self.run_operation(session, rng, rng.choices(operations, weights)[0])
+                local_samples[operation].append((round(ms, 3), status))
+        with self._samples_lock:
+            for operation, samples in local_samples.items():
+                self.samples[operation].extend(samples)
+
+    def run(self):
+        self.setup()
+        started = time.monotonic()
+        deadline = started + self.duration
+        threads = [threading.Thread(target=self.worker, args=(i, deadline)) for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        all_samples = [sample for samples in self.samples.values() for sample in samples]
+        return {
+            'target': self.target.name,
+            'base_url': self.target.base_url,
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'concurrency': self.concurrency,
+            'duration_seconds': round(elapsed, 3),
+            'mix': self.mix,
+            'skipped_operations': self.skipped,
+            'seed': self.seed,
+            'endpoints': {operation: summarize(samples, elapsed) for operation, samples in sorted(self.samples.items())},
+            'total': summarize(all_samples, elapsed),
+        }
+
+
+def print_report(result):
+    print(f"\n{result['target']}: {result['concurrency']} workers for {result['duration_seconds']}s")
+    if result['skipped_operations']:
+        print(f"  not supported, skipped: {', '.join(result['skipped_operations'])}")
+    print(f"  {'endpoint':<12} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in list(result['endpoints'].items()) + [('total', result['total'])]:
+        latency = stats['latency_ms']
+        print(f"  {name:<12} {stats['requests']:>9} {stats['errors']:>7} {stats['throughput_rps']:>9.1f} "
+              f"{latency['p50'] or 0:>9.2f} {latency['p95'] or 0:>9.2f} {latency['p99'] or 0:>9.2f}")
+
+
+def compare(baseline_path, candidate_path, tolerance):
+    """Print p95 / throughput changes per endpoint; returns 1 if any p95 regressed by more than `tolerance`."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    regressed = False
+    print(f"{'endpoint':<12} {'p95 before':>11} {'p95 after':>10} {'change':>8} {'req/s before':>13} {'req/s after':>12}")
+    for name in sorted(set(baseline['endpoints']) & set(candidate['endpoints'])) + ['total']:
+        before = baseline['total'] if name == 'total' else baseline['endpoints'][name]
+        after = candidate['total'] if name == 'total' else candidate['endpoints'][name]
+        p95_before, p95_after = before['latency_ms']['p95'], after['latency_ms']['p95']
+        change = (p95_after - p95_before) / p95_before if p95_before else 0.0
+        flag = ''
+        if change > tolerance:
+            regressed = True
+            flag = '  REGRESSION'
+        print(f"{name:<12} {p95_before:>11.2f} {p95_after:>10.2f} {change:>+8.1%} "
+              f"{before['throughput_rps']:>13.1f} {after['throughput_rps']:>12.1f}{flag}")
+    return 1 if regressed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a running reservation API implementation.")
+    parser.add_argument('--target', choices=sorted(TARGETS), default='postgres',
+                        help="Implementation being served: postgres (app.py), orm (app_with_orm.py), "
+                             "orm-async (app_orm_async.py) or mongo (app_mongo.py)")
+    parser.add_argument('--base-url', default='http://localhost:5000/api/v1')
+    parser.add_argument('--concurrency', type=int, default=8, help="Worker threads, each with its own HTTP session")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to run the mix")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--tables', type=int, default=50, help="Tables created for the run")
+    parser.add_argument('--seed', type=int, help="Seed for the per-worker random generators")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+                        help="Compare two result files instead of running a load test")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="With --compare: allowed p95 increase before exiting with status 1 (default: 0.10)")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, tolerance=args.tolerance))
+
+    check_local(args.base_url, args.target)
+    if args.seed is not None:
+        random.seed(args.seed)
+    result = LoadTest(TARGETS[args.target](args.base_url), args.mix, args.concurrency,
+                      args.duration, args.tables, args.seed).run()
+    print_report(result)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
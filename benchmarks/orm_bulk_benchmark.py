@@ -0,0 +1,177 @@
+"""
+Write path benchmark for the ORM edition.
+
+Loads the same synthetic reservations into Postgres twice through
+`Case Study 1 - Postgres/src/app_with_orm.py` and reports rows per second:
+
+  per-row  what POST /api/v1/reservations does for each booking: look up the
+           table and the customer, session.add + flush the customer if new,
+           session.add + flush the reservation, commit
+  bulk     import_reservations() behind POST /api/v1/reservations/import:
+           one customer upsert and one executemany INSERT per batch, no ORM objects
+
+    python benchmarks/orm_bulk_benchmark.py --rows 10000 100000
+    python benchmarks/orm_bulk_benchmark.py --rows 100000 --skip-per-row --batch-size 10000
+
+Bookings go to tables created for the run, 2000+ days out, and a share of them
+come from returning customers. Everything the run writes is deleted again.
+Only the local database configured in `Case Study 1 - Postgres/.env` is used.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+from dotenv import dotenv_values
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POSTGRES_DIR = os.path.join(REPO_ROOT, 'Case Study 1 - Postgres')
+POSTGRES_ENV = os.path.join(POSTGRES_DIR, '.env')
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+TABLES = 50
+# 90-minute bookings from 11:00, eight per table and day
+SLOTS = [f"{11 + minutes // 60:02d}:{minutes % 60:02d}:00" for minutes in range(0, 8 * 90, 90)]
+FIRST_DAY = date.today() + timedelta(days=2000)
+# Share of bookings made by a customer who booked before in the same run
+RETURNING_SHARE = 0.3
+
+sys.path.insert(0, os.path.join(POSTGRES_DIR, 'src'))
+# Request metrics would time every cursor call; they are not part of what is measured here
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+
+def check_local():
+    host = os.getenv('DB_HOST') or dotenv_values(POSTGRES_ENV).get('DB_HOST')
+    if host not in LOCAL_HOSTS:
+        raise SystemExit(f"Refusing to run: DB_HOST '{host}' is not a local database")
+
+
+def make_records(count, tids, prefix, seed):
+    rng = random.Random(seed)
+    phones = []
+    records = []
+    for index in range(count):
+        day, slot_index = divmod(index, len(tids) * len(SLOTS))
+        tid = tids[slot_index % len(tids)]
+        if phones and rng.random() < RETURNING_SHARE:
+            phone = rng.choice(phones)
+        else:
+            phone = f"{prefix}{len(phones)}"
+            phones.append(phone)
+        records.append({
+            'tid': tid, 'number_of_people': rng.randint(1, 4),
+            'reservation_date': (FIRST_DAY + timedelta(days=day)).isoformat(),
+            'reservation_time': SLOTS[slot_index // len(tids)], 'duration_minutes': 90,
+            'last_name': 'Bench', 'first_name': 'Bulk', 'phone': phone, 'comment': '',
+        })
+    return records
+
+
+def load_per_row(orm, records):
+    # The body of add_reservation, one request per booking
+    session = orm.Session()
+    try:
+        for record in records:
+            session.query(orm.Table).filter_by(tid=record['tid']).first()
+            customer = session.query(orm.Customer).filter_by(phone=record['phone']).first()
+            if not customer:
+                customer = orm.Customer(last_name=record['last_name'], first_name=record['first_name'],
+                                        phone=record['phone'])
+                session.add(customer)
+                session.flush()
+            reservation = orm.Reservation(
+                tid=record['tid'], cid=customer.cid, status='active', comment=record['comment'],
+                number_of_people=record['number_of_people'], reservation_date=record['reservation_date'],
+                reservation_time=record['reservation_time'], duration_minutes=record['duration_minutes'])
+            session.add(reservation)
+            session.flush()
+            session.commit()
+            # A request would end here with a fresh session
+            session.expunge_all()
+    finally:
+        orm.Session.remove()
+    return len(records)
+
+
+def load_bulk(orm, records, batch_size):
+    session = orm.Session()
+    try:
+        report = orm.import_reservations(session, enumerate(records, start=1), batch_size=batch_size)
+    finally:
+        orm.Session.remove()
+    if report['failed']:
+        raise SystemExit(f"Bulk import rejected rows: {report['errors'][:5]}")
+    return report['imported']
+
+
+def create_tables(orm, prefix):
+    session = orm.Session()
+    try:
+        tables = [orm.Table(table_number=f"{prefix}{index}", capacity=4) for index in range(TABLES)]
+        session.add_all(tables)
+        session.commit()
+        return [table.tid for table in tables]
+    finally:
+        orm.Session.remove()
+
+
+def clean_up(orm, prefix):
+    # Reservations go with their tables (ON DELETE CASCADE)
+    session = orm.Session()
+    try:
+        session.query(orm.Table).filter(orm.Table.table_number.like(prefix + '%')).delete(synchronize_session=False)
+        session.query(orm.Customer).filter(orm.Customer.phone.like(prefix + '%')).delete(synchronize_session=False)
+        session.commit()
+    finally:
+        orm.Session.remove()
+
+
+def run(orm, path, count, batch_size, seed):
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    try:
+        tids = create_tables(orm, prefix)
+        records = make_records(count, tids, prefix, seed)
+        started = time.perf_counter()
+        loaded = load_per_row(orm, records) if path == 'per-row' else load_bulk(orm, records, batch_size)
+        return loaded, time.perf_counter() - started
+    finally:
+        clean_up(orm, prefix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the ORM per-row and bulk reservation write paths.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                        help="Reservations to load per run (default: 10000 100000)")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk batch and commit (default: 5000)")
+    parser.add_argument('--skip-per-row', action='store_true', help="Only run the bulk path")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    check_local()
+    import app_with_orm as orm
+
+    paths = ['bulk'] if args.skip_per_row else ['per-row', 'bulk']
+    results = []
+    print(f"{'rows':>8}  {'path':<8}{'seconds':>10}{'rows/s':>12}{'speedup':>9}")
+    for count in args.rows:
+        baseline = None
+        for path in paths:
+            loaded, seconds = run(orm, path, count, args.batch_size, args.seed)
+            baseline = baseline or seconds
+            print(f"{count:>8}  {path:<8}{seconds:>10.2f}{loaded / seconds:>12,.0f}{baseline / seconds:>8.1f}x")
+            results.append({'rows': count, 'path': path, 'seconds': seconds, 'loaded': loaded})
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
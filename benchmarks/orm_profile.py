@@ -0,0 +1,168 @@
+"""
+ORM overhead profile: where the ORM edition's request time goes, next to app.py.
+
+Runs the same sequence of requests (book, read, list, modify, occupancy,
+cancel) against `Case Study 1 - Postgres/src/app.py` and `app_with_orm.py`
+in-process through Flask's test client, and reports per endpoint the mean
+request time of both apps and the ORM time split by
+`src/orm_profile.py` into SQL compilation, DB execution, result processing
+and everything else:
+
+    python benchmarks/orm_profile.py --iterations 500
+    python benchmarks/orm_profile.py --iterations 2000 --output results/orm_profile.json
+
+`execute` is the part both apps pay; app.py's DB column is its time inside
+psycopg2 calls from its /metrics. The endpoints are not always the same work:
+app.py cancels by marking the row cancelled and reads occupancy from the
+occupancy_daily rollup (or its cache). Bookings go to a table created for the
+run, 3000+ days out, and everything the run writes is deleted again. Only the
+local database configured in `Case Study 1 - Postgres/.env` is used.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+
+from dotenv import dotenv_values
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POSTGRES_DIR = os.path.join(REPO_ROOT, 'Case Study 1 - Postgres')
+POSTGRES_ENV = os.path.join(POSTGRES_DIR, '.env')
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+FIRST_DAY = date.today() + timedelta(days=3000)
+
+sys.path.insert(0, os.path.join(POSTGRES_DIR, 'src'))
+os.environ['ORM_PROFILE'] = 'true'
+# app.py's DB time comes from its request metrics
+os.environ['METRICS_ENABLED'] = 'true'
+
+SAMPLE = re.compile(r'^(\w+)_(sum|count)\{(.*)\} (\S+)$')
+
+
+def check_local():
+    host = os.getenv('DB_HOST') or dotenv_values(POSTGRES_ENV).get('DB_HOST')
+    if host not in LOCAL_HOSTS:
+        raise SystemExit(f"Refusing to run: DB_HOST '{host}' is not a local database")
+
+
+def call(client, method, url, **kwargs):
+    # Closing the response is what ends a request for app.py's metrics
+    with client.open(url, method=method, **kwargs) as response:
+        if response.status_code >= 300:
+            raise SystemExit(f"{method} {url} failed: {response.status_code} {response.get_data(as_text=True)}")
+        return response.get_json()
+
+
+def run_requests(client, tid, prefix, iterations, offset):
+    for index in range(offset, offset + iterations):
+        day = (FIRST_DAY + timedelta(days=index)).isoformat()
+        rid = call(client, 'POST', '/api/v1/reservations', json={
+            'tid': tid, 'number_of_people': 2, 'reservation_date': day, 'reservation_time': '18:00:00',
+            'duration_minutes': 90, 'last_name': 'Profile', 'first_name': 'Guest', 'phone': f'{prefix}{index}'})['rid']
+        call(client, 'GET', f'/api/v1/reservations/{rid}')
+        call(client, 'GET', f'/api/v1/reservations?from={day}&to={day}')
+        call(client, 'PUT', f'/api/v1/reservations/{rid}', json={'number_of_people': 3})
+        call(client, 'GET', '/api/v1/occupancy_next_7_days')
+        call(client, 'DELETE', f'/api/v1/reservations/{rid}')
+
+
+def request_totals(client):
+    # (method, route) -> [request seconds, requests, DB seconds] from app.py's Prometheus histograms
+    totals = defaultdict(lambda: [0.0, 0, 0.0])
+    with client.get('/metrics') as response:
+        text = response.get_data(as_text=True)
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if not match:
+            continue
+        name, kind, labels, value = match.groups()
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+        key = (labels.get('method'), labels.get('route'))
+        if name == 'reservations_http_request_duration_seconds':
+            totals[key][0 if kind == 'sum' else 1] += float(value)
+        elif name == 'reservations_http_request_db_duration_seconds' and kind == 'sum':
+            totals[key][2] += float(value)
+    return totals
+
+
+def profile_plain(module, prefix, iterations, warmup):
+    client = module.app.test_client()
+    tid = call(client, 'POST', '/api/v1/tables', json={'capacity': 4, 'table_number': f'{prefix}plain'})['tid']
+    run_requests(client, tid, f'{prefix}plain-', warmup, 0)
+    before = request_totals(client)
+    run_requests(client, tid, f'{prefix}plain-', iterations, warmup)
+    after = request_totals(client)
+    profile = {}
+    for key, (seconds, count, db_seconds) in after.items():
+        requests = count - before[key][1]
+        if requests > 0 and key[1] != '/metrics':
+            profile[key] = {'total_ms': (seconds - before[key][0]) * 1000 / requests,
+                            'db_ms': (db_seconds - before[key][2]) * 1000 / requests}
+    return profile
+
+
+def profile_orm(module, prefix, iterations, warmup):
+    client = module.app.test_client()
+    tid = call(client, 'POST', '/api/v1/tables', json={'capacity': 4, 'table_number': f'{prefix}orm'})['tid']
+    run_requests(client, tid, f'{prefix}orm-', warmup, 0)
+    call(client, 'DELETE', '/api/v1/profile')
+    run_requests(client, tid, f'{prefix}orm-', iterations, warmup)
+    return {(entry['method'], entry['route']): entry for entry in call(client, 'GET', '/api/v1/profile')['endpoints']
+            if entry['route'] != '/api/v1/profile'}
+
+
+def clean_up(orm, prefix):
+    # Reservations go with their tables (ON DELETE CASCADE)
+    session = orm.Session()
+    try:
+        session.query(orm.Table).filter(orm.Table.table_number.like(prefix + '%')).delete(synchronize_session=False)
+        session.query(orm.Customer).filter(orm.Customer.phone.like(prefix + '%')).delete(synchronize_session=False)
+        session.commit()
+    finally:
+        orm.Session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the ORM edition's request time against app.py.")
+    parser.add_argument('--iterations', type=int, default=500, help="Request sequences measured (default: 500)")
+    parser.add_argument('--warmup', type=int, default=20, help="Request sequences run before measuring (default: 20)")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    check_local()
+    import app as plain
+    import app_with_orm as orm
+
+    prefix = f"profile-{uuid.uuid4().hex[:8]}-"
+    try:
+        plain_profile = profile_plain(plain, prefix, args.iterations, args.warmup)
+        orm_profile = profile_orm(orm, prefix, args.iterations, args.warmup)
+    finally:
+        clean_up(orm, prefix)
+
+    results = []
+    print(f"{'endpoint':<40}{'app.py':>9}{'db':>8}{'orm':>9}{'compile':>9}{'execute':>9}{'result':>9}{'other':>9}"
+          f"{'stmts':>7}")
+    for key in sorted(orm_profile):
+        entry = orm_profile[key]
+        plain_entry = plain_profile.get(key, {'total_ms': None, 'db_ms': None})
+        results.append({**entry, 'app_py_total_ms': plain_entry['total_ms'], 'app_py_db_ms': plain_entry['db_ms']})
+        plain_columns = (f"{plain_entry['total_ms']:>9.2f}{plain_entry['db_ms']:>8.2f}"
+                         if plain_entry['total_ms'] is not None else f"{'-':>9}{'-':>8}")
+        print(f"{key[0] + ' ' + key[1]:<40}{plain_columns}{entry['total_ms']:>9.2f}{entry['compile_ms']:>9.2f}"
+              f"{entry['execute_ms']:>9.2f}{entry['result_ms']:>9.2f}{entry['other_ms']:>9.2f}"
+              f"{entry['statements_per_request']:>7}")
+    print("Mean milliseconds per request")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()